@@ -0,0 +1,53 @@
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    # 항목 수 제한(LRU)과 만료 시간(TTL)이 있는 프로세스 내 캐시.
+    # 이벤트 루프 안에서만 사용하므로 별도 잠금은 두지 않는다. 값은 읽기 전용으로 다룰 것.
+
+    def __init__(self, name, maxsize, ttl_seconds):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()  # key -> (expires_at, value)
+
+    def get(self, key, default=None):
+        item = self._items.get(key, _MISSING)
+        if item is _MISSING or item[0] <= time.monotonic():
+            if item is not _MISSING:
+                del self._items[key]
+            self.misses += 1
+            return default
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key, value):
+        self._items[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def invalidate(self, key):
+        self._items.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        for key in [key for key in self._items if predicate(key)]:
+            del self._items[key]
+
+    def clear(self):
+        self._items.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._items),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -1,8 +1,20 @@
+import asyncio
+import json
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
-import anthropic
 import logging
+import time
+from .llm_limiter import ProviderLimiter, ReleasingStream, estimate_request_tokens
+from .llm_providers import configured_provider_backends, create_backends
+from .llm_resilience import CircuitBreaker, error_reason, is_retryable, retry_delay
+from .metrics import (
+    LLM_CIRCUIT_STATE,
+    LLM_HEDGES,
+    LLM_IN_FLIGHT,
+    LLM_REQUEST_SECONDS,
+    LLM_REQUESTS,
+    LLM_RETRIES,
+)
 
 # 로깅 설정
 logging.basicConfig(
@@ -12,54 +24,436 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 DATABASE_URL = os.getenv("DATABASE_URL")
-CLAUDE_API_KEY = os.getenv("CLAUDE_API_KEY")  # Claude Sonnet API 키 추가
+# API 키(OPENAI_API_KEY, CLAUDE_API_KEY)는 해당 백엔드를 쓸 때만 필요 (llm_providers)
 
-if not OPENAI_API_KEY or not DATABASE_URL or not CLAUDE_API_KEY:
+if not DATABASE_URL:
     raise ValueError("환경변수 설정이 잘못되었습니다.")
 
-client = OpenAI(api_key=OPENAI_API_KEY)
-claude_client = anthropic.Anthropic(
-    api_key=CLAUDE_API_KEY
-)  # Claude Sonnet 클라이언트 추가
+# 호출 유형 -> 모델 설정 그룹 (대화는 좋은 모델, 요약/추출은 저렴한 모델)
+CALL_TYPE_MODEL_GROUPS = {
+    "dialogue": "dialogue",
+    "long_memory": "summary",
+    "scene_summary": "summary",
+    "summary_memory": "summary",
+    "important_memory": "extraction",
+}
+DEFAULT_LLM_MODELS = {
+    "dialogue": {"openai": "gpt-4-turbo", "claude": "claude-3-7-sonnet-20250219"},
+    "summary": {"openai": "gpt-3.5-turbo", "claude": "claude-3-5-haiku-20241022"},
+    "extraction": {"openai": "gpt-3.5-turbo", "claude": "claude-3-5-haiku-20241022"},
+}
+
+
+def _load_llm_models():
+    # LLM_MODELS='{"summary": {"openai": "gpt-4o-mini"}, "important_memory": {...}}'
+    # 그룹 또는 개별 호출 유형 단위로 provider별 모델을 덮어쓴다 (호출 유형 우선)
+    models = {group: dict(value) for group, value in DEFAULT_LLM_MODELS.items()}
+    for key, value in json.loads(os.getenv("LLM_MODELS", "{}")).items():
+        models.setdefault(key, {}).update(value)
+    return models
+
+
+LLM_MODELS = _load_llm_models()
+
+
+def resolve_model(provider, call_type="dialogue"):
+    group = CALL_TYPE_MODEL_GROUPS.get(call_type, "dialogue")
+    for key in (call_type, group):
+        model = LLM_MODELS.get(key, {}).get(provider)
+        if model:
+            return model
+    return LLM_MODELS["dialogue"].get(provider)
+
+
+# provider별 호출 타임아웃(초). LLM_TIMEOUTS='{"claude": 90}'로 덮어쓰기.
+# 스트리밍은 SDK의 요청 타임아웃이 청크 사이 대기에도 적용된다
+DEFAULT_LLM_TIMEOUTS = {"openai": 30.0, "claude": 60.0}
+LLM_TIMEOUTS = {
+    **DEFAULT_LLM_TIMEOUTS,
+    **json.loads(os.getenv("LLM_TIMEOUTS", "{}")),
+}
+# 429/5xx/타임아웃 재시도 (지수 백오프 + 지터)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+# 차단기: 최근 WINDOW초 동안 MIN_CALLS회 이상 호출 중 오류 비율이 ERROR_RATE 이상이면 OPEN초 동안 즉시 실패
+LLM_BREAKER_WINDOW_SECONDS = float(os.getenv("LLM_BREAKER_WINDOW_SECONDS", "30"))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "10"))
+LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+LLM_BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+# 대화 헤지: LLM_HEDGE_FALLBACKS='{"claude": "openai"}'면 claude가 LLM_HEDGE_DELAY_MS 안에
+# 응답하지 않거나 실패할 때 같은 대화를 openai로도 보내 먼저 온 응답을 쓴다 (기본 비활성)
+LLM_HEDGE_FALLBACKS = json.loads(os.getenv("LLM_HEDGE_FALLBACKS", "{}"))
+LLM_HEDGE_DELAY_MS = float(os.getenv("LLM_HEDGE_DELAY_MS", "2000"))
+
+# provider/model별 호출 제한. LLM_RATE_LIMITS='{"openai": {"requests_per_minute": 500,
+# "tokens_per_minute": 150000}, "gpt-4-turbo": {"max_concurrency": 10}}' 처럼 provider 또는
+# model 단위로 지정 (model 우선, 빠진 값은 기본값). 분당 한도 0은 제한 없음
+DEFAULT_LLM_RATE_LIMIT = {
+    "max_concurrency": 32,
+    "requests_per_minute": 0,
+    "tokens_per_minute": 0,
+}
+LLM_RATE_LIMITS = json.loads(os.getenv("LLM_RATE_LIMITS", "{}"))
+# 한도를 넘는 호출이 기다릴 대기열 크기와 최대 대기 시간. 넘으면 LLMOverloadedError (라우트에서 429)
+LLM_QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", "100"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10"))
+
+
+# 세계관별 공정 분배: 한도를 넘어 기다리는 호출은 세계관별 가중치에 비례해 차례가 돌아간다.
+# LLM_UNIVERSE_LIMITS='{"<universeId>": {"weight": 2, "max_concurrency": 8}}'로 세계관별 지정,
+# 나머지는 기본값 (max_concurrency: provider/model 한도 하나에서 한 세계관이 동시에 쓸 수 있는 호출 수, 0은 제한 없음)
+LLM_UNIVERSE_WEIGHT = float(os.getenv("LLM_UNIVERSE_WEIGHT", "1"))
+LLM_UNIVERSE_MAX_CONCURRENCY = int(os.getenv("LLM_UNIVERSE_MAX_CONCURRENCY", "0"))
+LLM_UNIVERSE_LIMITS = json.loads(os.getenv("LLM_UNIVERSE_LIMITS", "{}"))
+# 호출 유형별 대기열 우선순위 (작을수록 먼저). 대화가 세션 정리/요약보다 먼저 나간다
+CALL_TYPE_PRIORITIES = {"dialogue": 0}
+BACKGROUND_PRIORITY = 1
+
+
+def universe_limit(universe_id):
+    limit = LLM_UNIVERSE_LIMITS.get(universe_id, {})
+    return (
+        float(limit.get("weight", LLM_UNIVERSE_WEIGHT)),
+        int(limit.get("max_concurrency", LLM_UNIVERSE_MAX_CONCURRENCY)),
+    )
+
+
+def rate_limit_for(provider, model):
+    return {
+        **DEFAULT_LLM_RATE_LIMIT,
+        **LLM_RATE_LIMITS.get(provider, {}),
+        **LLM_RATE_LIMITS.get(model, {}),
+    }
+
+
+_CIRCUIT_STATE_VALUES = {
+    CircuitBreaker.CLOSED: 0,
+    CircuitBreaker.HALF_OPEN: 1,
+    CircuitBreaker.OPEN: 2,
+}
 
 
 class AIClientDelegate:
-    def __init__(self, openai_client, claude_client):
-        self.openai_client = openai_client
-        self.claude_client = claude_client
+    def __init__(self, backends):
+        # provider("openai" | "claude") -> 백엔드 플러그인 (llm_providers)
+        self.backends = backends
+        # provider별 누적 토큰 사용량 (프롬프트 캐시 적중 확인용)
+        self.usage_stats = {}
+        # 호출별 사용량을 저장할 원장 (services/usage_service에서 등록)
+        self.usage_ledger = None
+        self.breakers = {}
+        for provider in backends:
+            breaker = CircuitBreaker(
+                LLM_BREAKER_WINDOW_SECONDS,
+                LLM_BREAKER_MIN_CALLS,
+                LLM_BREAKER_ERROR_RATE,
+                LLM_BREAKER_OPEN_SECONDS,
+            )
+            self.breakers[provider] = breaker
+            LLM_CIRCUIT_STATE.labels(provider).set_function(
+                lambda breaker=breaker: _CIRCUIT_STATE_VALUES[breaker.state]
+            )
+        # (provider, model) -> ProviderLimiter (처음 호출할 때 생성)
+        self.limiters = {}
 
-    def generate_response(self, provider, **kwargs):
-        try:
-            if provider == "openai":
-                return self.openai_client.chat.completions.create(
-                    **kwargs,
-                    model="gpt-4-turbo",
+    @staticmethod
+    def extract_usage(provider, usage):
+        # provider별 usage 객체를 같은 형식으로 변환. input_tokens는 캐시된 토큰을 포함한 전체 입력
+        if usage is None:
+            return None
+        if provider == "claude":
+            cached = getattr(usage, "cache_read_input_tokens", None) or 0
+            created = getattr(usage, "cache_creation_input_tokens", None) or 0
+            return {
+                "input_tokens": (usage.input_tokens or 0) + cached + created,
+                "cached_input_tokens": cached,
+                "cache_creation_input_tokens": created,
+                "output_tokens": usage.output_tokens or 0,
+            }
+        details = getattr(usage, "prompt_tokens_details", None)
+        return {
+            "input_tokens": usage.prompt_tokens or 0,
+            "cached_input_tokens": (details and details.cached_tokens) or 0,
+            "cache_creation_input_tokens": 0,
+            "output_tokens": usage.completion_tokens or 0,
+        }
+
+    def record_usage(
+        self,
+        provider,
+        usage,
+        model=None,
+        call_type="default",
+        continuation_round=1,
+        usage_scope=None,
+    ):
+        if not usage:
+            return
+        if self.usage_ledger is not None:
+            self.usage_ledger.record(
+                provider,
+                model or self.model_for(provider, {}, call_type),
+                call_type,
+                continuation_round,
+                usage,
+                usage_scope,
+            )
+        stats = self.usage_stats.setdefault(
+            provider,
+            {
+                "calls": 0,
+                "input_tokens": 0,
+                "cached_input_tokens": 0,
+                "cache_creation_input_tokens": 0,
+                "output_tokens": 0,
+            },
+        )
+        stats["calls"] += 1
+        for key, value in usage.items():
+            stats[key] += value
+        logger.info(
+            f"토큰 사용량 - 제공자: {provider}, 입력: {usage['input_tokens']} "
+            f"(캐시 {usage['cached_input_tokens']}), 출력: {usage['output_tokens']}"
+        )
+
+    @staticmethod
+    def build_openai_params(kwargs, model):
+        # 호출자가 model을 지정하면 그대로 사용
+        return {**kwargs, "model": model}
+
+    @staticmethod
+    def build_claude_params(kwargs, model):
+        # 새로운 Claude API 사용 방식으로 업데이트
+        # system 파라미터가 있는지 확인
+        system = kwargs.pop("system", None)
+        messages = kwargs.pop("messages", [])
+
+        # Claude API 패러미터 구성
+        claude_params = {
+            "messages": messages,
+            **kwargs,
+            "model": model,
+        }
+
+        # system이 있으면 추가
+        if system:
+            claude_params["system"] = system
+
+        return claude_params
+
+    @staticmethod
+    def model_for(provider, kwargs, call_type="dialogue"):
+        # 호출자가 지정한 model이 우선, 없으면 호출 유형별 설정 (LLM_MODELS)
+        return kwargs.get("model") or resolve_model(provider, call_type)
+
+    @staticmethod
+    def response_text(provider, response):
+        # provider 형식과 관계없이 응답 텍스트만 꺼낸다 (비스트리밍 응답)
+        if provider == "claude":
+            return "".join(
+                block.text for block in response.content if block.type == "text"
+            )
+        return response.choices[0].message.content or ""
+
+    def hedge_fallback(self, provider):
+        # 대화 헤지에 쓸 대체 provider (설정되지 않았거나 백엔드가 없으면 None)
+        fallback = LLM_HEDGE_FALLBACKS.get(provider)
+        if fallback == provider or fallback not in self.backends:
+            return None
+        return fallback
+
+    def limiter_for(self, provider, model):
+        limiter = self.limiters.get((provider, model))
+        if limiter is None:
+            limit = rate_limit_for(provider, model)
+            limiter = ProviderLimiter(
+                provider,
+                model,
+                int(limit["max_concurrency"]),
+                int(limit["requests_per_minute"]),
+                int(limit["tokens_per_minute"]),
+                LLM_QUEUE_MAX,
+                LLM_QUEUE_TIMEOUT_SECONDS,
+                universe_limit,
+            )
+            self.limiters[(provider, model)] = limiter
+        return limiter
+
+    def check_admission(self, provider, call_type="dialogue"):
+        # 턴/작업을 시작하기 전에 호출: 해당 호출 유형의 대기열이 가득 찼으면 LLMOverloadedError
+        if provider in self.backends:
+            self.limiter_for(provider, resolve_model(provider, call_type)).check()
+
+    async def _create_with_retries(self, provider, params, call_type):
+        backend = self.backends[provider]
+        breaker = self.breakers[provider]
+        timeout = float(LLM_TIMEOUTS.get(provider, 60.0))
+        # SDK에도 같은 타임아웃을 넘겨 스트림 읽기까지 제한
+        params = {**params, "timeout": timeout}
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            # 차단기가 열려 있으면 CircuitOpenError로 즉시 실패 (재시도 중 열린 경우 포함)
+            breaker.before_call()
+            try:
+                response = await asyncio.wait_for(
+                    backend.create(provider, params, call_type), timeout
+                )
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    breaker.release()
+                    raise
+                breaker.record_failure()
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                delay = retry_delay(
+                    attempt, e, LLM_RETRY_BASE_SECONDS, LLM_RETRY_MAX_SECONDS
                 )
-            elif provider == "claude":
-                # 새로운 Claude API 사용 방식으로 업데이트
-                # system 파라미터가 있는지 확인
-                system = kwargs.pop("system", None)
-                messages = kwargs.pop("messages", [])
-
-                # Claude API 패러미터 구성
-                claude_params = {
-                    "model": "claude-3-7-sonnet-20250219",
-                    "messages": messages,
-                    **kwargs,
-                }
-
-                # system이 있으면 추가
-                if system:
-                    claude_params["system"] = system
-
-                return self.claude_client.messages.create(**claude_params)
-            else:
-                raise ValueError("지원되지 않는 AI 제공자입니다.")
+                LLM_RETRIES.labels(provider, error_reason(e)).inc()
+                logger.warning(
+                    f"API 호출 재시도 {attempt + 1}/{LLM_MAX_RETRIES} - 제공자: {provider}, "
+                    f"오류: {str(e) or type(e).__name__}, {delay:.2f}초 후"
+                )
+                await asyncio.sleep(delay)
+                continue
+            breaker.record_success()
+            return response
+
+    async def generate_response(
+        self,
+        provider,
+        call_type="default",
+        continuation_round=1,
+        usage_scope=None,
+        **kwargs,
+    ):
+        # call_type / continuation_round / usage_scope는 지표/사용량 원장용 (API로 전달하지 않음)
+        model = self.model_for(provider, kwargs, call_type)
+        if provider not in self.backends:
+            raise ValueError("지원되지 않는 AI 제공자입니다.")
+        if provider == "claude":
+            params = self.build_claude_params(dict(kwargs), model)
+        else:
+            params = self.build_openai_params(kwargs, model)
+        stream = bool(kwargs.get("stream"))
+
+        # provider/model별 한도 대기 (대기열이 가득 찼거나 오래 기다리면 LLMOverloadedError).
+        # 기다리는 동안에는 우선순위와 세계관별 공정 분배 순서로 차례가 온다
+        universe_id = (usage_scope or {}).get("universe_id")
+        limiter = self.limiter_for(provider, model)
+        ticket = await limiter.acquire(
+            estimate_request_tokens(params),
+            str(universe_id) if universe_id else None,
+            CALL_TYPE_PRIORITIES.get(call_type, BACKGROUND_PRIORITY),
+        )
+
+        # 헤지에서 진 호출처럼 취소되면 cancelled로 남는다
+        status = "cancelled"
+        usage = None
+        started = time.perf_counter()
+        LLM_IN_FLIGHT.labels(provider).inc()
+        try:
+            response = await self._create_with_retries(provider, params, call_type)
+            status = "ok"
+            if not stream:
+                usage = self.extract_usage(provider, getattr(response, "usage", None))
         except Exception as e:
-            logger.error(f"API 호출 오류 발생 - 제공자: {provider}, 오류: {str(e)}")
+            status = error_reason(e)
+            logger.error(
+                f"API 호출 오류 발생 - 제공자: {provider}, 오류: {str(e) or type(e).__name__}"
+            )
             raise  # 원본 예외를 다시 발생시켜 상위 코드에서 처리할 수 있도록 함
+        finally:
+            LLM_IN_FLIGHT.labels(provider).dec()
+            LLM_REQUEST_SECONDS.labels(
+                provider, model, call_type, str(continuation_round)
+            ).observe(time.perf_counter() - started)
+            LLM_REQUESTS.labels(provider, model, call_type, status).inc()
+            if status != "ok" or not stream:
+                limiter.release(
+                    ticket,
+                    usage and usage["input_tokens"] + usage["output_tokens"],
+                    time.perf_counter() - started,
+                )
+
+        # 스트리밍 응답은 다 읽을 때까지 한도 자리를 차지하고, 사용량은 스트림을 소비하는 쪽에서 기록
+        if stream:
+            return ReleasingStream(
+                response,
+                lambda: limiter.release(ticket, None, time.perf_counter() - started),
+            )
+        self.record_usage(
+            provider, usage, model, call_type, continuation_round, usage_scope
+        )
+        return response
+
+    async def generate_hedged(self, primary, fallback, hedge_delay=None, **kwargs):
+        # primary/fallback: (provider, 해당 provider 형식의 요청 파라미터).
+        # primary가 hedge_delay초 안에 응답하지 않거나 실패하면 fallback도 보내고 먼저 성공한 쪽을 쓴다.
+        # 반환값: (응답한 provider, 응답). 진 쪽 호출은 취소한다 (취소된 호출의 사용량은 기록되지 않음)
+        if hedge_delay is None:
+            hedge_delay = LLM_HEDGE_DELAY_MS / 1000
+        tasks = {}
+
+        def launch(provider, params):
+            task = asyncio.create_task(
+                self.generate_response(provider=provider, **params, **kwargs)
+            )
+            tasks[task] = provider
+            return task
+
+        primary_task = launch(*primary)
+        winner = None
+        try:
+            done, _ = await asyncio.wait({primary_task}, timeout=hedge_delay)
+            if done and primary_task.exception() is None:
+                winner = primary_task
+                return primary[0], primary_task.result()
+
+            trigger = "failed" if done else "slow"
+            logger.warning(
+                f"대화 헤지 - {primary[0]} 응답 {'실패' if done else '지연'}, "
+                f"{fallback[0]}로도 요청"
+            )
+            launch(*fallback)
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if winner is None and task.exception() is None:
+                        winner = task
+                    elif task.exception() is not None:
+                        error = task.exception()
+                if winner is not None:
+                    LLM_HEDGES.labels(
+                        primary[0], fallback[0], trigger, tasks[winner]
+                    ).inc()
+                    return tasks[winner], winner.result()
+            LLM_HEDGES.labels(primary[0], fallback[0], trigger, "none").inc()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif task is not winner:
+                    await self._discard(task)
+
+    @staticmethod
+    async def _discard(task):
+        # 동시에 끝났지만 쓰지 않는 응답: 스트림이면 닫아서 한도 자리를 반납
+        if task.cancelled() or task.exception() is not None:
+            return
+        response = task.result()
+        if isinstance(response, ReleasingStream):
+            await response.aclose()
 
 
-ai_client_delegate = AIClientDelegate(client, claude_client)
+PROVIDER_BACKENDS = configured_provider_backends()
+logger.info(f"LLM 백엔드: {PROVIDER_BACKENDS}")
+ai_client_delegate = AIClientDelegate(create_backends(PROVIDER_BACKENDS))
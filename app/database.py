@@ -1,13 +1,77 @@
-import psycopg2
-from psycopg2 import pool
+import json
+import os
+from contextlib import asynccontextmanager
+import time
+import asyncpg
 from .config import DATABASE_URL
+from .metrics import DB_POOL_ACQUIRE_SECONDS, DB_POOL_SIZE, DB_POOL_IDLE, DB_POOL_MAX
 
-db_pool = psycopg2.pool.ThreadedConnectionPool(minconn=1, maxconn=10, dsn=DATABASE_URL)
+# 커넥션 풀 설정 (환경변수로 조정)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
+# prepared statement 캐시 크기 (pgbouncer transaction 모드에서는 0으로 설정)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
 
+db_pool = None
 
-def get_connection():
-    return db_pool.getconn()
+# 풀 상태는 /metrics 수집 시점에 읽는다
+DB_POOL_SIZE.set_function(lambda: db_pool.get_size() if db_pool else 0)
+DB_POOL_IDLE.set_function(lambda: db_pool.get_idle_size() if db_pool else 0)
+DB_POOL_MAX.set_function(lambda: db_pool.get_max_size() if db_pool else 0)
 
 
-def release_connection(conn):
-    db_pool.putconn(conn)
+def _encode_json(value):
+    # 이미 직렬화된 문자열은 그대로 전달
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+async def _init_connection(conn):
+    # json/jsonb 컬럼과 json_agg 결과를 파이썬 객체로 변환 (psycopg2와 동일한 동작)
+    for type_name in ("json", "jsonb"):
+        await conn.set_type_codec(
+            type_name, encoder=_encode_json, decoder=json.loads, schema="pg_catalog"
+        )
+
+
+async def init_pool():
+    global db_pool
+    if db_pool is None:
+        db_pool = await asyncpg.create_pool(
+            dsn=DATABASE_URL,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            server_settings={"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)},
+            init=_init_connection,
+        )
+    return db_pool
+
+
+async def close_pool():
+    global db_pool
+    if db_pool is not None:
+        await db_pool.close()
+        db_pool = None
+
+
+def get_pool():
+    if db_pool is None:
+        raise RuntimeError("DB 커넥션 풀이 초기화되지 않았습니다.")
+    return db_pool
+
+
+@asynccontextmanager
+async def acquire(conn=None):
+    # 이미 커넥션이 있으면 그대로 사용하고, 없으면 풀에서 빌려온다
+    if conn is not None:
+        yield conn
+    else:
+        pool = get_pool()
+        started = time.perf_counter()
+        pooled_conn = await pool.acquire()
+        DB_POOL_ACQUIRE_SECONDS.observe(time.perf_counter() - started)
+        try:
+            yield pooled_conn
+        finally:
+            await pool.release(pooled_conn)
@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+from types import SimpleNamespace
+
+# 부하 테스트/오프라인 실행용 가짜 LLM 백엔드 (LLM_BACKEND=fake).
+# 같은 입력에는 항상 같은 응답을 주며, 지연 시간과 출력 속도는 환경변수로 조정한다
+# (LLM_FAKE_LATENCY_MS, LLM_FAKE_TOKENS_PER_SECOND, LLM_FAKE_OUTPUT_TOKENS, LLM_FAKE_RESPONSES_FILE,
+#  LLM_FAKE_ERROR_RATE).
+
+# 응답 문장을 만들 단어 목록 (단어 하나를 출력 토큰 하나로 센다)
+_WORDS = (
+    "그래",
+    "오늘은",
+    "바람이",
+    "차갑네",
+    "여행자여",
+    "이",
+    "마을에",
+    "무슨",
+    "일로",
+    "왔지",
+    "조심해",
+    "숲이",
+    "조용하다",
+    "기억하고",
+    "있어",
+)
+
+
+def load_fake_responses(path):
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as f:
+        responses = json.load(f)
+    # 값이 문자열 하나면 목록으로 통일
+    return {
+        call_type: [value] if isinstance(value, str) else list(value)
+        for call_type, value in responses.items()
+    }
+
+
+def _prompt_text(params):
+    # system + messages 전체를 문자열로 (응답 시드와 입력 토큰 수 계산용)
+    return json.dumps(
+        [params.get("system"), params.get("messages")], ensure_ascii=False, default=str
+    )
+
+
+def _last_user_message(params):
+    for message in reversed(params.get("messages") or []):
+        if message.get("role") == "user":
+            content = message.get("content")
+            if isinstance(content, list):
+                return " ".join(block.get("text", "") for block in content)
+            return content or ""
+    return ""
+
+
+def _estimate_input_tokens(text):
+    # 실제 토크나이저 대신 대략적인 추정치 (약 3자당 1토큰)
+    return max(1, len(text) // 3)
+
+
+class FakeServerError(Exception):
+    # SDK의 5xx 오류처럼 status_code를 가진 오류 (재시도/차단기 확인용)
+    status_code = 503
+    response = None
+
+
+class FakeCompletion:
+    def __init__(self, params, call_type, templates, output_tokens):
+        prompt = _prompt_text(params)
+        seed = int.from_bytes(hashlib.sha256(prompt.encode()).digest()[:8], "big")
+        rng = random.Random(seed)
+        if templates:
+            text = rng.choice(templates).format(
+                call_type=call_type,
+                model=params.get("model"),
+                player_input=_last_user_message(params),
+            )
+            words = text.split(" ")
+        else:
+            words = [rng.choice(_WORDS) for _ in range(output_tokens)]
+
+        max_tokens = params.get("max_tokens") or len(words)
+        self.words = words[:max_tokens]
+        self.truncated = len(words) > max_tokens
+        self.output_tokens = len(self.words)
+        self.input_tokens = _estimate_input_tokens(prompt)
+
+    @property
+    def text(self):
+        return " ".join(self.words)
+
+    def deltas(self):
+        return [word if i == 0 else f" {word}" for i, word in enumerate(self.words)]
+
+
+class FakeBackend:
+    # openai/claude 두 형식 모두 SDK 응답과 같은 모양으로 돌려준다
+    providers = ("openai", "claude")
+
+    def __init__(self):
+        self.latency = float(os.getenv("LLM_FAKE_LATENCY_MS", "300")) / 1000
+        self.tokens_per_second = float(os.getenv("LLM_FAKE_TOKENS_PER_SECOND", "50"))
+        self.output_tokens = int(os.getenv("LLM_FAKE_OUTPUT_TOKENS", "60"))
+        # 호출 유형별 고정 응답 ({"important_memory": "false", "dialogue": ["...", "..."]}).
+        # 응답에는 {call_type}, {model}, {player_input}(마지막 사용자 메시지)을 쓸 수 있다
+        self.responses = load_fake_responses(os.getenv("LLM_FAKE_RESPONSES_FILE"))
+        # 지연 후 503으로 실패할 확률 (0 ~ 1)
+        self.error_rate = float(os.getenv("LLM_FAKE_ERROR_RATE", "0"))
+
+    async def wait_tokens(self, count):
+        if self.tokens_per_second > 0:
+            await asyncio.sleep(count / self.tokens_per_second)
+
+    async def create(self, provider, params, call_type):
+        completion = FakeCompletion(
+            params, call_type, self.responses.get(call_type), self.output_tokens
+        )
+        # 첫 토큰까지의 지연
+        await asyncio.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            raise FakeServerError("가짜 LLM 서버 오류 (LLM_FAKE_ERROR_RATE)")
+        if provider == "openai":
+            return await self._openai_response(completion, params)
+        return await self._claude_response(completion, params)
+
+    async def _openai_response(self, completion, params):
+        finish_reason = "length" if completion.truncated else "stop"
+        usage = SimpleNamespace(
+            prompt_tokens=completion.input_tokens,
+            completion_tokens=completion.output_tokens,
+            prompt_tokens_details=None,
+        )
+        if params.get("stream"):
+            include_usage = (params.get("stream_options") or {}).get("include_usage")
+            return self._openai_stream(
+                completion, finish_reason, usage if include_usage else None
+            )
+
+        await self.wait_tokens(completion.output_tokens)
+        message = SimpleNamespace(content=completion.text)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=message, finish_reason=finish_reason)],
+            usage=usage,
+        )
+
+    async def _openai_stream(self, completion, finish_reason, usage):
+        for delta in completion.deltas():
+            await self.wait_tokens(1)
+            yield SimpleNamespace(
+                choices=[
+                    SimpleNamespace(
+                        delta=SimpleNamespace(content=delta), finish_reason=None
+                    )
+                ],
+                usage=None,
+            )
+        yield SimpleNamespace(
+            choices=[
+                SimpleNamespace(
+                    delta=SimpleNamespace(content=None), finish_reason=finish_reason
+                )
+            ],
+            usage=None,
+        )
+        if usage:
+            yield SimpleNamespace(choices=[], usage=usage)
+
+    async def _claude_response(self, completion, params):
+        stop_reason = "max_tokens" if completion.truncated else "end_turn"
+        if params.get("stream"):
+            return self._claude_stream(completion, stop_reason)
+
+        await self.wait_tokens(completion.output_tokens)
+        return SimpleNamespace(
+            content=[SimpleNamespace(type="text", text=completion.text)],
+            stop_reason=stop_reason,
+            usage=self._claude_usage(completion.input_tokens, completion.output_tokens),
+        )
+
+    @staticmethod
+    def _claude_usage(input_tokens, output_tokens):
+        return SimpleNamespace(
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            cache_read_input_tokens=0,
+            cache_creation_input_tokens=0,
+        )
+
+    async def _claude_stream(self, completion, stop_reason):
+        yield SimpleNamespace(
+            type="message_start",
+            message=SimpleNamespace(
+                usage=self._claude_usage(completion.input_tokens, 1)
+            ),
+        )
+        for delta in completion.deltas():
+            await self.wait_tokens(1)
+            yield SimpleNamespace(
+                type="content_block_delta",
+                delta=SimpleNamespace(type="text_delta", text=delta),
+            )
+        yield SimpleNamespace(
+            type="message_delta",
+            delta=SimpleNamespace(stop_reason=stop_reason),
+            usage=SimpleNamespace(output_tokens=completion.output_tokens),
+        )
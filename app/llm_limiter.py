@@ -0,0 +1,287 @@
+import asyncio
+import json
+import math
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from .metrics import LLM_QUEUE_DEPTH, LLM_QUEUE_REJECTED, LLM_QUEUE_WAIT_SECONDS
+
+# provider/model별 호출 제한: 동시 호출 수 + 분당 요청/토큰 버킷.
+# 한도를 넘는 호출은 크기가 제한된 대기열에서 기다리고, 대기열이 가득 차면 바로 거절한다
+
+
+class LLMOverloadedError(RuntimeError):
+    # retry_after: 다시 시도하기까지 권장 대기 시간(초, Retry-After 헤더용)
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def estimate_request_tokens(params):
+    # 버킷 차감용 추정치: 입력(한글 1자≈1토큰, 영문 약 4자≈1토큰 사이를 보수적으로 2자당 1토큰) + 최대 출력.
+    # 비스트리밍 호출은 끝난 뒤 실제 사용량으로 보정한다
+    prompt = json.dumps(
+        [params.get("system"), params.get("messages")], ensure_ascii=False, default=str
+    )
+    return len(prompt) // 2 + (params.get("max_tokens") or 0)
+
+
+class TokenBucket:
+    # 1분에 걸쳐 per_minute만큼 고르게 채워지는 버킷 (0이면 제한 없음)
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        # amount만큼 꺼내려면 기다려야 하는 시간(초)
+        if not self.capacity:
+            return 0.0
+        self._refill()
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def take(self, amount):
+        if self.capacity:
+            self.tokens -= amount
+
+    def refund(self, amount):
+        # 추정치와 실제 사용량의 차이 보정 (음수면 추가 차감)
+        if self.capacity:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+@dataclass
+class _Ticket:
+    # 대기 중이거나 자리를 얻은 호출 하나. release에 그대로 넘긴다
+    tokens: int
+    universe_id: str
+    priority: int
+    # 가중 공정 큐의 가상 시작/완료 시각
+    start: float = 0.0
+    finish: float = 0.0
+    future: asyncio.Future = None
+    queued_at: float = 0.0
+
+
+class ProviderLimiter:
+    # 대기열은 우선순위(작을수록 먼저) → 세계관별 가중 공정 큐(WFQ) 순서로 자리를 준다.
+    # 세계관마다 가상 완료 시각(finish)을 쌓아, 많이 쓴 세계관은 뒤로 밀리고 가중치가 클수록 자주 차례가 온다.
+    # universe_limit(universe_id) -> (가중치, 최대 동시 호출 수 또는 0)
+
+    def __init__(
+        self,
+        provider,
+        model,
+        max_concurrency,
+        requests_per_minute,
+        tokens_per_minute,
+        max_queue,
+        max_wait_seconds,
+        universe_limit=None,
+    ):
+        self.provider = provider
+        self.model = model
+        self.max_concurrency = max(1, max_concurrency)
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.universe_limit = universe_limit or (lambda universe_id: (1.0, 0))
+        self.in_flight = 0
+        self.universe_in_flight = {}
+        # (우선순위, 세계관) -> 대기 중인 ticket (같은 세계관·우선순위 안에서는 먼저 온 순서)
+        self._queues = defaultdict(deque)
+        self._queued = 0
+        # 세계관별 마지막 가상 완료 시각과 현재 가상 시각
+        self._last_finish = {}
+        self._vtime = 0.0
+        self._timer = None
+        # 최근 호출 시간의 지수 이동 평균 (Retry-After 추정용)
+        self._avg_seconds = 1.0
+        LLM_QUEUE_DEPTH.labels(provider, model).set_function(lambda: self._queued)
+
+    def _cost(self, tokens):
+        # 버킷 용량보다 큰 요청도 언젠가는 시작할 수 있도록 용량으로 자른다
+        return min(tokens, self.tokens.capacity) if self.tokens.capacity else tokens
+
+    def _universe_full(self, universe_id):
+        cap = self.universe_limit(universe_id)[1]
+        return bool(cap) and self.universe_in_flight.get(universe_id, 0) >= cap
+
+    def _wait_time(self, ticket):
+        # 지금 시작하려면 기다려야 하는 시간. 동시 호출 수가 찼으면 None (release 때 다시 확인)
+        if self.in_flight >= self.max_concurrency:
+            return None
+        return max(self.requests.wait_time(1), self.tokens.wait_time(ticket.tokens))
+
+    def _start(self, ticket):
+        self.in_flight += 1
+        self.universe_in_flight[ticket.universe_id] = (
+            self.universe_in_flight.get(ticket.universe_id, 0) + 1
+        )
+        self.requests.take(1)
+        self.tokens.take(ticket.tokens)
+
+    def retry_after(self):
+        # 지금 대기열이 빠지는 데 걸릴 대략적인 시간
+        queued = self._queued + 1
+        queued_tokens = sum(
+            ticket.tokens for queue in self._queues.values() for ticket in queue
+        )
+        seconds = max(
+            self._avg_seconds * queued / self.max_concurrency,
+            self.requests.wait_time(queued),
+            self.tokens.wait_time(queued_tokens),
+        )
+        return max(1, math.ceil(seconds))
+
+    def _reject(self, reason, message):
+        LLM_QUEUE_REJECTED.labels(self.provider, self.model, reason).inc()
+        raise LLMOverloadedError(
+            f"{message} ({self.provider}/{self.model})", self.retry_after()
+        )
+
+    def check(self):
+        # 턴을 시작하기 전에 호출: 대기열이 가득 찼으면 작업 도중이 아니라 지금 거절
+        if self._queued >= self.max_queue:
+            self._reject("queue_full", "LLM 호출 대기열이 가득 찼습니다")
+
+    async def acquire(self, tokens, universe_id=None, priority=0):
+        # 자리를 얻으면 ticket을 반환 (release에 그대로 넘긴다)
+        ticket = _Ticket(self._cost(tokens), universe_id, priority)
+        if (
+            not self._queued
+            and not self._universe_full(universe_id)
+            and self._wait_time(ticket) == 0
+        ):
+            self._start(ticket)
+            return ticket
+
+        self.check()
+        weight = self.universe_limit(universe_id)[0] or 1.0
+        ticket.start = max(self._vtime, self._last_finish.get(universe_id, 0.0))
+        ticket.finish = ticket.start + ticket.tokens / weight
+        self._last_finish[universe_id] = ticket.finish
+        ticket.future = asyncio.get_running_loop().create_future()
+        ticket.queued_at = time.perf_counter()
+        self._queues[(priority, universe_id)].append(ticket)
+        self._queued += 1
+        self._dispatch()
+        try:
+            await asyncio.wait({ticket.future}, timeout=self.max_wait_seconds)
+        except asyncio.CancelledError:
+            self._abandon(ticket)
+            raise
+        finally:
+            LLM_QUEUE_WAIT_SECONDS.labels(
+                self.provider, self.model, str(priority)
+            ).observe(time.perf_counter() - ticket.queued_at)
+        if not ticket.future.done():
+            self._abandon(ticket)
+            self._reject("wait_timeout", "LLM 호출 대기 시간 초과")
+        return ticket
+
+    def release(self, ticket, used_tokens=None, seconds=None):
+        self.in_flight -= 1
+        self.universe_in_flight[ticket.universe_id] -= 1
+        if not self.universe_in_flight[ticket.universe_id]:
+            del self.universe_in_flight[ticket.universe_id]
+        if used_tokens is not None:
+            self.tokens.refund(ticket.tokens - used_tokens)
+        if seconds is not None:
+            self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * seconds
+        self._dispatch()
+
+    def _abandon(self, ticket):
+        if ticket.future.done():
+            # 자리를 받은 직후 취소된 경우 그대로 반납
+            self.release(ticket)
+            return
+        key = (ticket.priority, ticket.universe_id)
+        self._queues[key].remove(ticket)
+        self._queued -= 1
+        if not self._queues[key]:
+            del self._queues[key]
+        ticket.future.cancel()
+        self._dispatch()
+
+    def _next_ticket(self):
+        # 동시 호출 상한에 걸리지 않은 세계관 중 (우선순위, 가상 완료 시각)이 가장 앞선 것
+        best = None
+        for (priority, universe_id), queue in self._queues.items():
+            if self._universe_full(universe_id):
+                continue
+            ticket = queue[0]
+            if best is None or (priority, ticket.finish) < (best.priority, best.finish):
+                best = ticket
+        return best
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def _dispatch(self):
+        # 시작할 수 있는 만큼 자리를 준다. 버킷이 부족하면 채워질 시각에 다시 확인
+        while self._queued:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+            wait = self._wait_time(ticket)
+            if wait is None:
+                return
+            if wait > 0:
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(
+                        wait, self._on_timer
+                    )
+                return
+            key = (ticket.priority, ticket.universe_id)
+            self._queues[key].popleft()
+            self._queued -= 1
+            if not self._queues[key]:
+                del self._queues[key]
+            self._vtime = max(self._vtime, ticket.start)
+            self._start(ticket)
+            ticket.future.set_result(None)
+        # 대기열이 비면 가상 시각 기록을 정리 (세계관 수만큼 쌓이지 않도록)
+        self._last_finish.clear()
+        self._vtime = 0.0
+
+
+class ReleasingStream:
+    # 스트리밍 응답: 스트림을 끝까지 읽거나 닫을 때 제한 슬롯을 반납 (스트리밍 중에도 동시 호출 수에 포함)
+
+    def __init__(self, stream, release):
+        self.stream = stream
+        self._release = release
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        try:
+            async for event in self.stream:
+                yield event
+        finally:
+            self._done()
+
+    def _done(self):
+        if self._release is not None:
+            self._release()
+            self._release = None
+
+    async def aclose(self):
+        # 읽지 않고 버리는 스트림 (헤지에서 진 쪽 등)
+        self._done()
+        close = getattr(self.stream, "close", None) or getattr(
+            self.stream, "aclose", None
+        )
+        if close is not None:
+            await close()
@@ -0,0 +1,78 @@
+import json
+import os
+from openai import AsyncOpenAI
+import anthropic
+from .fake_llm import FakeBackend
+
+# LLM 백엔드 플러그인 등록부.
+# provider("openai" | "claude")는 요청/응답 형식이고, 백엔드는 그 형식의 요청을 실제로 처리하는 구현이다.
+# 예: LLM_BACKEND=fake면 두 provider 모두 가짜 백엔드가 처리 (API 키 불필요)
+# 재시도는 AIClientDelegate가 직접 하므로 SDK 자체 재시도는 끈다 (max_retries=0)
+
+
+class OpenAIBackend:
+    providers = ("openai",)
+
+    def __init__(self):
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY가 설정되지 않았습니다.")
+        self.client = AsyncOpenAI(api_key=api_key, max_retries=0)
+
+    async def create(self, provider, params, call_type):
+        return await self.client.chat.completions.create(**params)
+
+
+class AnthropicBackend:
+    providers = ("claude",)
+
+    def __init__(self):
+        api_key = os.getenv("CLAUDE_API_KEY")  # Claude Sonnet API 키
+        if not api_key:
+            raise ValueError("CLAUDE_API_KEY가 설정되지 않았습니다.")
+        self.client = anthropic.AsyncAnthropic(api_key=api_key, max_retries=0)
+
+    async def create(self, provider, params, call_type):
+        return await self.client.messages.create(**params)
+
+
+_backend_classes = {}
+
+
+def register_backend(name, backend_class):
+    # backend_class: providers 속성과 create(provider, params, call_type) 코루틴을 가진 클래스
+    _backend_classes[name] = backend_class
+
+
+register_backend("openai", OpenAIBackend)
+register_backend("anthropic", AnthropicBackend)
+register_backend("fake", FakeBackend)
+
+# provider별 기본 백엔드. LLM_PROVIDER_BACKENDS(JSON)로 provider 단위 덮어쓰기,
+# LLM_BACKEND를 지정하면 모든 provider에 같은 백엔드 사용
+DEFAULT_PROVIDER_BACKENDS = {"openai": "openai", "claude": "anthropic"}
+
+
+def configured_provider_backends():
+    backends = {
+        **DEFAULT_PROVIDER_BACKENDS,
+        **json.loads(os.getenv("LLM_PROVIDER_BACKENDS", "{}")),
+    }
+    if os.getenv("LLM_BACKEND"):
+        backends = {provider: os.getenv("LLM_BACKEND") for provider in backends}
+    return backends
+
+
+def create_backends(provider_backends):
+    # 같은 백엔드를 쓰는 provider끼리는 인스턴스(클라이언트)를 공유
+    instances = {}
+    backends = {}
+    for provider, name in provider_backends.items():
+        if name not in _backend_classes:
+            raise ValueError(f"등록되지 않은 LLM 백엔드: {name}")
+        if name not in instances:
+            instances[name] = _backend_classes[name]()
+        if provider not in instances[name].providers:
+            raise ValueError(f"{name} 백엔드는 {provider} 형식을 지원하지 않습니다.")
+        backends[provider] = instances[name]
+    return backends
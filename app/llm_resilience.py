@@ -0,0 +1,115 @@
+import asyncio
+import random
+import time
+from collections import deque
+import anthropic
+import openai
+
+# LLM 호출 재시도/차단기 정책 (AIClientDelegate에서 사용)
+
+_CONNECTION_ERRORS = (
+    asyncio.TimeoutError,
+    openai.APIConnectionError,  # APITimeoutError 포함
+    anthropic.APIConnectionError,
+)
+
+
+class CircuitOpenError(RuntimeError):
+    # 차단기가 열려 호출하지 않고 바로 실패
+    pass
+
+
+def is_retryable(error):
+    # 타임아웃/연결 오류, 429, 5xx만 재시도 (요청 자체가 잘못된 4xx는 재시도해도 같은 결과)
+    if isinstance(error, _CONNECTION_ERRORS):
+        return True
+    status = getattr(error, "status_code", None)
+    return status == 429 or (status is not None and status >= 500)
+
+
+def error_reason(error):
+    # 지표 라벨용 오류 분류
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, _CONNECTION_ERRORS):
+        return "timeout" if "Timeout" in type(error).__name__ else "connection"
+    status = getattr(error, "status_code", None)
+    if status == 429:
+        return "rate_limited"
+    if status is not None and status >= 500:
+        return "server_error"
+    return "error"
+
+
+def retry_delay(attempt, error, base_seconds, max_seconds):
+    # 지수 백오프 + 전체 지터. 429 응답에 Retry-After가 있으면 그만큼 (상한 이내) 기다린다
+    response = getattr(error, "response", None)
+    retry_after = response is not None and response.headers.get("retry-after")
+    if retry_after:
+        try:
+            return min(float(retry_after), max_seconds)
+        except ValueError:
+            pass
+    return random.uniform(0, min(max_seconds, base_seconds * 2**attempt))
+
+
+class CircuitBreaker:
+    # 최근 window_seconds 동안 재시도 대상 오류 비율이 error_rate를 넘으면 open_seconds 동안 차단.
+    # 차단 시간이 지나면 한 번만 시험 호출(half-open)을 보내 성공하면 다시 연다.
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window_seconds, min_calls, error_rate, open_seconds):
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self._results = deque()  # (시각, 성공 여부)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def before_call(self):
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                raise CircuitOpenError("LLM 제공자 차단 중 (오류율 초과)")
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                raise CircuitOpenError("LLM 제공자 차단 중 (시험 호출 진행 중)")
+            self._probe_in_flight = True
+
+    def record_success(self):
+        if self.state == self.HALF_OPEN:
+            self.state = self.CLOSED
+            self._probe_in_flight = False
+            self._results.clear()
+        self._add(True)
+
+    def record_failure(self):
+        if self.state == self.HALF_OPEN:
+            self._open()
+            return
+        self._add(False)
+        failures = sum(1 for _, ok in self._results if not ok)
+        if (
+            len(self._results) >= self.min_calls
+            and failures / len(self._results) >= self.error_rate
+        ):
+            self._open()
+
+    def release(self):
+        # 시험 호출이 성공/실패 판단 없이 끝난 경우 (잘못된 요청, 취소 등)
+        self._probe_in_flight = False
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self._results.clear()
+
+    def _add(self, ok):
+        now = time.monotonic()
+        self._results.append((now, ok))
+        while self._results and self._results[0][0] < now - self.window_seconds:
+            self._results.popleft()
@@ -1,8 +1,39 @@
-from fastapi import FastAPI
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from .routes import npc_routes, event_routes, universe_routes
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from .database import init_pool, close_pool
+from .metrics import HTTP_REQUEST_SECONDS
+from .prompts import prompt_registry
+from .services.job_service import job_worker
+from .services.cache_service import cache_listener
+from .services.usage_service import usage_ledger
+from .services.token_service import preload_encodings
+from .routes import npc_routes, event_routes, universe_routes, admin_routes
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 프롬프트 템플릿을 시작 시 한 번 로드/검증 (오류가 있으면 기동 실패)
+    prompt_registry.load_all()
+    await init_pool()
+    job_worker.start()
+    cache_listener.start()
+    usage_ledger.start()
+    # tiktoken 인코딩은 기동을 막지 않도록 백그라운드에서 로드 (그 전까지는 토큰 수 추정치 사용)
+    encodings_task = asyncio.create_task(preload_encodings())
+    yield
+    encodings_task.cancel()
+    # 남은 사용량 기록은 풀을 닫기 전에 저장
+    await usage_ledger.stop()
+    await cache_listener.stop()
+    await job_worker.stop()
+    await close_pool()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,6 +51,29 @@ app.add_middleware(
 #     allow_headers=["Authorization", "Content-Type"],
 # )
 
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # 경로 파라미터 대신 라우트 템플릿으로 집계 (예: /npc/{session_id}/dialogue)
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.labels(
+            request.method, route.path if route else "unmatched", str(status)
+        ).observe(time.perf_counter() - started)
+
+
+@app.get("/metrics")
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 app.include_router(npc_routes.router)
 app.include_router(event_routes.router)
 app.include_router(universe_routes.router)
+app.include_router(admin_routes.router)
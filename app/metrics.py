@@ -0,0 +1,103 @@
+import functools
+from prometheus_client import Counter, Gauge, Histogram
+
+# LLM 호출은 수 초 단위까지 걸리므로 기본 버킷보다 넓게 잡는다
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60)
+# 풀 대기는 평소 1ms 미만이므로 작은 구간을 촘촘하게 둔다 (벤치마크의 p95/p99 추정용)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5)
+# LLM 호출 제한 대기열 대기 시간 (대부분 0에 가깝고, 몰릴 때는 초 단위)
+QUEUE_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP 요청 처리 시간",
+    ["method", "route", "status"],
+    buckets=LLM_BUCKETS,
+)
+
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds",
+    "저장소 함수별 DB 쿼리 시간",
+    ["query"],
+)
+DB_POOL_ACQUIRE_SECONDS = Histogram(
+    "db_pool_acquire_duration_seconds",
+    "커넥션 풀에서 커넥션을 얻기까지 기다린 시간",
+    buckets=POOL_WAIT_BUCKETS,
+)
+DB_POOL_SIZE = Gauge("db_pool_size", "커넥션 풀의 현재 커넥션 수")
+DB_POOL_IDLE = Gauge("db_pool_idle", "커넥션 풀의 유휴 커넥션 수")
+DB_POOL_MAX = Gauge("db_pool_max_size", "커넥션 풀 최대 크기")
+
+PROMPT_BUILD_SECONDS = Histogram(
+    "prompt_build_duration_seconds",
+    "프롬프트 템플릿 적용 및 메시지 구성 시간",
+    ["kind"],
+)
+
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_duration_seconds",
+    "LLM API 호출 시간 (스트리밍은 스트림이 열릴 때까지)",
+    ["provider", "model", "call_type", "round"],
+    buckets=LLM_BUCKETS,
+)
+LLM_REQUESTS = Counter(
+    "llm_requests_total",
+    "LLM API 호출 수",
+    ["provider", "model", "call_type", "status"],
+)
+LLM_IN_FLIGHT = Gauge(
+    "llm_requests_in_flight",
+    "진행 중인 LLM API 호출 수",
+    ["provider"],
+)
+LLM_RETRIES = Counter(
+    "llm_retries_total",
+    "재시도한 LLM API 호출 수 (429/5xx/타임아웃)",
+    ["provider", "reason"],
+)
+LLM_CIRCUIT_STATE = Gauge(
+    "llm_circuit_state",
+    "provider별 차단기 상태 (0: 정상, 1: 시험 호출, 2: 차단)",
+    ["provider"],
+)
+LLM_QUEUE_DEPTH = Gauge(
+    "llm_queue_depth",
+    "provider/model별 호출 제한 대기열에서 기다리는 호출 수",
+    ["provider", "model"],
+)
+LLM_QUEUE_WAIT_SECONDS = Histogram(
+    "llm_queue_wait_seconds",
+    "호출 제한 대기열에서 기다린 시간 (priority 0: 대화, 1: 세션 정리/요약)",
+    ["provider", "model", "priority"],
+    buckets=QUEUE_WAIT_BUCKETS,
+)
+LLM_QUEUE_REJECTED = Counter(
+    "llm_queue_rejected_total",
+    "호출 제한으로 거절된 LLM 호출 수 (queue_full | wait_timeout)",
+    ["provider", "model", "reason"],
+)
+LLM_HEDGES = Counter(
+    "llm_hedged_requests_total",
+    "대체 provider로도 보낸 대화 요청 수 (trigger: slow | failed, winner: 먼저 응답한 provider)",
+    ["primary", "fallback", "trigger", "winner"],
+)
+
+END_SESSION_STAGE_SECONDS = Histogram(
+    "end_session_stage_duration_seconds",
+    "세션 종료/기억 정리 단계별 시간",
+    ["stage"],
+    buckets=LLM_BUCKETS,
+)
+
+
+def timed_query(func):
+    # 저장소(repository) 함수 단위로 DB 쿼리 시간을 기록
+    histogram = DB_QUERY_SECONDS.labels(func.__name__)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with histogram.time():
+            return await func(*args, **kwargs)
+
+    return wrapper
@@ -6,6 +6,15 @@ class DialogueRequest(BaseModel):
     player_input: str
 
 
+class BatchDialogueItem(BaseModel):
+    session_id: UUID4
+    player_input: str
+
+
+class BatchDialogueRequest(BaseModel):
+    items: list[BatchDialogueItem]
+
+
 class SessionRequest(BaseModel):
     universe_id: UUID4
     npc_id: UUID4
@@ -1,46 +1,206 @@
+import logging
+import os
+import string
+import threading
+
+logger = logging.getLogger(__name__)
+
 is_v2 = True
 
+# prompt_*.txt 파일 위치 (CWD와 무관하게 프로젝트 루트 기준)
+PROMPT_DIR = os.getenv(
+    "PROMPT_DIR", os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+
+# 템플릿별로 format() 호출 시 전달되는 키
+_CHARACTER_FIELDS = {
+    "npc_name",
+    "npc_bio",
+    "npc_race",
+    "npc_gender",
+    "npc_species",
+    "summary_memory",
+    "important_memories",
+}
+# 시스템 프롬프트는 세션 동안 바뀌지 않아야 프롬프트 캐시가 적중하므로
+# 턴마다 바뀌는 값(player_input 등)은 허용하지 않는다
+_DIALOGUE_FIELDS = {
+    "universe_name",
+    "universe_description",
+    "universe_lore",
+    "universe_rules",
+    "dialogue_examples",
+    "event_goal",
+    "goal_trigger",
+}
+
+
+class PromptTemplateError(ValueError):
+    pass
+
+
+def _placeholders(text):
+    return {
+        field_name.split(".")[0].split("[")[0]
+        for _, field_name, _, _ in string.Formatter().parse(text)
+        if field_name is not None
+    }
+
+
+class PromptRegistry:
+    # 템플릿을 한 번 읽어 메모리에 보관하고, 파일 mtime이 바뀐 경우에만 다시 읽는다
+
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        self._specs = {}
+        self._templates = {}  # name -> (mtime_ns, text)
+        self._lock = threading.Lock()
+
+    def register(self, name, filename, fields, required=()):
+        self._specs[name] = (filename, set(fields), set(required))
+
+    def load_all(self):
+        errors = []
+        for name in self._specs:
+            try:
+                self._load(name)
+            except PromptTemplateError as e:
+                errors.append(str(e))
+        if errors:
+            raise PromptTemplateError("\n".join(errors))
+
+    def get(self, name):
+        cached = self._templates.get(name)
+        try:
+            mtime = os.stat(self._path(name)).st_mtime_ns
+        except OSError:
+            if cached:
+                logger.warning(f"프롬프트 파일을 찾을 수 없어 캐시 사용: {name}")
+                return cached[1]
+            raise PromptTemplateError(f"프롬프트 파일 없음: {self._path(name)}")
+
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        with self._lock:
+            try:
+                return self._load(name)
+            except PromptTemplateError as e:
+                # 잘못 수정된 파일은 무시하고 이전 버전을 계속 사용
+                if cached:
+                    logger.error(f"프롬프트 재로드 실패, 이전 버전 사용: {e}")
+                    return cached[1]
+                raise
+
+    def _path(self, name):
+        return os.path.join(self.base_dir, self._specs[name][0])
+
+    def _load(self, name):
+        filename, fields, required = self._specs[name]
+        path = self._path(name)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            with open(path, "r", encoding="utf-8") as file:
+                text = file.read()
+        except OSError as e:
+            raise PromptTemplateError(f"프롬프트 로드 실패 ({filename}): {e}")
+
+        try:
+            placeholders = _placeholders(text)
+        except ValueError as e:
+            raise PromptTemplateError(f"프롬프트 형식 오류 ({filename}): {e}")
+
+        unknown = placeholders - fields
+        if unknown:
+            raise PromptTemplateError(
+                f"프롬프트에 정의되지 않은 플레이스홀더 ({filename}): {sorted(unknown)}"
+            )
+        missing = required - placeholders
+        if missing:
+            raise PromptTemplateError(
+                f"프롬프트에 필수 플레이스홀더 누락 ({filename}): {sorted(missing)}"
+            )
+
+        self._templates[name] = (mtime, text)
+        logger.info(f"프롬프트 로드: {filename}")
+        return text
+
+
+prompt_registry = PromptRegistry(PROMPT_DIR)
+prompt_registry.register(
+    "template",
+    f"prompt_template{is_v2 and '_v2' or ''}.txt",
+    _DIALOGUE_FIELDS | {"npc_prompt"},
+    required={"npc_prompt"},
+)
+prompt_registry.register(
+    "multi_character_template",
+    f"prompt_multi_character_template{is_v2 and '_v2' or ''}.txt",
+    _DIALOGUE_FIELDS | {"npc_profiles"},
+    required={"npc_profiles"},
+)
+prompt_registry.register(
+    "multi_character_template_json",
+    "prompt_multi_character_template_v3.txt",
+    _DIALOGUE_FIELDS | {"npc_profiles"},
+    required={"npc_profiles"},
+)
+prompt_registry.register(
+    "character", "prompt_character.txt", _CHARACTER_FIELDS, required={"npc_name"}
+)
+prompt_registry.register(
+    "long_memory_summary",
+    "prompt_long_memory_summary.txt",
+    {"conversation_history"},
+    required={"conversation_history"},
+)
+prompt_registry.register(
+    "relationship_summary",
+    "prompt_relationship_summary.txt",
+    {"long_memories"},
+    required={"long_memories"},
+)
+prompt_registry.register(
+    "important_memory_extract",
+    "prompt_important_memory_extract.txt",
+    {"conversation_history"},
+    required={"conversation_history"},
+)
+prompt_registry.register(
+    "scene_summary",
+    "prompt_scene_summary.txt",
+    {"scene_summary", "conversation_history"},
+    required={"scene_summary", "conversation_history"},
+)
+
 
 def load_prompt_template():
-    with open(
-        f"prompt_template{is_v2 and '_v2' or ''}.txt", "r", encoding="utf-8"
-    ) as file:
-        return file.read()
+    return prompt_registry.get("template")
 
 
 def load_multi_character_prompt_template():
-    with open(
-        f"prompt_multi_character_template{is_v2 and '_v2' or ''}.txt",
-        "r",
-        encoding="utf-8",
-    ) as file:
-        return file.read()
+    return prompt_registry.get("multi_character_template")
 
 
 def load_multi_character_prompt_template_json():
-    with open(
-        f"prompt_multi_character_template_v3.txt",
-        "r",
-        encoding="utf-8",
-    ) as file:
-        return file.read()
+    return prompt_registry.get("multi_character_template_json")
 
 
 def load_character_prompt():
-    with open("prompt_character.txt", "r", encoding="utf-8") as file:
-        return file.read()
+    return prompt_registry.get("character")
 
 
 def load_long_memory_summary_prompt():
-    with open("prompt_long_memory_summary.txt", "r", encoding="utf-8") as file:
-        return file.read()
+    return prompt_registry.get("long_memory_summary")
 
 
 def load_relationship_summary_prompt():
-    with open("prompt_relationship_summary.txt", "r", encoding="utf-8") as file:
-        return file.read()
+    return prompt_registry.get("relationship_summary")
 
 
 def load_important_memory_extract_prompt():
-    with open("prompt_important_memory_extract.txt", "r", encoding="utf-8") as file:
-        return file.read()
+    return prompt_registry.get("important_memory_extract")
+
+
+def load_scene_summary_prompt():
+    return prompt_registry.get("scene_summary")
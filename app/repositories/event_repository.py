@@ -0,0 +1,113 @@
+from ..database import acquire
+from ..metrics import timed_query
+
+# 이벤트 정의(Event + EventTrigger + EventEffect + EventStep)를 한 번의 쿼리로 조회.
+# $2가 true면 자주 바뀌는 PlayerEventState도 함께 조회한다
+EVENT_AGGREGATE_QUERY = """
+    SELECT
+        json_build_object(
+            'id', e.id,
+            'universeId', e."universeId",
+            'name', e.name,
+            'type', e.type,
+            'scope', e.scope,
+            'isRepeatable', e."isRepeatable",
+            'isActive', e."isActive",
+            'goalDescription', e."goalDescription",
+            'goalTrigger', e."goalTrigger",
+            'createdAt', e."createdAt"
+        ) AS event,
+        COALESCE(
+            (
+                SELECT json_agg(
+                    json_build_object(
+                        'id', t.id,
+                        'eventId', t."eventId",
+                        'type', t.type,
+                        'config', t.config,
+                        'createdAt', t."createdAt"
+                    )
+                )
+                FROM "EventTrigger" t
+                WHERE t."eventId" = e.id
+            ),
+            '[]'::json
+        ) AS triggers,
+        COALESCE(
+            (
+                SELECT json_agg(
+                    json_build_object(
+                        'id', f.id,
+                        'eventId', f."eventId",
+                        'type', f.type,
+                        'config', f.config,
+                        'order', f."order",
+                        'createdAt', f."createdAt"
+                    )
+                    ORDER BY f."order"
+                )
+                FROM "EventEffect" f
+                WHERE f."eventId" = e.id
+            ),
+            '[]'::json
+        ) AS effects,
+        COALESCE(
+            (
+                SELECT json_agg(
+                    json_build_object(
+                        'id', es.id,
+                        'eventId', es."eventId",
+                        'order', es."order",
+                        'message', es.message,
+                        'speakerType', es."speakerType",
+                        'speakerId', es."speakerId"
+                    )
+                    ORDER BY es."order"
+                )
+                FROM "EventStep" es
+                WHERE es."eventId" = e.id
+            ),
+            '[]'::json
+        ) AS steps,
+        CASE WHEN $2 THEN COALESCE(
+            (
+                SELECT json_agg(
+                    json_build_object(
+                        'id', ps.id,
+                        'eventId', ps."eventId",
+                        'playerId', ps."playerId",
+                        'status', ps.status,
+                        'updatedAt', ps."updatedAt"
+                    )
+                )
+                FROM "PlayerEventState" ps
+                WHERE ps."eventId" = e.id
+            ),
+            '[]'::json
+        ) END AS "playerStates"
+    FROM "Event" e
+    WHERE e.id = $1
+"""
+
+
+@timed_query
+async def fetch_event_aggregate(event_id, include_player_states=True, conn=None):
+    async with acquire(conn) as conn:
+        row = await conn.fetchrow(
+            EVENT_AGGREGATE_QUERY, event_id, include_player_states
+        )
+        return dict(row) if row else None
+
+
+@timed_query
+async def fetch_player_event_states(event_id, conn=None):
+    async with acquire(conn) as conn:
+        rows = await conn.fetch(
+            """
+            SELECT id, "eventId", "playerId", status, "updatedAt"
+            FROM "PlayerEventState"
+            WHERE "eventId" = $1
+            """,
+            event_id,
+        )
+        return [dict(row) for row in rows]
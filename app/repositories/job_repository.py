@@ -0,0 +1,131 @@
+import uuid
+from ..database import acquire
+from ..metrics import timed_query
+
+
+@timed_query
+async def insert_job(job_type, session_id, payload, max_attempts, conn=None):
+    async with acquire(conn) as conn:
+        job_id = str(uuid.uuid4())
+        await conn.execute(
+            """
+            INSERT INTO "BackgroundJob" (id, type, "sessionId", payload, "maxAttempts")
+            VALUES ($1, $2, $3, $4, $5)
+            """,
+            job_id,
+            job_type,
+            session_id,
+            payload,
+            max_attempts,
+        )
+        return job_id
+
+
+@timed_query
+async def insert_job_if_absent(job_type, session_id, payload, max_attempts, conn=None):
+    # 같은 세션에 대기/실행 중인 같은 타입 작업이 있으면 추가하지 않고 None
+    async with acquire(conn) as conn:
+        return await conn.fetchval(
+            """
+            INSERT INTO "BackgroundJob" (id, type, "sessionId", payload, "maxAttempts")
+            SELECT $1, $2, $3, $4, $5
+            WHERE NOT EXISTS (
+                SELECT 1 FROM "BackgroundJob"
+                WHERE type = $2 AND "sessionId" = $3 AND status IN ('queued', 'running')
+            )
+            RETURNING id
+            """,
+            str(uuid.uuid4()),
+            job_type,
+            session_id,
+            payload,
+            max_attempts,
+        )
+
+
+@timed_query
+async def claim_job(lock_timeout_seconds, conn=None):
+    # 실행 가능한 작업 하나를 선점. 오래 running 상태로 남은 작업(워커 중단)도 다시 가져온다
+    async with acquire(conn) as conn:
+        row = await conn.fetchrow(
+            """
+            UPDATE "BackgroundJob"
+            SET status = 'running', attempts = attempts + 1,
+                "lockedAt" = NOW(), "updatedAt" = NOW()
+            WHERE id = (
+                SELECT id FROM "BackgroundJob"
+                WHERE (status = 'queued' AND "runAfter" <= NOW())
+                OR (
+                    status = 'running'
+                    AND "lockedAt" < NOW() - make_interval(secs => $1)
+                )
+                ORDER BY "runAfter"
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id, type, "sessionId", payload, attempts, "maxAttempts"
+            """,
+            lock_timeout_seconds,
+        )
+        return dict(row) if row else None
+
+
+@timed_query
+async def complete_job(job_id, conn=None):
+    async with acquire(conn) as conn:
+        await conn.execute(
+            """
+            UPDATE "BackgroundJob"
+            SET status = 'done', "lastError" = NULL, "lockedAt" = NULL, "updatedAt" = NOW()
+            WHERE id = $1
+            """,
+            job_id,
+        )
+
+
+@timed_query
+async def reschedule_job(job_id, error, delay_seconds, conn=None):
+    async with acquire(conn) as conn:
+        await conn.execute(
+            """
+            UPDATE "BackgroundJob"
+            SET status = 'queued', "lastError" = $2, "lockedAt" = NULL,
+                "runAfter" = NOW() + make_interval(secs => $3), "updatedAt" = NOW()
+            WHERE id = $1
+            """,
+            job_id,
+            error,
+            delay_seconds,
+        )
+
+
+@timed_query
+async def fail_job(job_id, error, conn=None):
+    async with acquire(conn) as conn:
+        await conn.execute(
+            """
+            UPDATE "BackgroundJob"
+            SET status = 'failed', "lastError" = $2, "lockedAt" = NULL, "updatedAt" = NOW()
+            WHERE id = $1
+            """,
+            job_id,
+            error,
+        )
+
+
+@timed_query
+async def fetch_latest_session_job(session_id, job_type, conn=None):
+    async with acquire(conn) as conn:
+        row = await conn.fetchrow(
+            """
+            SELECT id, type, status, attempts, "maxAttempts", "lastError",
+                "createdAt", "updatedAt"
+            FROM "BackgroundJob"
+            WHERE "sessionId" = $1 AND type = $2
+            ORDER BY "createdAt" DESC
+            LIMIT 1
+            """,
+            session_id,
+            job_type,
+        )
+        return dict(row) if row else None
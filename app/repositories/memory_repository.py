@@ -0,0 +1,57 @@
+import uuid
+from ..database import acquire
+from ..metrics import timed_query
+
+
+@timed_query
+async def fetch_recent_long_memories(universe_id, npc_id, player_id, conn=None):
+    async with acquire(conn) as conn:
+        rows = await conn.fetch(
+            """
+            SELECT cs."longMemory"
+            FROM "ConversationSession" cs
+            JOIN "ConversationSessionNpc" csn ON cs.id = csn."conversationSessionId"
+            WHERE cs."universeId" = $1 AND csn."npcId" = $2 AND cs."playerId" = $3
+            AND cs."longMemory" != ''
+            ORDER BY cs."endedAt" DESC
+            LIMIT 5
+            """,
+            universe_id,
+            npc_id,
+            player_id,
+        )
+        return [row[0] for row in rows]
+
+
+@timed_query
+async def upsert_summary_memory(universe_id, npc_id, player_id, content, conn=None):
+    async with acquire(conn) as conn:
+        await conn.execute(
+            """
+            INSERT INTO "SummaryMemory" (id, "universeId", "npcId", "playerId", content, "updatedAt")
+            VALUES ($1, $2, $3, $4, $5, NOW())
+            ON CONFLICT ("universeId", "npcId", "playerId")
+            DO UPDATE SET content = EXCLUDED.content, "updatedAt" = NOW()
+            """,
+            str(uuid.uuid4()),
+            universe_id,
+            npc_id,
+            player_id,
+            content,
+        )
+
+
+@timed_query
+async def insert_important_memory(universe_id, npc_id, player_id, content, conn=None):
+    async with acquire(conn) as conn:
+        await conn.execute(
+            """
+            INSERT INTO "ImportantMemory" (id, "universeId", "npcId", "playerId", content)
+            VALUES ($1, $2, $3, $4, $5)
+            """,
+            str(uuid.uuid4()),
+            universe_id,
+            npc_id,
+            player_id,
+            content,
+        )
@@ -0,0 +1,17 @@
+from ..database import acquire
+from ..metrics import timed_query
+
+
+@timed_query
+async def fetch_npc_profiles(universe_id, npc_ids, conn=None):
+    async with acquire(conn) as conn:
+        rows = await conn.fetch(
+            """
+            SELECT id, name, bio, race, gender, species
+            FROM "Npc"
+            WHERE "id" = ANY($1) AND "universeId" = $2
+            """,
+            list(npc_ids),
+            universe_id,
+        )
+        return [dict(row) for row in rows]
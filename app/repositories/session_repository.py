@@ -0,0 +1,402 @@
+import uuid
+from ..database import acquire
+from ..metrics import timed_query
+
+
+# 대화 한 턴에 필요한 모든 데이터를 한 번의 쿼리로 조회
+# NPC별 기억은 NPC 수와 무관하게 집합 단위(CTE + 윈도우 함수)로 조회한다
+# 대화 기록은 프롬프트에 들어갈 최근 메시지만 읽는다 ($3: 단일 NPC, $4: 다중 NPC, NULL이면 전체).
+# 장면 요약이 있으면 요약에 포함된 이후의 기록만 읽는다.
+# 이벤트 목표/도입부는 캐시된 이벤트 정의를 사용하므로 여기서 조회하지 않는다
+def _dialogue_context_query(session_id):
+    # session_id: 세션 id를 가리키는 SQL 식 (단일 조회는 "$1", 배치 조회는 LATERAL 바깥의 "b.id").
+    # 나머지 파라미터($2~$4)는 두 쿼리가 같다.
+    # NPC 프로필과 세계관 설정은 자주 바뀌지 않으므로 여기서 읽지 않고 캐시(npc_service)에서 가져온다
+    return f"""
+    WITH s AS (
+        SELECT id, "universeId", "playerId", "eventId"
+        FROM "ConversationSession"
+        WHERE id = {session_id} AND status = 'active'
+    ),
+    n AS (
+        SELECT csn."npcId" AS id
+        FROM s
+        JOIN "ConversationSessionNpc" csn ON csn."conversationSessionId" = s.id
+    ),
+    sm AS (
+        SELECT m."npcId", m.content
+        FROM "SummaryMemory" m
+        JOIN s ON m."universeId" = s."universeId" AND m."playerId" = s."playerId"
+        WHERE m."npcId" IN (SELECT id FROM n)
+    ),
+    im AS (
+        SELECT "npcId", json_agg(content ORDER BY "createdAt" ASC) AS contents
+        FROM (
+            SELECT m."npcId", m.content, m."createdAt",
+                ROW_NUMBER() OVER (
+                    PARTITION BY m."npcId" ORDER BY m."createdAt" ASC
+                ) AS rn
+            FROM "ImportantMemory" m
+            JOIN s ON m."universeId" = s."universeId" AND m."playerId" = s."playerId"
+            WHERE m."npcId" IN (SELECT id FROM n)
+        ) ranked
+        WHERE rn <= $2
+        GROUP BY "npcId"
+    ),
+    ss AS (
+        SELECT content, "coveredTurnId"
+        FROM "ConversationSceneSummary"
+        WHERE "sessionId" = {session_id}
+    ),
+    t AS (
+        SELECT id, role, content
+        FROM "ConversationTurn"
+        WHERE "sessionId" = {session_id}
+        AND id > COALESCE((SELECT "coveredTurnId" FROM ss), 0)
+        ORDER BY id DESC
+        LIMIT CASE WHEN (SELECT COUNT(*) FROM n) = 1 THEN $3::int ELSE $4::int END
+    )
+    SELECT
+        s."universeId",
+        s."playerId",
+        (
+            SELECT json_agg(
+                json_build_object('role', t.role, 'content', t.content)
+                ORDER BY t.id ASC
+            )
+            FROM t
+        ) AS short_memory,
+        s."eventId",
+        (
+            SELECT json_agg(
+                json_build_object(
+                    'id', n.id,
+                    'summary_memory', sm.content,
+                    'important_memories', im.contents
+                )
+            )
+            FROM n
+            LEFT JOIN sm ON sm."npcId" = n.id
+            LEFT JOIN im ON im."npcId" = n.id
+        ) AS npcs,
+        EXISTS (SELECT 1 FROM t) OR EXISTS (SELECT 1 FROM ss) AS has_history,
+        (SELECT content FROM ss) AS scene_summary
+    FROM s
+"""
+
+
+DIALOGUE_CONTEXT_QUERY = _dialogue_context_query("$1")
+
+# 배치 대화용: 여러 세션의 컨텍스트를 한 번에 조회. 세션마다 위 쿼리를 LATERAL로 실행한다 (세션별 인덱스 조회).
+# 첫 컬럼은 세션 id, 나머지는 DIALOGUE_CONTEXT_QUERY와 같다. 활성 세션이 아니면 행이 없다
+DIALOGUE_CONTEXTS_QUERY = f"""
+    SELECT b.id AS session_id, c.*
+    FROM unnest($1::text[]) AS b(id)
+    CROSS JOIN LATERAL ({_dialogue_context_query("b.id")}) c
+"""
+
+
+@timed_query
+async def insert_session(
+    session_id, universe_id, player_id, event_id, npc_ids, opening_messages=()
+):
+    async with acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                """
+                INSERT INTO "ConversationSession" (id, "universeId", "playerId", "shortMemory", status, "eventId")
+                VALUES ($1, $2, $3, $4, $5, $6)
+                """,
+                session_id,
+                universe_id,
+                player_id,
+                "[]",
+                "active",
+                event_id,
+            )
+            # NPC 세션 생성
+            await conn.executemany(
+                """
+                INSERT INTO "ConversationSessionNpc" (id, "conversationSessionId", "npcId")
+                VALUES ($1, $2, $3)
+                """,
+                [(str(uuid.uuid4()), session_id, npc_id) for npc_id in npc_ids],
+            )
+            # 이벤트 도입부를 미리 대화 기록으로 저장
+            if opening_messages:
+                await insert_conversation_turns(session_id, opening_messages, conn)
+
+
+@timed_query
+async def fetch_dialogue_context(
+    session_id,
+    important_memory_limit,
+    single_npc_memory_limit,
+    multi_npc_memory_limit,
+    conn=None,
+):
+    async with acquire(conn) as conn:
+        return await conn.fetchrow(
+            DIALOGUE_CONTEXT_QUERY,
+            session_id,
+            important_memory_limit,
+            single_npc_memory_limit,
+            multi_npc_memory_limit,
+        )
+
+
+@timed_query
+async def fetch_dialogue_contexts(
+    session_ids,
+    important_memory_limit,
+    single_npc_memory_limit,
+    multi_npc_memory_limit,
+    conn=None,
+):
+    async with acquire(conn) as conn:
+        return await conn.fetch(
+            DIALOGUE_CONTEXTS_QUERY,
+            session_ids,
+            important_memory_limit,
+            single_npc_memory_limit,
+            multi_npc_memory_limit,
+        )
+
+
+@timed_query
+async def lock_active_session(session_id, conn):
+    # 대화 기록 추가 전에 세션 행을 잠가 같은 세션의 저장을 직렬화한다.
+    # 세션이 없거나 종료되면 None, 아니면 기존 대화 기록 존재 여부.
+    # 기록 확인은 잠금 이후 별도 문장으로 실행해야 잠금 대기 중 커밋된 턴까지 보인다
+    # (READ COMMITTED에서 FOR UPDATE는 잠긴 행만 다시 확인하고 서브쿼리는 이전 스냅샷을 쓴다)
+    locked = await conn.fetchval(
+        """
+        SELECT 1 FROM "ConversationSession"
+        WHERE id = $1 AND status = 'active'
+        FOR UPDATE
+        """,
+        session_id,
+    )
+    if locked is None:
+        return None
+    return await conn.fetchval(
+        'SELECT EXISTS (SELECT 1 FROM "ConversationTurn" WHERE "sessionId" = $1)',
+        session_id,
+    )
+
+
+@timed_query
+async def lock_active_sessions(session_ids, conn):
+    # 배치 저장용: 여러 세션을 id 순서로 잠가(교착 방지) 활성 세션별 기존 대화 기록 존재 여부를 반환.
+    # 없거나 종료된 세션은 결과에 포함되지 않음. 기록 확인은 lock_active_session처럼 잠금 이후 별도 문장으로
+    locked = await conn.fetch(
+        """
+        SELECT id FROM "ConversationSession"
+        WHERE id = ANY($1::text[]) AND status = 'active'
+        ORDER BY id
+        FOR UPDATE
+        """,
+        session_ids,
+    )
+    if not locked:
+        return {}
+    rows = await conn.fetch(
+        """
+        SELECT s.id FROM unnest($1::text[]) AS s(id)
+        WHERE EXISTS (SELECT 1 FROM "ConversationTurn" t WHERE t."sessionId" = s.id)
+        """,
+        [row["id"] for row in locked],
+    )
+    with_history = {row["id"] for row in rows}
+    return {row["id"]: row["id"] in with_history for row in locked}
+
+
+@timed_query
+async def insert_conversation_turns(session_id, messages, conn=None):
+    # 메시지 수만큼 행을 추가할 뿐 기존 기록은 건드리지 않는다
+    async with acquire(conn) as conn:
+        await conn.execute(
+            """
+            INSERT INTO "ConversationTurn" ("sessionId", role, content)
+            SELECT $1, m.role, m.content
+            FROM unnest($2::text[], $3::text[]) WITH ORDINALITY AS m(role, content, ord)
+            ORDER BY m.ord
+            """,
+            session_id,
+            [message["role"] for message in messages],
+            [message["content"] for message in messages],
+        )
+
+
+@timed_query
+async def insert_conversation_turns_bulk(session_messages, conn=None):
+    # 배치 저장용: [(session_id, messages)]를 세션별 메시지 순서대로 한 번에 추가
+    session_ids, roles, contents = [], [], []
+    for session_id, messages in session_messages:
+        for message in messages:
+            session_ids.append(session_id)
+            roles.append(message["role"])
+            contents.append(message["content"])
+    async with acquire(conn) as conn:
+        await conn.execute(
+            """
+            INSERT INTO "ConversationTurn" ("sessionId", role, content)
+            SELECT m.session_id, m.role, m.content
+            FROM unnest($1::text[], $2::text[], $3::text[])
+                WITH ORDINALITY AS m(session_id, role, content, ord)
+            ORDER BY m.ord
+            """,
+            session_ids,
+            roles,
+            contents,
+        )
+
+
+# 기억 정리용 대화 기록: 장면 요약 이후의 최근 메시지 (단일 NPC는 $2개, 다중 NPC는 $3개까지, NULL이면 제한 없음)
+# 와 다중 NPC 세션의 장면 요약. cs는 ConversationSession
+_SESSION_TRANSCRIPT_COLUMNS = """
+    (
+        SELECT COALESCE(
+            json_agg(
+                json_build_object('role', t.role, 'content', t.content)
+                ORDER BY t.id ASC
+            ),
+            '[]'::json
+        )
+        FROM (
+            SELECT id, role, content
+            FROM "ConversationTurn"
+            WHERE "sessionId" = cs.id
+            AND id > COALESCE(ss."coveredTurnId", 0)
+            ORDER BY id DESC
+            LIMIT CASE
+                WHEN (
+                    SELECT COUNT(*) FROM "ConversationSessionNpc" csn
+                    WHERE csn."conversationSessionId" = cs.id
+                ) = 1 THEN $2::int
+                ELSE $3::int
+            END
+        ) t
+    ) AS "shortMemory",
+    ss.content AS "sceneSummary"
+"""
+
+
+@timed_query
+async def fetch_active_session_for_end(
+    session_id, single_npc_memory_limit, multi_npc_memory_limit, conn=None
+):
+    async with acquire(conn) as conn:
+        return await conn.fetchrow(
+            f"""
+            SELECT cs."universeId", cs."npcId", cs."playerId",
+            {_SESSION_TRANSCRIPT_COLUMNS}
+            FROM "ConversationSession" cs
+            LEFT JOIN "ConversationSceneSummary" ss ON ss."sessionId" = cs.id
+            WHERE cs.id = $1 AND cs.status = 'active'
+            """,
+            session_id,
+            single_npc_memory_limit,
+            multi_npc_memory_limit,
+        )
+
+
+@timed_query
+async def mark_session_ended(session_id, long_memory, conn=None):
+    # 이미 종료된 세션이면 False
+    async with acquire(conn) as conn:
+        result = await conn.execute(
+            """
+            UPDATE "ConversationSession"
+            SET status = 'ended', "longMemory" = $2, "endedAt" = NOW()
+            WHERE id = $1 AND status = 'active'
+            """,
+            session_id,
+            long_memory,
+        )
+        return result == "UPDATE 1"
+
+
+@timed_query
+async def fetch_session_for_consolidation(
+    session_id, single_npc_memory_limit, multi_npc_memory_limit, conn=None
+):
+    async with acquire(conn) as conn:
+        return await conn.fetchrow(
+            f"""
+            SELECT cs."universeId", cs."npcId", cs."playerId",
+            {_SESSION_TRANSCRIPT_COLUMNS},
+            cs."longMemory"
+            FROM "ConversationSession" cs
+            LEFT JOIN "ConversationSceneSummary" ss ON ss."sessionId" = cs.id
+            WHERE cs.id = $1
+            """,
+            session_id,
+            single_npc_memory_limit,
+            multi_npc_memory_limit,
+        )
+
+
+@timed_query
+async def set_long_memory_once(session_id, long_memory, conn=None):
+    # 재시도 시 중복 저장 방지: longMemory가 비어 있을 때만 기록
+    async with acquire(conn) as conn:
+        result = await conn.execute(
+            """
+            UPDATE "ConversationSession"
+            SET "longMemory" = $2
+            WHERE id = $1 AND COALESCE("longMemory", '') = ''
+            """,
+            session_id,
+            long_memory,
+        )
+        return result == "UPDATE 1"
+
+
+@timed_query
+async def fetch_scene_summary_state(session_id, conn=None):
+    # 현재 장면 요약과 아직 요약되지 않은 대화 기록 (id 포함). 세션이 없거나 종료되면 None
+    async with acquire(conn) as conn:
+        return await conn.fetchrow(
+            """
+            SELECT ss.content, ss."coveredTurnId", cs."universeId",
+            (
+                SELECT json_agg(
+                    json_build_object('id', t.id, 'role', t.role, 'content', t.content)
+                    ORDER BY t.id ASC
+                )
+                FROM "ConversationTurn" t
+                WHERE t."sessionId" = cs.id
+                AND t.id > COALESCE(ss."coveredTurnId", 0)
+            ) AS turns
+            FROM "ConversationSession" cs
+            LEFT JOIN "ConversationSceneSummary" ss ON ss."sessionId" = cs.id
+            WHERE cs.id = $1 AND cs.status = 'active'
+            """,
+            session_id,
+        )
+
+
+@timed_query
+async def save_scene_summary(
+    session_id, content, covered_turn_id, expected_covered_turn_id, conn=None
+):
+    # 읽은 시점 이후 다른 작업이 요약을 먼저 갱신했다면 덮어쓰지 않고 False
+    async with acquire(conn) as conn:
+        result = await conn.execute(
+            """
+            INSERT INTO "ConversationSceneSummary" ("sessionId", content, "coveredTurnId")
+            VALUES ($1, $2, $3)
+            ON CONFLICT ("sessionId") DO UPDATE
+            SET content = EXCLUDED.content,
+                "coveredTurnId" = EXCLUDED."coveredTurnId",
+                "updatedAt" = NOW()
+            WHERE "ConversationSceneSummary"."coveredTurnId"
+                IS NOT DISTINCT FROM $4::bigint
+            """,
+            session_id,
+            content,
+            covered_turn_id,
+            expected_covered_turn_id,
+        )
+        return result == "INSERT 0 1"
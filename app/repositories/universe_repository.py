@@ -0,0 +1,31 @@
+from ..database import acquire
+from ..metrics import timed_query
+
+
+@timed_query
+async def fetch_universe_settings(universe_id, conn=None):
+    async with acquire(conn) as conn:
+        row = await conn.fetchrow(
+            """
+            SELECT description, lore, rules
+            FROM "UniverseSetting"
+            JOIN "Universe" ON "UniverseSetting"."universeId" = "Universe"."id"
+            WHERE "Universe"."id" = $1
+            """,
+            universe_id,
+        )
+        return dict(row) if row else {}
+
+
+@timed_query
+async def fetch_npcs_by_universe(universe_id, conn=None):
+    async with acquire(conn) as conn:
+        rows = await conn.fetch(
+            """
+            SELECT *
+            FROM "Npc"
+            WHERE "universeId" = $1
+            """,
+            universe_id,
+        )
+        return [dict(row) for row in rows]
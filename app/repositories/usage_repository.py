@@ -0,0 +1,93 @@
+from ..database import acquire
+from ..metrics import timed_query
+
+# 집계 기준으로 허용하는 컬럼 (쿼리에 그대로 들어가므로 이 목록 밖의 값은 받지 않는다)
+USAGE_GROUP_COLUMNS = {
+    "universe": '"universeId"',
+    "session": '"sessionId"',
+    "npc": '"npcId"',
+    "call_type": '"callType"',
+    "provider": "provider",
+    "model": "model",
+    "round": "round",
+}
+
+
+@timed_query
+async def insert_usage_records(records, conn=None):
+    # 모아 둔 사용량 기록을 한 번의 INSERT로 저장
+    async with acquire(conn) as conn:
+        await conn.execute(
+            """
+            INSERT INTO "LlmUsageLedger" (
+                "sessionId", "universeId", "npcId", "callType", provider, model,
+                round, "inputTokens", "cachedInputTokens",
+                "cacheCreationInputTokens", "outputTokens", "costUsd", "createdAt"
+            )
+            SELECT * FROM unnest(
+                $1::text[], $2::text[], $3::text[], $4::text[], $5::text[],
+                $6::text[], $7::int[], $8::int[], $9::int[], $10::int[],
+                $11::int[], $12::numeric[], $13::timestamptz[]
+            )
+            """,
+            [r["session_id"] for r in records],
+            [r["universe_id"] for r in records],
+            [r["npc_id"] for r in records],
+            [r["call_type"] for r in records],
+            [r["provider"] for r in records],
+            [r["model"] for r in records],
+            [r["round"] for r in records],
+            [r["input_tokens"] for r in records],
+            [r["cached_input_tokens"] for r in records],
+            [r["cache_creation_input_tokens"] for r in records],
+            [r["output_tokens"] for r in records],
+            [r["cost_usd"] for r in records],
+            [r["created_at"] for r in records],
+        )
+
+
+@timed_query
+async def fetch_usage_summary(
+    group_by,
+    universe_id=None,
+    session_id=None,
+    npc_id=None,
+    call_type=None,
+    since=None,
+    until=None,
+    limit=100,
+    conn=None,
+):
+    # group_by: USAGE_GROUP_COLUMNS 키 목록. 비용(없으면 입력 토큰)이 큰 순서
+    columns = [f"{USAGE_GROUP_COLUMNS[key]} AS {key}" for key in group_by]
+    group_keys = ", ".join(USAGE_GROUP_COLUMNS[key] for key in group_by)
+    async with acquire(conn) as conn:
+        return await conn.fetch(
+            f"""
+            SELECT {", ".join(columns)},
+                COUNT(*) AS calls,
+                SUM("inputTokens") AS input_tokens,
+                SUM("cachedInputTokens") AS cached_input_tokens,
+                SUM("cacheCreationInputTokens") AS cache_creation_input_tokens,
+                SUM("outputTokens") AS output_tokens,
+                SUM("costUsd")::float AS cost_usd,
+                ROUND(AVG("inputTokens"))::int AS avg_input_tokens
+            FROM "LlmUsageLedger"
+            WHERE ($1::text IS NULL OR "universeId" = $1)
+            AND ($2::text IS NULL OR "sessionId" = $2)
+            AND ($3::text IS NULL OR "npcId" = $3)
+            AND ($4::text IS NULL OR "callType" = $4)
+            AND ($5::timestamptz IS NULL OR "createdAt" >= $5)
+            AND ($6::timestamptz IS NULL OR "createdAt" < $6)
+            GROUP BY {group_keys}
+            ORDER BY cost_usd DESC NULLS LAST, input_tokens DESC
+            LIMIT $7
+            """,
+            universe_id,
+            session_id,
+            npc_id,
+            call_type,
+            since,
+            until,
+            limit,
+        )
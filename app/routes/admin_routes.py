@@ -0,0 +1,61 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException
+from pydantic import UUID4
+from ..config import ai_client_delegate
+from ..services.cache_service import (
+    get_cache_stats,
+    invalidate_all,
+    invalidate_universe,
+    invalidate_event,
+)
+from ..services.usage_service import get_usage_summary
+
+router = APIRouter()
+
+
+@router.get("/admin/cache")
+async def get_cache():
+    return get_cache_stats()
+
+
+@router.post("/admin/cache/invalidate")
+async def invalidate_cache(
+    universe_id: Optional[UUID4] = None, event_id: Optional[str] = None
+):
+    # universe_id와 event_id가 모두 없으면 전체 캐시를 비운다
+    if universe_id:
+        invalidate_universe(str(universe_id))
+    if event_id:
+        invalidate_event(event_id)
+    if not universe_id and not event_id:
+        invalidate_all()
+    return {"status": "invalidated", "universe_id": universe_id, "event_id": event_id}
+
+
+@router.get("/admin/llm-usage")
+async def get_llm_usage():
+    # 이 프로세스가 시작된 뒤 provider별 누적 입력/캐시 적중/출력 토큰 수
+    return ai_client_delegate.usage_stats
+
+
+@router.get("/admin/llm-usage/summary")
+async def get_llm_usage_summary(
+    group_by: str = "universe",
+    universe_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    npc_id: Optional[str] = None,
+    call_type: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = 100,
+):
+    # 사용량 원장 집계 (예: group_by=universe,call_type). 비용이 큰 순서
+    try:
+        return await get_usage_summary(
+            group_by, universe_id, session_id, npc_id, call_type, since, until, limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
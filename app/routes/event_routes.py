@@ -5,9 +5,9 @@ router = APIRouter()
 
 
 @router.get("/event/{event_id}")
-def get_event(event_id: str):
+async def get_event(event_id: str):
     try:
-        event = get_event_by_id(event_id)
+        event = await get_event_by_id(event_id)
         if not event:
             raise HTTPException(status_code=404, detail="Event not found")
         return event
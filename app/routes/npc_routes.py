@@ -1,14 +1,33 @@
+import json
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from uuid import UUID
 from pydantic import UUID4
-from ..models import DialogueRequest, SessionStartRequest
-from ..services.session_service import start_session, generate_npc_dialogue, end_session
+from ..llm_limiter import LLMOverloadedError
+from ..models import BatchDialogueRequest, DialogueRequest, SessionStartRequest
+from ..services.session_service import (
+    start_session,
+    generate_npc_dialogue,
+    generate_npc_dialogue_batch,
+    end_session,
+    end_session_in_background,
+    get_session_consolidation_status,
+    prepare_npc_dialogue,
+    stream_npc_dialogue,
+)
 
 router = APIRouter()
 
 
+def _overloaded(e):
+    # LLM 호출 한도 초과: 작업을 시작하기 전에 거절하고 재시도 시점을 알려준다
+    return HTTPException(
+        status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)}
+    )
+
+
 @router.post("/npc/{universe_id}/start-session")
-def start_npc_session(universe_id: UUID4, body: SessionStartRequest):
+async def start_npc_session(universe_id: UUID4, body: SessionStartRequest):
     print(
         f"Starting session for universe_id: {universe_id}, npc_ids: {body.npcs}, player_id: {body.player_id}"
     )
@@ -25,7 +44,7 @@ def start_npc_session(universe_id: UUID4, body: SessionStartRequest):
     if body.event_id and not isinstance(body.event_id, UUID):
         raise HTTPException(status_code=400, detail="Event ID must be a UUID.")
     try:
-        session_id = start_session(
+        session_id = await start_session(
             str(universe_id), body.npcs, str(body.player_id), body.event_id
         )
         return {"session_id": session_id}
@@ -34,14 +53,14 @@ def start_npc_session(universe_id: UUID4, body: SessionStartRequest):
 
 
 @router.post("/npc/{session_id}/dialogue")
-def dialogue_npc(
+async def dialogue_npc(
     session_id: UUID4,
     body: DialogueRequest,
     provider: str = "openai",
     response_format: str = "text",
 ):
     try:
-        dialogue = generate_npc_dialogue(
+        dialogue = await generate_npc_dialogue(
             str(session_id),
             body.player_input,
             provider=provider,
@@ -50,16 +69,105 @@ def dialogue_npc(
         if isinstance(dialogue, dict) and dialogue.get("error"):
             raise HTTPException(status_code=404, detail=dialogue["error"])
         return {"session_id": str(session_id), "dialogue": dialogue}
+    except LLMOverloadedError as e:
+        raise _overloaded(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/npc/dialogue/batch")
+async def batch_dialogue_npc(
+    body: BatchDialogueRequest,
+    provider: str = "openai",
+    response_format: str = "text",
+):
+    # 여러 세션의 대화 턴을 한 번에 처리. 항목별 결과/오류는 입력 순서대로 반환
+    try:
+        results = await generate_npc_dialogue_batch(
+            [(str(item.session_id), item.player_input) for item in body.items],
+            provider=provider,
+            response_format=response_format,
+        )
+    except LLMOverloadedError as e:
+        raise _overloaded(e)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"results": results}
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/npc/{session_id}/dialogue/stream")
+async def stream_dialogue_npc(
+    session_id: UUID4,
+    body: DialogueRequest,
+    provider: str = "openai",
+    response_format: str = "text",
+):
+    try:
+        turn = await prepare_npc_dialogue(
+            str(session_id),
+            body.player_input,
+            provider=provider,
+            response_format=response_format,
+        )
+    except LLMOverloadedError as e:
+        raise _overloaded(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if turn.get("error"):
+        raise HTTPException(status_code=404, detail=turn["error"])
+
+    async def event_stream():
+        dialogue = ""
+        try:
+            async for delta in stream_npc_dialogue(
+                str(session_id), body.player_input, turn, provider=provider
+            ):
+                dialogue += delta
+                yield _sse("token", {"delta": delta})
+        except LLMOverloadedError as e:
+            yield _sse("error", {"detail": str(e), "retry_after": e.retry_after})
+            return
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+            return
+        yield _sse("done", {"session_id": str(session_id), "dialogue": dialogue})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("/npc/{session_id}/end-session")
-def end_npc_session(session_id: UUID4, provider: str = "openai"):
+async def end_npc_session(
+    session_id: UUID4, provider: str = "openai", background: bool = False
+):
     try:
-        result = end_session(str(session_id), provider=provider)
+        if background:
+            return await end_session_in_background(str(session_id), provider=provider)
+        result = await end_session(str(session_id), provider=provider)
         return result
+    except LLMOverloadedError as e:
+        raise _overloaded(e)
     except ValueError as ve:
         raise HTTPException(status_code=404, detail=str(ve))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/npc/{session_id}/end-session/status")
+async def end_npc_session_status(session_id: UUID4):
+    try:
+        job = await get_session_consolidation_status(str(session_id))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not job:
+        raise HTTPException(status_code=404, detail="Consolidation job not found")
+    return {"session_id": str(session_id), "job": job}
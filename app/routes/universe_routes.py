@@ -6,9 +6,9 @@ router = APIRouter()
 
 
 @router.get("/universe/{universe_id}/npcs")
-def get_npcs(universe_id: UUID4):
+async def get_npcs(universe_id: UUID4):
     try:
-        npcs = get_npcs_by_universe_id(str(universe_id))
+        npcs = await get_npcs_by_universe_id(str(universe_id))
         if not npcs:
             raise HTTPException(status_code=404, detail="No NPCs found")
         return {"npcs": npcs}
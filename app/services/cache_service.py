@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import os
+import asyncpg
+from ..cache import TTLCache
+from ..config import DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+# 캐시 설정 (환경변수로 조정)
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+# NPC/세계관 설정/이벤트 변경 알림 채널 (migrations/004, 005 트리거가 발행)
+CACHE_INVALIDATE_CHANNEL = "cache_invalidate"
+CACHE_LISTEN_HEALTHCHECK_SECONDS = 30
+CACHE_LISTEN_RETRY_SECONDS = 5
+
+npc_profile_cache = TTLCache("npc_profile", CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+universe_settings_cache = TTLCache(
+    "universe_settings", CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS
+)
+universe_npcs_cache = TTLCache("universe_npcs", CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+event_cache = TTLCache("event", CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+# 키: (universe_id, event_id, NPC id 튜플). NPC 이름이 들어가므로 세계관 무효화 대상이기도 함
+event_opener_cache = TTLCache("event_opener", CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+
+_caches = (
+    npc_profile_cache,
+    universe_settings_cache,
+    universe_npcs_cache,
+    event_cache,
+    event_opener_cache,
+)
+# 이벤트 관련 테이블 트리거는 "event:<eventId>" 형식으로 알림
+EVENT_PAYLOAD_PREFIX = "event:"
+
+
+def invalidate_universe(universe_id):
+    # npc_profile_cache 키는 (universe_id, npc_id)
+    npc_profile_cache.invalidate_where(lambda key: key[0] == universe_id)
+    universe_settings_cache.invalidate(universe_id)
+    universe_npcs_cache.invalidate(universe_id)
+    event_opener_cache.invalidate_where(lambda key: key[0] == universe_id)
+
+
+def invalidate_event(event_id):
+    event_cache.invalidate(event_id)
+    event_opener_cache.invalidate_where(lambda key: key[1] == event_id)
+
+
+def invalidate_all():
+    for cache in _caches:
+        cache.clear()
+
+
+def get_cache_stats():
+    return {cache.name: cache.stats() for cache in _caches}
+
+
+class CacheInvalidationListener:
+    # 전용 커넥션으로 LISTEN 하다가 알림이 오면 해당 세계관 캐시를 비운다.
+    # 연결이 끊긴 동안의 알림은 놓칠 수 있으므로 (재)연결할 때마다 전체를 비운다.
+
+    def __init__(self, channel):
+        self.channel = channel
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _on_notify(self, conn, pid, channel, payload):
+        if payload.startswith(EVENT_PAYLOAD_PREFIX):
+            invalidate_event(payload[len(EVENT_PAYLOAD_PREFIX) :])
+        elif payload:
+            invalidate_universe(payload)
+        else:
+            invalidate_all()
+
+    async def _run(self):
+        while True:
+            try:
+                conn = await asyncpg.connect(DATABASE_URL)
+                try:
+                    await conn.add_listener(self.channel, self._on_notify)
+                    invalidate_all()
+                    while True:
+                        await asyncio.sleep(CACHE_LISTEN_HEALTHCHECK_SECONDS)
+                        await conn.execute("SELECT 1")
+                finally:
+                    await conn.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"캐시 무효화 LISTEN 실패: {e}")
+            await asyncio.sleep(CACHE_LISTEN_RETRY_SECONDS)
+
+
+cache_listener = CacheInvalidationListener(CACHE_INVALIDATE_CHANNEL)
@@ -0,0 +1,154 @@
+from dataclasses import dataclass, field
+from ..repositories.session_repository import (
+    fetch_dialogue_context,
+    fetch_dialogue_contexts,
+)
+from .memory_service import IMPORTANT_MEMORY_LIMIT
+from .event_service import get_event_definition, get_event_opener
+from .npc_service import get_npc_profiles, get_universe_settings
+
+# 프롬프트에 넣을 최근 대화 메시지 수
+MAX_MEMORY_LENGTH = 20
+# 다중 NPC 세션은 장면 요약 이후의 기록 전체를 사용 (요약 작업이 길이를 제한)
+MULTI_NPC_MEMORY_LENGTH = None
+
+
+@dataclass
+class NpcContext:
+    id: str
+    name: str
+    bio: str
+    race: str
+    gender: str
+    species: str
+    summary_memory: str = "없음"
+    important_memories: list[str] = field(default_factory=list)
+
+
+@dataclass
+class DialogueContext:
+    session_id: str
+    universe_id: str
+    player_id: str
+    event_id: str | None
+    # 최근 대화 기록 (ConversationTurn에서 필요한 만큼만 조회)
+    short_memory: list[dict]
+    universe: dict
+    npcs: list[NpcContext]
+    event_goal_description: str | None = None
+    event_goal_trigger: str | None = None
+    # 대화 기록이 없을 때만 채워짐 (캐시된 이벤트 도입부 메시지, 읽기 전용)
+    event_opener: tuple[dict, ...] = ()
+    # 다중 NPC 세션에서 오래된 기록을 접어 넣은 "지금까지의 장면" 요약
+    scene_summary: str | None = None
+
+
+async def load_dialogue_context(session_id):
+    # 대화 한 턴에 필요한 세션 데이터를 한 번의 쿼리로 조회 (NPC 프로필, 세계관 설정, 이벤트 정의는 캐시 사용)
+    try:
+        row = await fetch_dialogue_context(
+            session_id,
+            IMPORTANT_MEMORY_LIMIT,
+            MAX_MEMORY_LENGTH,
+            MULTI_NPC_MEMORY_LENGTH,
+        )
+    except Exception as e:
+        raise RuntimeError(f"대화 컨텍스트 조회 실패: {e}")
+
+    if not row:
+        return None
+    universe_id, npcs = row["universeId"], row["npcs"] or []
+    profiles = await get_npc_profiles(universe_id, [npc["id"] for npc in npcs])
+    universe = await get_universe_settings(universe_id)
+    return await _build_context(session_id, row, profiles, universe)
+
+
+async def load_dialogue_contexts(session_ids):
+    # 배치 대화용: 여러 세션의 컨텍스트를 한 번의 쿼리로 조회 (session_id -> 컨텍스트, 활성 세션이 아니면 None)
+    session_ids = list(session_ids)
+    try:
+        rows = await fetch_dialogue_contexts(
+            session_ids,
+            IMPORTANT_MEMORY_LIMIT,
+            MAX_MEMORY_LENGTH,
+            MULTI_NPC_MEMORY_LENGTH,
+        )
+    except Exception as e:
+        raise RuntimeError(f"대화 컨텍스트 조회 실패: {e}")
+
+    # 프로필/세계관 설정은 세계관마다 한 번씩만 조회 (캐시에 없는 것만 DB에서)
+    universe_npc_ids = {}
+    for row in rows:
+        universe_npc_ids.setdefault(row["universeId"], set()).update(
+            npc["id"] for npc in row["npcs"] or []
+        )
+    profiles = {}
+    universes = {}
+    for universe_id, npc_ids in universe_npc_ids.items():
+        profiles[universe_id] = await get_npc_profiles(universe_id, npc_ids)
+        universes[universe_id] = await get_universe_settings(universe_id)
+
+    contexts = dict.fromkeys(session_ids)
+    for row in rows:
+        contexts[row["session_id"]] = await _build_context(
+            row["session_id"],
+            tuple(row)[1:],
+            profiles[row["universeId"]],
+            universes[row["universeId"]],
+        )
+    return contexts
+
+
+async def _build_context(session_id, row, profiles, universe):
+    # profiles: npc_id -> 프로필 (get_npc_profiles), universe: 세계관 설정 (get_universe_settings).
+    # 프로필이 없는 NPC는 이름 등이 None으로 남아 턴 구성 단계에서 오류로 처리된다
+    (
+        universe_id,
+        player_id,
+        short_memory,
+        event_id,
+        npcs,
+        has_history,
+        scene_summary,
+    ) = row
+
+    event = await get_event_definition(event_id) if event_id else None
+    event = event or {}
+    goal_description = event.get("goalDescription")
+    npcs = [{**profiles.get(npc["id"], {}), **npc} for npc in npcs or []]
+
+    event_opener = ()
+    if event and not has_history:
+        event_opener = get_event_opener(
+            universe_id,
+            event_id,
+            event["steps"],
+            {npc["id"]: npc.get("name") for npc in npcs},
+        )
+
+    return DialogueContext(
+        session_id=session_id,
+        universe_id=universe_id,
+        player_id=player_id,
+        event_id=event_id,
+        short_memory=short_memory or [],
+        universe=universe or {},
+        npcs=[
+            NpcContext(
+                id=npc["id"],
+                name=npc.get("name"),
+                bio=npc.get("bio"),
+                race=npc.get("race"),
+                gender=npc.get("gender"),
+                species=npc.get("species"),
+                summary_memory=npc["summary_memory"] or "없음",
+                important_memories=npc["important_memories"] or [],
+            )
+            for npc in npcs
+        ],
+        # 기존 동작과 동일하게 goalDescription이 있을 때만 목표를 사용
+        event_goal_description=goal_description or None,
+        event_goal_trigger=event.get("goalTrigger") if goal_description else None,
+        event_opener=event_opener,
+        scene_summary=scene_summary,
+    )
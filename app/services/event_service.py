@@ -1,118 +1,81 @@
-from ..database import get_connection, release_connection
+from ..repositories.event_repository import (
+    fetch_event_aggregate,
+    fetch_player_event_states,
+)
+from .cache_service import event_cache, event_opener_cache
 
 
-def get_event_by_id(event_id):
-    conn = get_connection()
+def _event_definition(row):
+    # 잘 바뀌지 않는 부분(이벤트 정의, 트리거, 효과, 단계)만 캐시 대상
+    return {
+        **row["event"],
+        "triggers": row["triggers"],
+        "effects": row["effects"],
+        "steps": row["steps"],
+    }
+
+
+async def get_event_definition(event_id):
+    # 대화 서비스용: 목표와 도입부 단계가 포함된 이벤트 정의. 없으면 None
+    definition = event_cache.get(event_id)
+    if definition is not None:
+        return definition
     try:
-        # 기본 이벤트 정보 조회
-        event_data = {}
-        with conn.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT id, "universeId", name, type, scope, "isRepeatable", "isActive", "createdAt"
-                FROM "Event"
-                WHERE id = %s
-                """,
-                (event_id,),
-            )
-            row = cursor.fetchone()
+        row = await fetch_event_aggregate(event_id, include_player_states=False)
+    except Exception as e:
+        raise RuntimeError(f"이벤트 조회 실패: {e}")
+    if not row:
+        return None
+
+    definition = _event_definition(row)
+    event_cache.set(event_id, definition)
+    return definition
+
+
+async def get_event_by_id(event_id):
+    try:
+        definition = event_cache.get(event_id)
+        if definition is None:
+            # 캐시에 없으면 플레이어 상태까지 한 번의 쿼리로 조회
+            row = await fetch_event_aggregate(event_id)
             if not row:
                 return {}
+            definition = _event_definition(row)
+            event_cache.set(event_id, definition)
+            player_states = row["playerStates"]
+        else:
+            player_states = await fetch_player_event_states(event_id)
+    except Exception as e:
+        raise RuntimeError(f"이벤트 조회 실패: {e}")
 
-            event_data = dict(
-                zip(
-                    [
-                        "id",
-                        "universeId",
-                        "name",
-                        "type",
-                        "scope",
-                        "isRepeatable",
-                        "isActive",
-                        "createdAt",
-                    ],
-                    row,
-                )
-            )
+    return {**definition, "playerStates": player_states}
 
-            # 트리거 정보 조회
-            cursor.execute(
-                """
-                SELECT id, "eventId", type, config, "createdAt"
-                FROM "EventTrigger"
-                WHERE "eventId" = %s
-                """,
-                (event_id,),
-            )
-            triggers = [
-                dict(zip(["id", "eventId", "type", "config", "createdAt"], row))
-                for row in cursor.fetchall()
-            ]
-            event_data["triggers"] = triggers
 
-            # 이벤트 효과 정보 조회
-            cursor.execute(
-                """
-                SELECT id, "eventId", type, config, "order", "createdAt"
-                FROM "EventEffect"
-                WHERE "eventId" = %s
-                ORDER BY "order"
-                """,
-                (event_id,),
+def _build_event_opener(steps, npc_names):
+    # EventStep을 대화 기록 형식의 메시지로 변환
+    opener = []
+    for step in steps:
+        event_message = step["message"]
+        speaker_type = step["speakerType"]
+        if speaker_type == "PLAYER":
+            opener.append({"role": "user", "content": event_message})
+        elif speaker_type == "NPC":
+            npc_name = npc_names.get(step["speakerId"], "알 수 없음")
+            opener.append(
+                {"role": "assistant", "content": f"{npc_name}: {event_message}"}
             )
-            effects = [
-                dict(
-                    zip(["id", "eventId", "type", "config", "order", "createdAt"], row)
-                )
-                for row in cursor.fetchall()
-            ]
-            event_data["effects"] = effects
-
-            # 플레이어 이벤트 상태 정보 조회
-            cursor.execute(
-                """
-                SELECT id, "eventId", "playerId", status, "updatedAt"
-                FROM "PlayerEventState"
-                WHERE "eventId" = %s
-                """,
-                (event_id,),
+        else:
+            opener.append(
+                {"role": "assistant", "content": f"{speaker_type}: {event_message}"}
             )
-            player_states = [
-                dict(zip(["id", "eventId", "playerId", "status", "updatedAt"], row))
-                for row in cursor.fetchall()
-            ]
-            event_data["playerStates"] = player_states
+    return tuple(opener)
 
-            # 이벤트 단계 정보 조회
-            cursor.execute(
-                """
-                SELECT id, "eventId", "order", message, "speakerType", "speakerId"
-                FROM "EventStep"
-                WHERE "eventId" = %s
-                ORDER BY "order"
-                """,
-                (event_id,),
-            )
-            steps = [
-                dict(
-                    zip(
-                        [
-                            "id",
-                            "eventId",
-                            "order",
-                            "message",
-                            "speakerType",
-                            "speakerId",
-                        ],
-                        row,
-                    )
-                )
-                for row in cursor.fetchall()
-            ]
-            event_data["steps"] = steps
 
-            return event_data
-    except Exception as e:
-        raise RuntimeError(f"이벤트 조회 실패: {e}")
-    finally:
-        release_connection(conn)
+def get_event_opener(universe_id, event_id, steps, npc_names):
+    # (이벤트, NPC 구성)별로 한 번만 만들어 캐시. 반환값은 읽기 전용으로 다룰 것
+    key = (universe_id, event_id, tuple(sorted(npc_names)))
+    opener = event_opener_cache.get(key)
+    if opener is None:
+        opener = _build_event_opener(steps, npc_names)
+        event_opener_cache.set(key, opener)
+    return opener
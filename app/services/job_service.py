@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import os
+import random
+from ..repositories.job_repository import (
+    insert_job,
+    insert_job_if_absent,
+    claim_job,
+    complete_job,
+    reschedule_job,
+    fail_job,
+    fetch_latest_session_job,
+)
+
+logger = logging.getLogger(__name__)
+
+# 작업 큐 설정 (환경변수로 조정)
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1.0"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "5.0"))
+# running 상태로 이 시간 이상 남아 있으면 워커가 죽은 것으로 보고 다시 실행
+JOB_LOCK_TIMEOUT_SECONDS = float(os.getenv("JOB_LOCK_TIMEOUT_SECONDS", "300"))
+
+_job_handlers = {}
+
+
+def job_handler(job_type):
+    # 작업 타입별 처리 함수 등록 (handler(job) 형태의 코루틴)
+    def register(func):
+        _job_handlers[job_type] = func
+        return func
+
+    return register
+
+
+class JobWorker:
+    # 고정된 수의 asyncio 태스크가 DB 큐에서 작업을 하나씩 가져와 처리한다
+
+    def __init__(self, concurrency, poll_interval):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._tasks = []
+        self._wakeup = asyncio.Event()
+
+    def start(self):
+        self._tasks = [
+            asyncio.create_task(self._run()) for _ in range(self.concurrency)
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                job = await claim_job(JOB_LOCK_TIMEOUT_SECONDS)
+            except Exception as e:
+                logger.error(f"작업 선점 실패: {e}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            await self._process(job)
+
+    async def _process(self, job):
+        try:
+            handler = _job_handlers.get(job["type"])
+            if handler is None:
+                raise ValueError(f"등록되지 않은 작업 타입: {job['type']}")
+            await handler(job)
+            await complete_job(job["id"])
+        except Exception as e:
+            logger.error(f"작업 실패 - {job['type']}({job['id']}): {e}")
+            try:
+                if job["attempts"] >= job["maxAttempts"]:
+                    await fail_job(job["id"], str(e))
+                else:
+                    # 지수 백오프 + 지터
+                    delay = JOB_RETRY_BASE_SECONDS * 2 ** (job["attempts"] - 1)
+                    delay *= random.uniform(0.8, 1.2)
+                    await reschedule_job(job["id"], str(e), delay)
+            except Exception as db_error:
+                logger.error(f"작업 상태 갱신 실패 ({job['id']}): {db_error}")
+
+
+job_worker = JobWorker(JOB_WORKER_CONCURRENCY, JOB_POLL_INTERVAL_SECONDS)
+
+
+async def enqueue_job(job_type, session_id, payload, conn=None, unique=False):
+    # unique=True면 같은 세션에 대기/실행 중인 같은 작업이 있을 때 추가하지 않음 (None 반환)
+    insert = insert_job_if_absent if unique else insert_job
+    job_id = await insert(job_type, session_id, payload, JOB_MAX_ATTEMPTS, conn)
+    if job_id:
+        job_worker.notify()
+    return job_id
+
+
+async def get_session_job(session_id, job_type):
+    try:
+        return await fetch_latest_session_job(session_id, job_type)
+    except Exception as e:
+        raise RuntimeError(f"작업 상태 조회 실패: {e}")
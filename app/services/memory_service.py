@@ -1,96 +1,33 @@
-import uuid
-from datetime import datetime
-from ..database import get_connection, release_connection
-from ..config import client
+from ..config import ai_client_delegate
 from ..prompts import load_relationship_summary_prompt
+from ..repositories.memory_repository import (
+    fetch_recent_long_memories,
+    upsert_summary_memory,
+)
 
+# 프롬프트에 넣을 NPC별 중요 기억 수 (오래된 순, 대화 컨텍스트 쿼리에서 사용)
+IMPORTANT_MEMORY_LIMIT = 5
 
-def get_important_memories(universe_id, npc_id, player_id):
-    conn = get_connection()
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT content FROM "ImportantMemory"
-                WHERE "universeId" = %s AND "npcId" = %s AND "playerId" = %s
-                ORDER BY "createdAt" ASC LIMIT 5
-            """,
-                (universe_id, npc_id, player_id),
-            )
-            return [row[0] for row in cursor.fetchall()]
-    except Exception as e:
-        raise RuntimeError(f"중요 기억 조회 실패: {e}")
-    finally:
-        release_connection(conn)
-
-
-def get_summary_memory(universe_id, npc_id, player_id):
-    conn = get_connection()
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT content FROM "SummaryMemory"
-                WHERE "universeId" = %s AND "npcId" = %s AND "playerId" = %s
-            """,
-                (universe_id, npc_id, player_id),
-            )
-            row = cursor.fetchone()
-            return row[0] if row else "없음"
-    except Exception as e:
-        raise RuntimeError(f"요약 기억 조회 실패: {e}")
-    finally:
-        release_connection(conn)
 
-
-def update_summary_memory(universe_id, npc_id, player_id):
-    conn = get_connection()
+async def update_summary_memory(universe_id, npc_id, player_id, usage_scope=None):
     try:
-        with conn.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT cs."longMemory"
-                FROM "ConversationSession" cs
-                JOIN "ConversationSessionNpc" csn ON cs.id = csn."conversationSessionId"
-                WHERE cs."universeId" = %s AND csn."npcId" = %s AND cs."playerId" = %s
-                AND cs."longMemory" != ''
-                ORDER BY cs."endedAt" DESC
-                LIMIT 5
-            """,
-                (universe_id, npc_id, player_id),
-            )
-            memories = [row[0] for row in cursor.fetchall()]
-
-            if not memories:
-                return
-
-            relationship_summary_prompt = load_relationship_summary_prompt()
-            prompt = relationship_summary_prompt.format(
-                long_memories="\n".join(memories)
-            )
-
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=150,
-                temperature=0.5,
-            )
-            new_summary = response.choices[0].message.content
-
-            now = datetime.utcnow()
-            cursor.execute(
-                """
-                INSERT INTO "SummaryMemory" (id, "universeId", "npcId", "playerId", content, "updatedAt")
-                VALUES (%s, %s, %s, %s, %s, %s)
-                ON CONFLICT ("universeId", "npcId", "playerId")
-                DO UPDATE SET content = EXCLUDED.content, "updatedAt" = NOW()
-            """,
-                (str(uuid.uuid4()), universe_id, npc_id, player_id, new_summary, now),
-            )
-
-            conn.commit()
+        memories = await fetch_recent_long_memories(universe_id, npc_id, player_id)
+        if not memories:
+            return
+
+        relationship_summary_prompt = load_relationship_summary_prompt()
+        prompt = relationship_summary_prompt.format(long_memories="\n".join(memories))
+
+        response = await ai_client_delegate.generate_response(
+            provider="openai",
+            call_type="summary_memory",
+            usage_scope=usage_scope,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=150,
+            temperature=0.5,
+        )
+        new_summary = ai_client_delegate.response_text("openai", response)
+
+        await upsert_summary_memory(universe_id, npc_id, player_id, new_summary)
     except Exception as e:
-        conn.rollback()
         raise RuntimeError(f"요약 메모리 업데이트 실패: {e}")
-    finally:
-        release_connection(conn)
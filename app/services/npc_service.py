@@ -1,120 +1,256 @@
-from ..database import get_connection, release_connection
-from ..config import client, ai_client_delegate  # 대리자 추가
+import logging
+import os
+from dataclasses import dataclass, field
+from ..config import ai_client_delegate  # 대리자 추가
+from ..repositories.npc_repository import fetch_npc_profiles
+from ..repositories.universe_repository import fetch_universe_settings
+from .cache_service import npc_profile_cache, universe_settings_cache
 
+logger = logging.getLogger(__name__)
+
+# 잘린 응답 이어쓰기 제한: 한 턴의 최대 호출 횟수와 총 출력 토큰 수
+MAX_CONTINUATION_ROUNDS = int(os.getenv("MAX_CONTINUATION_ROUNDS", "3"))
+MAX_DIALOGUE_OUTPUT_TOKENS = int(os.getenv("MAX_DIALOGUE_OUTPUT_TOKENS", "1000"))
+
+
+async def get_npc_profiles(universe_id, npc_ids):
+    # 여러 NPC 프로필을 한 번에 조회 (npc_id -> 프로필). 캐시에 없는 것만 DB에서 조회
+    profiles = {}
+    missing = []
+    for npc_id in npc_ids:
+        profile = npc_profile_cache.get((universe_id, npc_id))
+        if profile is None:
+            missing.append(npc_id)
+        else:
+            profiles[npc_id] = profile
+    if not missing:
+        return profiles
 
-def get_npc_profile(universe_id, npc_id):
-    conn = get_connection()
     try:
-        with conn.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT name, bio, race, gender, species
-                FROM "Npc"
-                WHERE "id" = %s AND "universeId" = %s
-            """,
-                (npc_id, universe_id),
-            )
-            row = cursor.fetchone()
-            return (
-                dict(zip(["name", "bio", "race", "gender", "species"], row))
-                if row
-                else {}
-            )
+        rows = await fetch_npc_profiles(universe_id, missing)
     except Exception as e:
         raise RuntimeError(f"NPC 프로필 조회 실패: {e}")
-    finally:
-        release_connection(conn)
 
+    for row in rows:
+        profile = {k: row[k] for k in ("name", "bio", "race", "gender", "species")}
+        npc_profile_cache.set((universe_id, row["id"]), profile)
+        profiles[row["id"]] = profile
+    return profiles
 
-def get_universe_settings(universe_id):
-    conn = get_connection()
+
+async def get_universe_settings(universe_id):
+    settings = universe_settings_cache.get(universe_id)
+    if settings is not None:
+        return settings
     try:
-        with conn.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT description, lore, rules
-                FROM "UniverseSetting"
-                JOIN "Universe" ON "UniverseSetting"."universeId" = "Universe"."id"
-                WHERE "Universe"."id" = %s
-            """,
-                (universe_id,),
-            )
-            row = cursor.fetchone()
-            return dict(zip(["description", "lore", "rules"], row)) if row else {}
+        settings = await fetch_universe_settings(universe_id)
     except Exception as e:
         raise RuntimeError(f"세계관 설정 조회 실패: {e}")
-    finally:
-        release_connection(conn)
+    universe_settings_cache.set(universe_id, settings)
+    return settings
 
 
-def generate_npc_dialogue_with_continue(
-    messages, provider="openai", max_tokens=500, temperature=0.7
-):
+_EMPTY_USAGE = {
+    "input_tokens": 0,
+    "cached_input_tokens": 0,
+    "cache_creation_input_tokens": 0,
+    "output_tokens": 0,
+}
+
+
+@dataclass
+class ContinuationResult:
+    text: str
+    # 호출별 사용량 (extract_usage 형식 + finish_reason, max_tokens)
+    calls: list[dict] = field(default_factory=list)
+    # 예산/횟수 제한으로 응답이 잘린 채 끝났는지 여부
+    truncated: bool = False
+    # 실제로 응답한 provider (헤지로 대체 provider가 응답할 수 있음)
+    provider: str = "openai"
+
+    @property
+    def output_tokens(self):
+        return sum(call["output_tokens"] for call in self.calls)
+
+
+def _continue_params(provider, messages, response_so_far):
+    # 원본 messages는 건드리지 않고 이어쓰기용 요청을 새로 만든다
+    if provider == "openai":
+        return {
+            "messages": messages + [{"role": "assistant", "content": response_so_far}]
+        }
+    # assistant 프리필은 끝 공백을 허용하지 않음
+    prefill = {"role": "assistant", "content": response_so_far.rstrip()}
+    return {**messages, "messages": messages["messages"] + [prefill]}
+
+
+def _initial_params(provider, messages):
+    return {"messages": messages} if provider == "openai" else messages
+
+
+def _with_stream_usage(provider, params):
+    # openai 스트림은 마지막 청크로 사용량을 받는다
     if provider == "openai":
-        npc_response = ""
-        finish_reason = "length"
-
-        while finish_reason == "length":
-            response = ai_client_delegate.generate_response(
-                provider=provider,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=temperature,
-            )
-
-            chunk = response.choices[0].message.content
+        return {**params, "stream_options": {"include_usage": True}}
+    return params
+
+
+async def _request_dialogue(provider, params, fallback=None, **kwargs):
+    # fallback({"provider", "messages"})이 있으면 헤지 요청. 반환값: (응답한 provider, 응답)
+    if not fallback:
+        response = await ai_client_delegate.generate_response(
+            provider=provider, **params, **kwargs
+        )
+        return provider, response
+    fallback_params = _initial_params(fallback["provider"], fallback["messages"])
+    if kwargs.get("stream"):
+        fallback_params = _with_stream_usage(fallback["provider"], fallback_params)
+    return await ai_client_delegate.generate_hedged(
+        (provider, params), (fallback["provider"], fallback_params), **kwargs
+    )
+
+
+async def generate_npc_dialogue_with_continue(
+    messages,
+    provider="openai",
+    max_tokens=500,
+    temperature=0.7,
+    usage_scope=None,
+    fallback=None,
+):
+    # 응답이 잘리면(length/max_tokens) 이어서 생성하되, 총 출력 토큰과 호출 횟수에 상한을 둔다.
+    # fallback이 있으면 첫 호출만 헤지하고, 이어쓰기는 응답한 provider로 계속한다
+    if provider not in ("openai", "claude"):
+        raise ValueError(f"지원하지 않는 provider: {provider}")
+
+    result = ContinuationResult(text="")
+    params = _initial_params(provider, messages)
+    remaining_tokens = MAX_DIALOGUE_OUTPUT_TOKENS
+
+    for continuation_round in range(1, MAX_CONTINUATION_ROUNDS + 1):
+        # 회차별 max_tokens는 남은 출력 예산을 넘지 않게 줄인다
+        round_max_tokens = min(max_tokens, remaining_tokens)
+        if round_max_tokens <= 0:
+            break
+        answered, response = await _request_dialogue(
+            provider,
+            params,
+            fallback if continuation_round == 1 else None,
+            call_type="dialogue",
+            continuation_round=continuation_round,
+            usage_scope=usage_scope,
+            max_tokens=round_max_tokens,
+            temperature=temperature,
+        )
+        if answered != provider:
+            provider, messages = answered, fallback["messages"]
+        if provider == "openai":
+            chunk = response.choices[0].message.content or ""
             finish_reason = response.choices[0].finish_reason
+            truncated = finish_reason == "length"
+        else:
+            chunk = response.content[0].text if response.content else ""
+            finish_reason = response.stop_reason
+            truncated = finish_reason == "max_tokens"
+
+        usage = ai_client_delegate.extract_usage(
+            provider, getattr(response, "usage", None)
+        ) or dict(_EMPTY_USAGE)
+        result.calls.append(
+            {**usage, "finish_reason": finish_reason, "max_tokens": round_max_tokens}
+        )
+        result.text += chunk
+        result.truncated = truncated
+        if not truncated:
+            break
+
+        remaining_tokens -= usage["output_tokens"] or round_max_tokens
+        params = _continue_params(provider, messages, result.text)
+
+    if result.truncated:
+        logger.warning(
+            f"이어쓰기 제한 도달 - 호출 {len(result.calls)}회, 출력 {result.output_tokens}토큰"
+        )
+    result.provider = provider
+    if provider == "claude":
+        result.text = result.text.rstrip()
+    return result
 
-            npc_response += chunk
-            messages.append({"role": "assistant", "content": chunk})
-
-        return npc_response
-
-    elif provider == "claude":
-        complete_response = ""
-        stop_reason = "max_tokens"
-
-        # Claude API 파라미터 구성
-        claude_params = messages.copy()  # build_claude_message에서 반환된 형식 사용
-
-        # stop_reason이 max_tokens인 경우 계속 응답을 생성합니다
-        while stop_reason == "max_tokens":
-            print(f"요청: {claude_params}")
-            response = ai_client_delegate.generate_response(
-                provider=provider,
-                **claude_params,
-                max_tokens=max_tokens,
-                temperature=temperature,
-            )
-
-            print(f"응답: {response}")
-
-            # 응답 추출
-            new_content = response.content[0].text
-            stop_reason = response.stop_reason
-
-            # 공백 제거 - 끝에 있는 공백 문자 제거
-            new_content = new_content.rstrip()
-
-            # 전체 응답에 추가
-            complete_response += new_content
-
-            # 다음 요청을 위해 메시지 업데이트
-            if stop_reason == "max_tokens":
-                # 마지막 메시지가 assistant인지 확인
-                if (
-                    claude_params["messages"]
-                    and claude_params["messages"][-1]["role"] == "assistant"
-                ):
-                    # 기존 assistant 메시지 업데이트
-                    claude_params["messages"][-1]["content"] = complete_response
-                else:
-                    # assistant 메시지 추가
-                    claude_params["messages"].append(
-                        {"role": "assistant", "content": complete_response}
-                    )
-
-        return complete_response
-
-    else:
+
+async def stream_npc_dialogue_with_continue(
+    messages,
+    provider="openai",
+    max_tokens=500,
+    temperature=0.7,
+    usage_scope=None,
+    fallback=None,
+):
+    # 응답을 토큰(델타) 단위로 yield. 잘린 경우 같은 제한 안에서 이어서 스트리밍한다.
+    if provider not in ("openai", "claude"):
         raise ValueError(f"지원하지 않는 provider: {provider}")
+
+    complete_response = ""
+    params = _initial_params(provider, messages)
+    remaining_tokens = MAX_DIALOGUE_OUTPUT_TOKENS
+
+    for continuation_round in range(1, MAX_CONTINUATION_ROUNDS + 1):
+        round_max_tokens = min(max_tokens, remaining_tokens)
+        if round_max_tokens <= 0:
+            break
+        answered, stream = await _request_dialogue(
+            provider,
+            _with_stream_usage(provider, params),
+            fallback if continuation_round == 1 else None,
+            call_type="dialogue",
+            continuation_round=continuation_round,
+            usage_scope=usage_scope,
+            max_tokens=round_max_tokens,
+            temperature=temperature,
+            stream=True,
+        )
+        if answered != provider:
+            provider, messages = answered, fallback["messages"]
+            params = _initial_params(provider, messages)
+
+        truncated = False
+        usage = None
+        async for event in stream:
+            if provider == "openai":
+                # 사용량은 choices가 비어 있는 마지막 청크에 담겨 온다
+                if getattr(event, "usage", None):
+                    usage = ai_client_delegate.extract_usage(provider, event.usage)
+                if not event.choices:
+                    continue
+                choice = event.choices[0]
+                if choice.delta and choice.delta.content:
+                    complete_response += choice.delta.content
+                    yield choice.delta.content
+                if choice.finish_reason:
+                    truncated = choice.finish_reason == "length"
+            elif event.type == "message_start":
+                usage = ai_client_delegate.extract_usage(provider, event.message.usage)
+            elif (
+                event.type == "content_block_delta" and event.delta.type == "text_delta"
+            ):
+                complete_response += event.delta.text
+                yield event.delta.text
+            elif event.type == "message_delta":
+                truncated = event.delta.stop_reason == "max_tokens"
+                if usage:
+                    usage["output_tokens"] = event.usage.output_tokens
+        ai_client_delegate.record_usage(
+            provider,
+            usage,
+            ai_client_delegate.model_for(provider, params),
+            "dialogue",
+            continuation_round,
+            usage_scope,
+        )
+
+        if not truncated:
+            return
+
+        remaining_tokens -= (usage and usage["output_tokens"]) or round_max_tokens
+        params = _continue_params(provider, messages, complete_response)
+
+    logger.warning("이어쓰기 제한 도달 - 스트리밍 응답이 잘린 채 종료됨")
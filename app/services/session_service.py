@@ -1,7 +1,12 @@
+import asyncio
 import json
+import logging
+import os
 import uuid
-from ..database import get_connection, release_connection
 from ..config import ai_client_delegate
+from ..database import acquire
+from ..llm_limiter import LLMOverloadedError
+from ..metrics import PROMPT_BUILD_SECONDS, END_SESSION_STAGE_SECONDS
 from ..prompts import (
     load_prompt_template,
     load_multi_character_prompt_template,
@@ -9,63 +14,98 @@ from ..prompts import (
     load_long_memory_summary_prompt,
     load_important_memory_extract_prompt,
     load_character_prompt,
+    load_scene_summary_prompt,
 )
+from ..repositories.memory_repository import insert_important_memory
+from ..repositories.session_repository import (
+    insert_session,
+    lock_active_session,
+    lock_active_sessions,
+    insert_conversation_turns,
+    insert_conversation_turns_bulk,
+    fetch_active_session_for_end,
+    mark_session_ended,
+    fetch_session_for_consolidation,
+    set_long_memory_once,
+    fetch_scene_summary_state,
+    save_scene_summary,
+)
+from .context_service import (
+    MAX_MEMORY_LENGTH,
+    MULTI_NPC_MEMORY_LENGTH,
+    load_dialogue_context,
+    load_dialogue_contexts,
+)
+from .event_service import get_event_definition, get_event_opener
 from .npc_service import (
-    get_npc_profile,
-    get_universe_settings,
+    get_npc_profiles,
     generate_npc_dialogue_with_continue,
+    stream_npc_dialogue_with_continue,
 )
-from .memory_service import (
-    get_important_memories,
-    get_summary_memory,
-    update_summary_memory,
+from .memory_service import update_summary_memory
+from .token_service import fit_short_memory
+from .usage_service import usage_scope
+from .job_service import job_handler, enqueue_job, get_session_job
+
+logger = logging.getLogger(__name__)
+
+CONSOLIDATE_SESSION_JOB = "consolidate_session"
+COMPACT_SCENE_JOB = "compact_scene"
+
+# 다중 NPC 세션: 요약되지 않은 기록이 이 수를 넘으면 오래된 기록을 장면 요약으로 접는다
+SCENE_SUMMARY_TRIGGER_MESSAGES = int(os.getenv("SCENE_SUMMARY_TRIGGER_MESSAGES", "30"))
+# 요약 후에도 프롬프트에 그대로 남겨 둘 최근 메시지 수
+SCENE_SUMMARY_KEEP_MESSAGES = int(os.getenv("SCENE_SUMMARY_KEEP_MESSAGES", "10"))
+# true면 세션 시작 시 이벤트 도입부를 대화 기록에 미리 저장 (첫 턴에서 만들지 않음)
+EVENT_OPENER_SEED_ON_START = (
+    os.getenv("EVENT_OPENER_SEED_ON_START", "false").lower() == "true"
 )
+# 배치 대화: 한 요청의 최대 항목 수와 동시에 보낼 LLM 호출 수
+BATCH_DIALOGUE_MAX_ITEMS = int(os.getenv("BATCH_DIALOGUE_MAX_ITEMS", "100"))
+BATCH_DIALOGUE_CONCURRENCY = int(os.getenv("BATCH_DIALOGUE_CONCURRENCY", "8"))
+
 
-MAX_MEMORY_LENGTH = 20
+async def _load_event_opener(universe_id, event_id, npc_ids):
+    event = await get_event_definition(event_id)
+    if not event:
+        return ()
+    profiles = await get_npc_profiles(universe_id, npc_ids)
+    npc_names = {
+        npc_id: profiles.get(npc_id, {}).get("name", "알 수 없음") for npc_id in npc_ids
+    }
+    return get_event_opener(universe_id, event_id, event["steps"], npc_names)
 
 
 # 단일 세션 시작
-def start_session(universe_id, npcs, player_id, event_id: uuid.UUID | None = None):
+async def start_session(
+    universe_id, npcs, player_id, event_id: uuid.UUID | None = None
+):
     print(f"세션 시작: {universe_id}, {npcs}, {player_id}, {event_id}")
-    conn = get_connection()
-    print(f"DB 연결: {conn}")
     try:
-        with conn.cursor() as cursor:
-            session_id = str(uuid.uuid4())
-            cursor.execute(
-                """
-                INSERT INTO "ConversationSession" (id, "universeId", "playerId", "shortMemory", status, "eventId")
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """,
-                (
-                    session_id,
-                    universe_id,
-                    player_id,
-                    "[]",
-                    "active",
-                    str(event_id) if event_id is not None else None,
-                ),
-            )
-            for npc_id in npcs:
-                # NPC 세션 생성
-                cursor.execute(
-                    """
-                        INSERT INTO "ConversationSessionNpc" (id, "conversationSessionId", "npcId")
-                        VALUES (%s, %s, %s)
-                        """,
-                    (str(uuid.uuid4()), session_id, str(npc_id)),
-                )
-            conn.commit()
+        session_id = str(uuid.uuid4())
+        npc_ids = [str(npc_id) for npc_id in npcs]
+        event_id = str(event_id) if event_id is not None else None
+
+        # 설정 시 이벤트 도입부를 세션 생성과 함께 대화 기록에 넣어 둔다
+        opening = ()
+        if event_id and EVENT_OPENER_SEED_ON_START:
+            opening = await _load_event_opener(universe_id, event_id, npc_ids)
+
+        await insert_session(
+            session_id, universe_id, player_id, event_id, npc_ids, opening
+        )
         return session_id
     except Exception as e:
-        conn.rollback()
         raise RuntimeError(f"세션 생성 실패: {e}")
-    finally:
-        release_connection(conn)
 
 
-def build_messages(provider, system_prompt, short_memory, player_input):
+def build_messages(
+    provider, system_prompt, short_memory, player_input, system_suffix=None
+):
+    # 고정 부분(system_prompt) 뒤에 자주 바뀌는 부분(system_suffix, 대화 기록, 플레이어 입력) 순서로 배치
     if provider == "openai":
+        if system_suffix:
+            system_prompt = f"{system_prompt}\n\n{system_suffix}"
         messages = [{"role": "system", "content": system_prompt}]
         messages += short_memory
         messages.append({"role": "user", "content": player_input})  # ✔️ 여기만 추가
@@ -73,14 +113,20 @@ def build_messages(provider, system_prompt, short_memory, player_input):
 
     elif provider == "claude":
         return build_claude_message(
-            system_prompt, short_memory
+            system_prompt, short_memory, system_suffix=system_suffix
         )  # ❌ player_input 다시 넣지 않음
 
     else:
         raise ValueError(f"지원하지 않는 provider: {provider}")
 
 
-def build_claude_message(system_prompt, short_memory, player_input=None):
+def _cached_text(text):
+    return {"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}
+
+
+def build_claude_message(
+    system_prompt, short_memory, player_input=None, system_suffix=None
+):
     # Claude API 메시지 포맷 구성
     messages = []
 
@@ -95,531 +141,677 @@ def build_claude_message(system_prompt, short_memory, player_input=None):
     if player_input:
         messages.append({"role": "user", "content": player_input})
 
-    # system 프롬프트를 ephemeral로 설정
-    system = [
-        {"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}
-    ]
+    # 마지막 플레이어 입력 직전까지의 대화 기록을 캐시 (다음 턴에 그대로 재사용됨)
+    if len(messages) >= 2:
+        history_end = messages[-2]
+        messages[-2] = {
+            "role": history_end["role"],
+            "content": [_cached_text(history_end["content"])],
+        }
+
+    # system 프롬프트를 ephemeral로 설정. 장면 요약처럼 가끔 바뀌는 부분은 캐시 블록 뒤에 둔다
+    system = [_cached_text(system_prompt)]
+    if system_suffix:
+        system.append({"type": "text", "text": system_suffix})
 
     return {"system": system, "messages": messages}
 
 
-def generate_single_npc_dialogue(session_id, player_input, provider="openai"):
-    print("generate_single_npc_dialogue")
-    conn = get_connection()
+def append_dialogue_turn(short_memory, player_input, npc_response):
+    # 플레이어 입력과 NPC 응답을 단기 기억에 추가
+    return short_memory + [
+        {"role": "user", "content": player_input},
+        {"role": "assistant", "content": npc_response},
+    ]
+
+
+async def save_dialogue_turn(session_id, turn, player_input, npc_response):
+    # 이번 턴의 메시지 두 개만 ConversationTurn에 추가 (기존 기록은 다시 쓰지 않음).
+    # 세션 행 잠금으로 같은 세션의 저장을 직렬화해 메시지 순서를 보장한다.
+    messages = append_dialogue_turn([], player_input, npc_response)
     try:
-        with conn.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT "universeId", "playerId", "shortMemory", "eventId"
-                FROM "ConversationSession"
-                WHERE id = %s AND status = 'active'
-                """,
-                (session_id,),
-            )
-            session = cursor.fetchone()
-            if not session:
-                return {"error": "세션이 존재하지 않거나 종료됨."}
-
-            cursor.execute(
-                """
-                    SELECT "npcId"
-                    FROM "ConversationSessionNpc"
-                    WHERE "conversationSessionId" = %s
-                """,
-                (session_id,),
-            )
-            npc_ids = cursor.fetchall()
-            if not npc_ids or len(npc_ids) != 1:
-                return {"error": "단일 NPC 세션이 아님 (NPC 수가 1이 아님)."}
-
-            npc_id = npc_ids[0][0]
-
-            universe_id, player_id, short_memory_json, event_id = session
-            print(f"세션 정보: {session}")
-
-            event_goal_description = None
-            event_goal_trigger = None
-            if event_id:
-                cursor.execute(
-                    """
-                    SELECT "goalDescription", "goalTrigger"
-                    FROM "Event"
-                    WHERE id = %s
-                    """,
-                    (event_id,),
-                )
-                row = cursor.fetchone()
-                if row and row[0]:
-                    event_goal_description = row[0]
-                    event_goal_trigger = row[1]
-
-            # 컨텍스트 데이터 조회
-            npc = get_npc_profile(universe_id, npc_id)
-            universe = get_universe_settings(universe_id)
-            important_memories = get_important_memories(universe_id, npc_id, player_id)
-            summary_memory = get_summary_memory(universe_id, npc_id, player_id)
-
-            formatted_important_memories = (
-                "\n".join(f"- {memory}" for memory in important_memories) or "없음"
-            )
+        async with acquire() as conn:
+            async with conn.transaction():
+                has_history = await lock_active_session(session_id, conn)
+                if has_history is None:
+                    raise ValueError("세션이 존재하지 않거나 종료됨.")
+                # 첫 턴이면 이벤트 도입부도 함께 기록
+                if not has_history:
+                    messages = turn["opening"] + messages
+                await insert_conversation_turns(session_id, messages, conn)
+                # 기록이 길어진 다중 NPC 세션은 턴 사이에 장면 요약 작업을 예약
+                if turn.get("compact_scene"):
+                    await enqueue_job(
+                        COMPACT_SCENE_JOB,
+                        session_id,
+                        {"provider": turn["provider"]},
+                        conn,
+                        True,
+                    )
+    except Exception as e:
+        raise RuntimeError(f"단기 기억 저장 실패: {e}")
 
-            npc_prompt_template = load_character_prompt()
-            npc_prompt = npc_prompt_template.format(
-                npc_name=npc["name"],
-                npc_bio=npc["bio"],
-                npc_race=npc["race"],
-                npc_gender=npc["gender"],
-                npc_species=npc["species"],
-                summary_memory=summary_memory,
-                important_memories=formatted_important_memories,
-            )
-            # 프롬프트 템플릿 적용
-            prompt_template = load_prompt_template()
-            system_prompt = prompt_template.format(
-                universe_name=universe.get("name", "알 수 없음"),
-                universe_description=universe.get("description", "알 수 없음"),
-                universe_lore=universe.get("lore", "알 수 없음"),
-                universe_rules=universe.get("rules", "없음"),
-                player_input=player_input,
-                npc_prompt=npc_prompt,
-                dialogue_examples="없음",  # FIXME: 대화 예시 추가
-                event_goal=event_goal_description or "없음",  # 추가
-                goal_trigger=event_goal_trigger or "없음",  # 추가
-            )
+    return append_dialogue_turn(turn["short_memory"], player_input, npc_response)
 
-            # 단기 기억 불러오기
-            try:
-                if isinstance(short_memory_json, str):
-                    short_memory = json.loads(short_memory_json)
-                elif isinstance(short_memory_json, list):
-                    short_memory = short_memory_json
-                else:
-                    short_memory = []
-            except (json.JSONDecodeError, TypeError):
-                short_memory = []
-
-            # EventStep 적용 (단기기억이 없고, event가 연결된 경우)
-            if event_id and len(short_memory) == 0:
-                cursor.execute(
-                    """
-                    SELECT message, "speakerType", "speakerId"
-                    FROM "EventStep"
-                    WHERE "eventId" = %s
-                    ORDER BY "order" ASC
-                    """,
-                    (str(event_id),),
+
+async def save_dialogue_turns(entries):
+    # 배치 대화: 여러 세션의 턴을 한 트랜잭션으로 저장. entries: [(session_id, turn, player_input, npc_response)]
+    # 저장한 세션 id 집합을 반환 (LLM 호출 동안 종료된 세션은 제외)
+    if not entries:
+        return set()
+    try:
+        async with acquire() as conn:
+            async with conn.transaction():
+                active = await lock_active_sessions(
+                    [entry[0] for entry in entries], conn
                 )
-                step_rows = cursor.fetchall()
-                if step_rows:
-                    print(f"이벤트 메시지 {len(step_rows)}개 로드됨")
-                    for step_row in step_rows:
-                        event_message = step_row[0]
-                        speaker_type = step_row[1]
-                        speaker_id = step_row[2]
-                        print(
-                            f"이벤트 메시지: {speaker_type}({speaker_id}) {event_message}"
-                        )
-                        if speaker_type == "PLAYER":
-                            short_memory.append(
-                                {"role": "user", "content": event_message}
-                            )
-                        elif speaker_type == "NPC":
-                            npc_name = (
-                                npc["name"] if speaker_id == npc_id else "알 수 없음"
-                            )
-                            event_message = f"{npc_name}: {event_message}"
-                        else:
-                            event_message = f"{speaker_type}: {event_message}"
-
-                        short_memory.append(
-                            {"role": "assistant", "content": event_message}
+                session_messages = []
+                for session_id, turn, player_input, npc_response in entries:
+                    if session_id not in active:
+                        continue
+                    messages = append_dialogue_turn([], player_input, npc_response)
+                    # 첫 턴이면 이벤트 도입부도 함께 기록
+                    if not active[session_id]:
+                        messages = turn["opening"] + messages
+                    session_messages.append((session_id, messages))
+                    if turn.get("compact_scene"):
+                        await enqueue_job(
+                            COMPACT_SCENE_JOB,
+                            session_id,
+                            {"provider": turn["provider"]},
+                            conn,
+                            True,
                         )
+                await insert_conversation_turns_bulk(session_messages, conn)
+    except Exception as e:
+        raise RuntimeError(f"단기 기억 저장 실패: {e}")
 
-            print(f"단기 기억: {short_memory}")
+    return set(active)
 
-            # Claude 대응: 메시지 구성용 복사본
-            if provider == "claude":
-                short_memory_for_prompt = short_memory.copy()
-                short_memory_for_prompt.append(
-                    {"role": "user", "content": player_input}
-                )
-            else:
-                short_memory_for_prompt = short_memory.copy()
 
-            # 메시지 구성
-            messages = build_messages(
-                provider, system_prompt, short_memory_for_prompt, player_input
-            )
+def _format_npc_prompt(npc_prompt_template, npc):
+    formatted_important_memories = (
+        "\n".join(f"- {memory}" for memory in npc.important_memories) or "없음"
+    )
+    return npc_prompt_template.format(
+        npc_name=npc.name,
+        npc_bio=npc.bio,
+        npc_race=npc.race,
+        npc_gender=npc.gender,
+        npc_species=npc.species,
+        summary_memory=npc.summary_memory,
+        important_memories=formatted_important_memories,
+    )
 
-            # LLM 호출
-            npc_response = generate_npc_dialogue_with_continue(
-                messages, provider=provider
-            )
 
-            # 메모리 업데이트
-            short_memory.append({"role": "user", "content": player_input})
-            short_memory.append({"role": "assistant", "content": npc_response})
-
-            if len(short_memory) > MAX_MEMORY_LENGTH:
-                short_memory = short_memory[-MAX_MEMORY_LENGTH:]
-
-            # DB 반영
-            cursor.execute(
-                """
-                UPDATE "ConversationSession"
-                SET "shortMemory" = %s
-                WHERE id = %s
-                """,
-                (json.dumps(short_memory), session_id),
-            )
-            conn.commit()
+def _provider_messages(
+    provider, system_prompt, short_memory, player_input, system_suffix=None
+):
+    # 메시지 구성용 복사본: 토큰 예산을 넘는 오래된 기록은 제외
+    short_memory_for_prompt = fit_short_memory(
+        short_memory,
+        f"{system_prompt}\n\n{system_suffix}" if system_suffix else system_prompt,
+        player_input,
+        provider,
+    )
+    # Claude 대응: 플레이어 입력을 마지막 메시지로 추가
+    if provider == "claude":
+        short_memory_for_prompt.append({"role": "user", "content": player_input})
 
-        return npc_response
+    # 메시지 구성
+    return build_messages(
+        provider, system_prompt, short_memory_for_prompt, player_input, system_suffix
+    )
 
-    except Exception as e:
-        conn.rollback()
-        print(f"대화 생성 실패: {e}")
-        raise RuntimeError(f"대화 생성 실패: {e}")
-    finally:
-        release_connection(conn)
 
+def _build_turn(context, system_prompt, player_input, provider, system_suffix=None):
+    short_memory = list(context.short_memory)
+    opening = []
+    if context.event_id and len(short_memory) == 0:
+        opening = list(context.event_opener)
+        short_memory = list(opening)
 
-def generate_multi_npc_dialogue(
-    session_id, player_input, provider="openai", response_format="text"
+    messages = _provider_messages(
+        provider, system_prompt, short_memory, player_input, system_suffix
+    )
+    # 다중 NPC 대화는 한 호출이 여러 NPC를 다루므로 NPC 없이 세션/세계관에 귀속
+    npc_id = context.npcs[0].id if len(context.npcs) == 1 else None
+    turn = {
+        "messages": messages,
+        "short_memory": short_memory,
+        "opening": opening,
+        "provider": provider,
+        "usage_scope": usage_scope(context.session_id, context.universe_id, npc_id),
+    }
+    # 헤지 대상 provider가 설정돼 있으면 그 형식의 메시지도 미리 만들어 둔다
+    fallback_provider = ai_client_delegate.hedge_fallback(provider)
+    if fallback_provider:
+        turn["fallback"] = {
+            "provider": fallback_provider,
+            "messages": _provider_messages(
+                fallback_provider,
+                system_prompt,
+                short_memory,
+                player_input,
+                system_suffix,
+            ),
+        }
+    return turn
+
+
+def _build_single_npc_turn(context, player_input, provider="openai"):
+    if len(context.npcs) != 1:
+        return {"error": "단일 NPC 세션이 아님 (NPC 수가 1이 아님)."}
+    npc = context.npcs[0]
+    universe = context.universe
+
+    npc_prompt = _format_npc_prompt(load_character_prompt(), npc)
+    # 프롬프트 템플릿 적용
+    prompt_template = load_prompt_template()
+    system_prompt = prompt_template.format(
+        universe_name=universe.get("name", "알 수 없음"),
+        universe_description=universe.get("description", "알 수 없음"),
+        universe_lore=universe.get("lore", "알 수 없음"),
+        universe_rules=universe.get("rules", "없음"),
+        npc_prompt=npc_prompt,
+        dialogue_examples="없음",  # FIXME: 대화 예시 추가
+        event_goal=context.event_goal_description or "없음",  # 추가
+        goal_trigger=context.event_goal_trigger or "없음",  # 추가
+    )
+    return _build_turn(context, system_prompt, player_input, provider)
+
+
+def _build_multi_npc_turn(
+    context, player_input, provider="openai", response_format="text"
 ):
-    conn = get_connection()
-    try:
-        with conn.cursor() as cursor:
-            # 세션 기본 정보 조회
-            cursor.execute(
-                """
-                SELECT "universeId", "playerId", "shortMemory", "eventId"
-                FROM "ConversationSession"
-                WHERE id = %s AND status = 'active'
-                """,
-                (session_id,),
-            )
-            session = cursor.fetchone()
-            if not session:
-                return {"error": "세션이 존재하지 않거나 종료됨."}
-
-            # 다중 NPC 조회
-            cursor.execute(
-                """
-                    SELECT "npcId"
-                    FROM "ConversationSessionNpc"
-                    WHERE "conversationSessionId" = %s
-                """,
-                (session_id,),
-            )
-            npc_ids = cursor.fetchall()
-            if not npc_ids or len(npc_ids) < 2:
-                return {"error": "다중 NPC 세션이 아님 (NPC 수가 2 미만)."}
-            universe_id, player_id, short_memory_json, event_id = session
-
-            event_goal_description = None
-            event_goal_trigger = None
-            if event_id:
-                cursor.execute(
-                    """
-                    SELECT "goalDescription", "goalTrigger"
-                    FROM "Event"
-                    WHERE id = %s
-                    """,
-                    (event_id,),
-                )
-                row = cursor.fetchone()
-                if row and row[0]:
-                    event_goal_description = row[0]
-                    event_goal_trigger = row[1]
-
-            # NPC 리스트 구성
-            npcs = []
-            for npc_id in npc_ids:
-                npc = get_npc_profile(universe_id, npc_id)
-                npc["id"] = npc_id[0]  # NPC ID 추가
-                npcs.append(npc)
-            if not npcs:
-                return {"error": "NPC 정보를 불러오는 데 실패했습니다."}
-
-            # Universe 정보
-            universe = get_universe_settings(universe_id)
-            # NPC별 기억 정보 조회
-            npc_prompt_template = load_character_prompt()
-            npc_profiles = []
-            for npc in npcs:
-                npc_id = npc["id"]
-                summary_memory = get_summary_memory(universe_id, npc_id, player_id)
-                important_memories = get_important_memories(
-                    universe_id, npc_id, player_id
-                )
-                formatted_important_memories = (
-                    "\n".join(f"- {memory}" for memory in important_memories) or "없음"
-                )
-                # NPC 프로필 생성
-                npc_prompt = npc_prompt_template.format(
-                    npc_name=npc["name"],
-                    npc_bio=npc["bio"],
-                    npc_race=npc["race"],
-                    npc_gender=npc["gender"],
-                    npc_species=npc["species"],
-                    summary_memory=summary_memory,
-                    important_memories=formatted_important_memories,
-                )
-                npc_profiles.append(npc_prompt)
-
-            # 프롬프트 템플릿 적용 (다중 캐릭터용)
-            prompt_template = load_multi_character_prompt_template()
-            if response_format == "json":
-                prompt_template = load_multi_character_prompt_template_json()
-            else:
-                prompt_template = load_multi_character_prompt_template()
-
-            system_prompt = prompt_template.format(
-                universe_name=universe.get("name", "알 수 없음"),
-                universe_description=universe.get("description", ""),
-                universe_lore=universe.get("lore", ""),
-                universe_rules=universe.get("rules", ""),
-                npc_profiles="\n\n".join(npc_profiles),
-                player_input=player_input,
-                dialogue_examples="없음",  # FIXME: 대화 예시 추가
-                event_goal=event_goal_description or "없음",  # 추가
-                goal_trigger=event_goal_trigger or "없음",  # 추가
-            )
+    if len(context.npcs) < 2:
+        return {"error": "다중 NPC 세션이 아님 (NPC 수가 2 미만)."}
+    universe = context.universe
+
+    # NPC별 프로필 생성
+    npc_prompt_template = load_character_prompt()
+    npc_profiles = [
+        _format_npc_prompt(npc_prompt_template, npc) for npc in context.npcs
+    ]
 
-            # 단기 기억 불러오기
-            try:
-                if isinstance(short_memory_json, str):
-                    short_memory = json.loads(short_memory_json)
-                elif isinstance(short_memory_json, list):
-                    short_memory = short_memory_json
-                else:
-                    short_memory = []
-            except (json.JSONDecodeError, TypeError):
-                short_memory = []
-
-            # 이벤트 스텝 적용 (shortMemory 비어있고 이벤트 연결된 경우)
-            if event_id and len(short_memory) == 0:
-                cursor.execute(
-                    """
-                    SELECT message, "speakerType", "speakerId"
-                    FROM "EventStep"
-                    WHERE "eventId" = %s
-                    ORDER BY "order" ASC
-                    """,
-                    (str(event_id),),
-                )
-                step_rows = cursor.fetchall()
-                if step_rows:
-                    print(f"이벤트 메시지 {len(step_rows)}개 로드됨")
-                    for step_row in step_rows:
-                        event_message = step_row[0]
-                        speaker_type = step_row[1]
-                        speaker_id = step_row[2]
-                        print(
-                            f"이벤트 메시지: {speaker_type}({speaker_id}) {event_message}"
-                        )
-                        if speaker_type == "PLAYER":
-                            short_memory.append(
-                                {"role": "user", "content": event_message}
-                            )
-                        elif speaker_type == "NPC":
-                            # npcs에서 npc_id를 찾고, 해당 npc의 이름을 가져옴
-                            npc_name = "알 수 없음"
-                            for npc in npcs:
-                                if npc["id"] == speaker_id:
-                                    npc_name = npc["name"]
-                                    break
-                            event_message = f"{npc_name}: {event_message}"
-                            short_memory.append(
-                                {"role": "assistant", "content": event_message}
-                            )
-                        else:
-                            event_message = f"{speaker_type}: {event_message}"
-                            short_memory.append(
-                                {"role": "assistant", "content": event_message}
-                            )
-
-            # Claude용 복사
-            if provider == "claude":
-                short_memory_for_prompt = short_memory.copy()
-                short_memory_for_prompt.append(
-                    {"role": "user", "content": player_input}
-                )
-            else:
-                short_memory_for_prompt = short_memory.copy()
+    # 프롬프트 템플릿 적용 (다중 캐릭터용)
+    if response_format == "json":
+        prompt_template = load_multi_character_prompt_template_json()
+    else:
+        prompt_template = load_multi_character_prompt_template()
+
+    system_prompt = prompt_template.format(
+        universe_name=universe.get("name", "알 수 없음"),
+        universe_description=universe.get("description", ""),
+        universe_lore=universe.get("lore", ""),
+        universe_rules=universe.get("rules", ""),
+        npc_profiles="\n\n".join(npc_profiles),
+        dialogue_examples="없음",  # FIXME: 대화 예시 추가
+        event_goal=context.event_goal_description or "없음",  # 추가
+        goal_trigger=context.event_goal_trigger or "없음",  # 추가
+    )
+    # 장면 요약은 요약 작업마다 바뀌므로 고정 시스템 프롬프트와 분리
+    system_suffix = None
+    if context.scene_summary:
+        system_suffix = f"## Scene So Far\n{context.scene_summary}"
+
+    turn = _build_turn(context, system_prompt, player_input, provider, system_suffix)
+    turn["compact_scene"] = (
+        len(turn["short_memory"]) + 2 > SCENE_SUMMARY_TRIGGER_MESSAGES
+    )
+    return turn
 
-            # 메시지 구성 및 호출
-            messages = build_messages(
-                provider, system_prompt, short_memory_for_prompt, player_input
-            )
-            response = generate_npc_dialogue_with_continue(messages, provider=provider)
-
-            # 메모리 갱신
-            short_memory.append({"role": "user", "content": player_input})
-            short_memory.append({"role": "assistant", "content": response})
-
-            # FIXME: 메모리 제한 해제
-            # if len(short_memory) > MAX_MEMORY_LENGTH:
-            #     short_memory = short_memory[-MAX_MEMORY_LENGTH:]
-
-            cursor.execute(
-                """
-                UPDATE "ConversationSession"
-                SET "shortMemory" = %s
-                WHERE id = %s
-                """,
-                (json.dumps(short_memory), session_id),
-            )
-            conn.commit()
 
-        return response
+def build_dialogue_turn(
+    context, player_input, provider="openai", response_format="text"
+):
+    # 컨텍스트만으로 프롬프트/메시지를 구성 (DB 접근 없음)
+    if context is None:
+        return {"error": "세션이 존재하지 않거나 종료됨."}
+    if not context.npcs:
+        return {"error": "세션에 포함된 NPC가 없습니다."}
+    if any(npc.name is None for npc in context.npcs):
+        return {"error": "NPC 정보를 불러오는 데 실패했습니다."}
 
+    try:
+        if len(context.npcs) == 1:
+            with PROMPT_BUILD_SECONDS.labels("single").time():
+                return _build_single_npc_turn(context, player_input, provider)
+        with PROMPT_BUILD_SECONDS.labels("multi").time():
+            return _build_multi_npc_turn(
+                context, player_input, provider, response_format
+            )
     except Exception as e:
-        conn.rollback()
-        raise RuntimeError(f"다중 대화 생성 실패: {e}")
-    finally:
-        release_connection(conn)
+        raise RuntimeError(f"대화 생성 실패: {e}")
 
 
-def generate_long_memory(short_memory_json, provider="openai"):
+def format_conversation_history(short_memory_json):
     if isinstance(short_memory_json, str):
         short_memory = json.loads(short_memory_json)
     else:
         short_memory = short_memory_json
 
-    memory_text = "\n".join(
+    return "\n".join(
         f"{'플레이어' if msg['role'] == 'user' else 'NPC'}: {msg['content']}"
         for msg in short_memory
     )
 
+
+def _build_long_memory_request(conversation_history):
     long_memory_prompt = load_long_memory_summary_prompt()
-    summary_prompt = long_memory_prompt.format(conversation_history=memory_text)
+    summary_prompt = long_memory_prompt.format(
+        conversation_history=conversation_history
+    )
+    return {
+        "messages": [{"role": "user", "content": summary_prompt}],
+        "max_tokens": 300,
+        "temperature": 0.5,
+    }
+
 
-    response = ai_client_delegate.generate_response(
+def _build_important_memory_request(conversation_history):
+    important_memory_prompt = load_important_memory_extract_prompt()
+    important_prompt = important_memory_prompt.format(
+        conversation_history=conversation_history,
+    )
+    return {
+        "messages": [{"role": "user", "content": important_prompt}],
+        "max_tokens": 150,
+        "temperature": 0.5,
+    }
+
+
+async def generate_long_memory(conversation_history, provider="openai", scope=None):
+    response = await ai_client_delegate.generate_response(
         provider=provider,
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": summary_prompt}],
-        max_tokens=300,
-        temperature=0.5,
+        call_type="long_memory",
+        usage_scope=scope,
+        **_build_long_memory_request(conversation_history),
     )
-    return response.choices[0].message.content
+    return ai_client_delegate.response_text(provider, response)
 
 
-def extract_important_memory(short_memory_json, provider="openai"):
-    if isinstance(short_memory_json, str):
-        short_memory = json.loads(short_memory_json)
-    else:
-        short_memory = short_memory_json
+async def extract_important_memory(conversation_history, provider="openai", scope=None):
+    response = await ai_client_delegate.generate_response(
+        provider=provider,
+        call_type="important_memory",
+        usage_scope=scope,
+        **_build_important_memory_request(conversation_history),
+    )
+    return ai_client_delegate.response_text(provider, response).strip()
 
-    memory_text = "\n".join(
-        f"{'플레이어' if msg['role'] == 'user' else 'NPC'}: {msg['content']}"
-        for msg in short_memory
+
+def _consolidation_history(short_memory_json, scene_summary, provider):
+    # 기억 정리에 넘길 대화 기록: (다중 NPC) 장면 요약 + 토큰 예산 안의 최근 메시지.
+    # 조회 단계에서 메시지 수를 제한하고(단일 NPC), 여기서 토큰 수로 한 번 더 자른다
+    if isinstance(short_memory_json, str):
+        short_memory_json = json.loads(short_memory_json)
+    scene = f"[지금까지의 장면 요약]\n{scene_summary}\n\n" if scene_summary else ""
+    short_memory = fit_short_memory(
+        short_memory_json or [],
+        load_long_memory_summary_prompt() + scene,
+        "",
+        provider,
     )
+    return scene + format_conversation_history(short_memory)
 
-    important_memory_prompt = load_important_memory_extract_prompt()
-    important_prompt = important_memory_prompt.format(
-        conversation_history=memory_text,
+
+async def extract_session_memories(
+    short_memory_json, provider="openai", scope=None, scene_summary=None
+):
+    # 대화 기록은 한 번만 만들고, 장기 기억 요약과 중요 기억 추출을 동시에 요청
+    conversation_history = _consolidation_history(
+        short_memory_json, scene_summary, provider
+    )
+    return await asyncio.gather(
+        generate_long_memory(conversation_history, provider, scope),
+        extract_important_memory(conversation_history, provider, scope),
     )
 
-    response = ai_client_delegate.generate_response(
+
+def _build_scene_summary_request(scene_summary, conversation_history):
+    scene_summary_prompt = load_scene_summary_prompt()
+    prompt = scene_summary_prompt.format(
+        scene_summary=scene_summary or "없음",
+        conversation_history=conversation_history,
+    )
+    return {
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": 500,
+        "temperature": 0.5,
+    }
+
+
+@job_handler(COMPACT_SCENE_JOB)
+async def compact_scene_summary(job):
+    # 최근 기록만 남기고 그 이전 기록을 기존 장면 요약에 합친다
+    session_id = job["sessionId"]
+    # 대화에 쓰던 provider로 요약 (모델은 호출 유형별 설정 LLM_MODELS의 scene_summary)
+    provider = job["payload"].get("provider", "openai")
+    state = await fetch_scene_summary_state(session_id)
+    if not state:
+        return  # 이미 종료된 세션
+
+    turns = state["turns"] or []
+    if len(turns) <= SCENE_SUMMARY_KEEP_MESSAGES:
+        return
+    folded = turns[: len(turns) - SCENE_SUMMARY_KEEP_MESSAGES]
+
+    response = await ai_client_delegate.generate_response(
         provider=provider,
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": important_prompt}],
-        max_tokens=150,
-        temperature=0.5,
+        call_type="scene_summary",
+        usage_scope=usage_scope(session_id, state["universeId"]),
+        **_build_scene_summary_request(
+            state["content"], format_conversation_history(folded)
+        ),
     )
-    return response.choices[0].message.content.strip()
+    summary = ai_client_delegate.response_text(provider, response).strip()
 
+    if not await save_scene_summary(
+        session_id, summary, folded[-1]["id"], state["coveredTurnId"]
+    ):
+        logger.info(f"장면 요약이 이미 갱신되어 저장 생략: {session_id}")
 
-def end_session(session_id):
-    conn = get_connection()
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT "universeId", "npcId", "playerId", "shortMemory"
-                FROM "ConversationSession"
-                WHERE id = %s AND status = 'active'
-            """,
-                (str(session_id),),
-            )
-            session = cursor.fetchone()
-            if not session:
-                raise ValueError("세션이 존재하지 않거나 종료됨.")
 
-            universe_id, npc_id, player_id, short_memory_json = session
-
-            long_memory = generate_long_memory(short_memory_json)
-            important_memory = extract_important_memory(short_memory_json)
+async def _close_session(
+    session_id, universe_id, npc_id, player_id, long_memory, important_memory
+):
+    async with acquire() as conn:
+        async with conn.transaction():
+            # LLM 호출 동안 다른 요청이 먼저 종료했다면 중복 저장하지 않음
+            if not await mark_session_ended(str(session_id), long_memory, conn):
+                raise ValueError("세션이 존재하지 않거나 종료됨.")
 
             if important_memory != "false":
-                cursor.execute(
-                    """
-                    INSERT INTO "ImportantMemory" (id, "universeId", "npcId", "playerId", content)
-                    VALUES (%s, %s, %s, %s, %s)
-                """,
-                    (
-                        str(uuid.uuid4()),
-                        str(universe_id),
-                        str(npc_id),
-                        str(player_id),
-                        important_memory,
-                    ),
+                await insert_important_memory(
+                    str(universe_id),
+                    str(npc_id),
+                    str(player_id),
+                    important_memory,
+                    conn,
                 )
 
-            cursor.execute(
-                """
-                UPDATE "ConversationSession"
-                SET status = 'ended', "longMemory" = %s, "endedAt" = NOW()
-                WHERE id = %s
-            """,
-                (long_memory, str(session_id)),
+
+def _end_session_result(long_memory, important_memory):
+    return {
+        "status": "ended",
+        "long_memory": long_memory,
+        "important_memory": (important_memory if important_memory != "false" else None),
+    }
+
+
+async def end_session(session_id, provider="openai"):
+    # 정리 작업에 쓸 LLM 대기열이 가득 찼으면 세션을 건드리기 전에 거절 (LLMOverloadedError)
+    ai_client_delegate.check_admission(provider, "long_memory")
+    ai_client_delegate.check_admission(provider, "important_memory")
+    session = await fetch_active_session_for_end(
+        str(session_id), MAX_MEMORY_LENGTH, MULTI_NPC_MEMORY_LENGTH
+    )
+    if not session:
+        raise ValueError("세션이 존재하지 않거나 종료됨.")
+
+    universe_id, npc_id, player_id, short_memory_json, scene_summary = session
+    scope = usage_scope(str(session_id), universe_id, npc_id)
+    try:
+        with END_SESSION_STAGE_SECONDS.labels("extract").time():
+            long_memory, important_memory = await extract_session_memories(
+                short_memory_json, provider, scope, scene_summary
             )
-            conn.commit()
 
-            update_summary_memory(str(universe_id), str(npc_id), str(player_id))
+        with END_SESSION_STAGE_SECONDS.labels("save").time():
+            await _close_session(
+                session_id,
+                universe_id,
+                npc_id,
+                player_id,
+                long_memory,
+                important_memory,
+            )
 
-        return {
-            "status": "ended",
-            "long_memory": long_memory,
-            "important_memory": (
-                important_memory if important_memory != "false" else None
-            ),
-        }
+        with END_SESSION_STAGE_SECONDS.labels("summary").time():
+            await update_summary_memory(
+                str(universe_id), str(npc_id), str(player_id), scope
+            )
+    except ValueError:
+        raise
+    except LLMOverloadedError:
+        # 라우트에서 Retry-After와 함께 429로 응답
+        raise
     except Exception as e:
-        conn.rollback()
         raise RuntimeError(f"세션 종료 실패: {e}")
-    finally:
-        release_connection(conn)
+
+    return _end_session_result(long_memory, important_memory)
+
+
+async def end_session_in_background(session_id, provider="openai"):
+    # 세션을 즉시 종료 처리하고, 기억 정리(LLM 호출)는 작업 큐에 맡긴다
+    try:
+        async with acquire() as conn:
+            async with conn.transaction():
+                if not await mark_session_ended(str(session_id), "", conn):
+                    raise ValueError("세션이 존재하지 않거나 종료됨.")
+                job_id = await enqueue_job(
+                    CONSOLIDATE_SESSION_JOB,
+                    str(session_id),
+                    {"provider": provider},
+                    conn,
+                )
+    except ValueError:
+        raise
+    except LLMOverloadedError:
+        # 라우트에서 Retry-After와 함께 429로 응답
+        raise
+    except Exception as e:
+        raise RuntimeError(f"세션 종료 실패: {e}")
+
+    return {"status": "ended", "job_id": job_id, "job_status": "queued"}
 
 
-def generate_npc_dialogue(
+@job_handler(CONSOLIDATE_SESSION_JOB)
+async def consolidate_session_memory(job):
+    session_id = job["sessionId"]
+    provider = job["payload"].get("provider", "openai")
+
+    session = await fetch_session_for_consolidation(
+        session_id, MAX_MEMORY_LENGTH, MULTI_NPC_MEMORY_LENGTH
+    )
+    if not session:
+        raise ValueError(f"세션이 존재하지 않음: {session_id}")
+    (
+        universe_id,
+        npc_id,
+        player_id,
+        short_memory_json,
+        scene_summary,
+        long_memory,
+    ) = session
+    scope = usage_scope(session_id, universe_id, npc_id)
+
+    # 이전 시도에서 장기/중요 기억 저장까지 끝났다면 요약 갱신만 다시 수행
+    if not long_memory:
+        with END_SESSION_STAGE_SECONDS.labels("extract").time():
+            long_memory, important_memory = await extract_session_memories(
+                short_memory_json, provider, scope, scene_summary
+            )
+
+        with END_SESSION_STAGE_SECONDS.labels("save").time():
+            async with acquire() as conn:
+                async with conn.transaction():
+                    saved = await set_long_memory_once(session_id, long_memory, conn)
+                    if saved and important_memory != "false":
+                        await insert_important_memory(
+                            str(universe_id),
+                            str(npc_id),
+                            str(player_id),
+                            important_memory,
+                            conn,
+                        )
+
+    with END_SESSION_STAGE_SECONDS.labels("summary").time():
+        await update_summary_memory(
+            str(universe_id), str(npc_id), str(player_id), scope
+        )
+
+
+async def get_session_consolidation_status(session_id):
+    return await get_session_job(str(session_id), CONSOLIDATE_SESSION_JOB)
+
+
+async def prepare_npc_dialogue(
     session_id, player_input, provider="openai", response_format="text"
 ):
-    conn = get_connection()
+    # LLM 호출(또는 스트리밍 응답 시작) 전에 세션 검증과 메시지 구성을 끝낸다.
+    # 대화 LLM 대기열이 가득 찼으면 컨텍스트를 읽기 전에 거절 (LLMOverloadedError)
+    ai_client_delegate.check_admission(provider, "dialogue")
+    context = await load_dialogue_context(session_id)
+    return build_dialogue_turn(context, player_input, provider, response_format)
+
+
+async def generate_npc_dialogue(
+    session_id, player_input, provider="openai", response_format="text"
+):
+    turn = await prepare_npc_dialogue(
+        session_id, player_input, provider, response_format
+    )
+    if turn.get("error"):
+        return turn
+
     try:
-        with conn.cursor() as cursor:
-            cursor.execute(
-                """
-                    SELECT COUNT(*) FROM "ConversationSessionNpc"
-                    WHERE "conversationSessionId" = %s
-                """,
-                (session_id,),
-            )
-            npc_count = cursor.fetchone()[0]
-            if npc_count == 1:
-                return generate_single_npc_dialogue(
-                    session_id, player_input, provider, response_format
-                )
-            elif npc_count > 1:
-                return generate_multi_npc_dialogue(
-                    session_id, player_input, provider, response_format
-                )
-            else:
-                return {"error": "세션에 포함된 NPC가 없습니다."}
+        # LLM 호출
+        completion = await generate_npc_dialogue_with_continue(
+            turn["messages"],
+            provider=provider,
+            usage_scope=turn["usage_scope"],
+            fallback=turn.get("fallback"),
+        )
+        npc_response = completion.text
+        logger.info(
+            f"LLM 호출 {len(completion.calls)}회 ({completion.provider}), "
+            f"출력 {completion.output_tokens}토큰"
+        )
+
+        # 메모리 업데이트 및 DB 반영
+        await save_dialogue_turn(session_id, turn, player_input, npc_response)
+    except LLMOverloadedError:
+        # 저장 전이므로 그대로 올려 보내 429로 응답 (클라이언트가 같은 턴을 다시 보낼 수 있음)
+        raise
     except Exception as e:
-        conn.rollback()
+        print(f"대화 생성 실패: {e}")
         raise RuntimeError(f"대화 생성 실패: {e}")
-    finally:
-        release_connection(conn)
+
+    return npc_response
+
+
+def _batch_error(session_id, status, detail, **extra):
+    return {"session_id": session_id, "status": status, "error": detail, **extra}
+
+
+async def generate_npc_dialogue_batch(items, provider="openai", response_format="text"):
+    # items: [(session_id, player_input)]. 컨텍스트는 한 번에 조회하고, LLM 호출은 동시에 최대
+    # BATCH_DIALOGUE_CONCURRENCY개, 저장은 한 트랜잭션으로 한다.
+    # 결과는 입력 순서대로 {"session_id", "dialogue"} 또는 {"session_id", "status", "error"}
+    if len(items) > BATCH_DIALOGUE_MAX_ITEMS:
+        raise ValueError(f"배치 항목은 최대 {BATCH_DIALOGUE_MAX_ITEMS}개입니다.")
+    if not items:
+        return []
+    ai_client_delegate.check_admission(provider, "dialogue")
+    contexts = await load_dialogue_contexts({session_id for session_id, _ in items})
+
+    results = [None] * len(items)
+    turns = {}
+    seen = set()
+    for index, (session_id, player_input) in enumerate(items):
+        # 같은 세션의 턴이 둘이면 순서를 정할 수 없으므로 첫 항목만 처리
+        if session_id in seen:
+            results[index] = _batch_error(
+                session_id, 400, "같은 세션이 배치에 여러 번 포함됨."
+            )
+            continue
+        seen.add(session_id)
+        try:
+            turn = build_dialogue_turn(
+                contexts[session_id], player_input, provider, response_format
+            )
+        except Exception as e:
+            results[index] = _batch_error(session_id, 500, str(e))
+            continue
+        if turn.get("error"):
+            results[index] = _batch_error(session_id, 404, turn["error"])
+            continue
+        turns[index] = turn
+
+    semaphore = asyncio.Semaphore(BATCH_DIALOGUE_CONCURRENCY)
+
+    async def complete(turn):
+        async with semaphore:
+            return await generate_npc_dialogue_with_continue(
+                turn["messages"],
+                provider=provider,
+                usage_scope=turn["usage_scope"],
+                fallback=turn.get("fallback"),
+            )
+
+    completions = await asyncio.gather(
+        *(complete(turn) for turn in turns.values()), return_exceptions=True
+    )
+    responses = {}
+    for index, completion in zip(turns, completions):
+        if isinstance(completion, BaseException):
+            logger.error(
+                f"배치 대화 생성 실패 - 세션: {items[index][0]}, 오류: {completion}"
+            )
+        session_id = items[index][0]
+        if isinstance(completion, LLMOverloadedError):
+            results[index] = _batch_error(
+                session_id, 429, str(completion), retry_after=completion.retry_after
+            )
+        elif isinstance(completion, BaseException):
+            results[index] = _batch_error(
+                session_id, 500, f"대화 생성 실패: {completion}"
+            )
+        else:
+            responses[index] = completion.text
+
+    # 응답을 받은 턴을 한 트랜잭션으로 저장
+    try:
+        saved = await save_dialogue_turns(
+            [
+                (items[index][0], turns[index], items[index][1], npc_response)
+                for index, npc_response in responses.items()
+            ]
+        )
+        unsaved = (404, "세션이 존재하지 않거나 종료됨.")
+    except Exception as e:
+        logger.error(f"배치 대화 저장 실패 - {len(responses)}건: {e}")
+        saved, unsaved = set(), (500, str(e))
+    for index, npc_response in responses.items():
+        session_id = items[index][0]
+        if session_id in saved:
+            results[index] = {"session_id": session_id, "dialogue": npc_response}
+        else:
+            results[index] = _batch_error(session_id, *unsaved)
+
+    failed = [result for result in results if "error" in result]
+    if failed:
+        logger.warning(
+            f"배치 대화 {len(items)}건 중 {len(failed)}건 실패: "
+            + ", ".join(f"{r['session_id']}({r['status']})" for r in failed)
+        )
+    logger.info(f"배치 대화 {len(items)}건 - 성공 {len(items) - len(failed)}건")
+    return results
+
+
+async def stream_npc_dialogue(session_id, player_input, turn, provider="openai"):
+    # 토큰을 그대로 흘려보내고, 스트림이 끝나면 전체 응답을 단기 기억에 저장
+    chunks = []
+    async for delta in stream_npc_dialogue_with_continue(
+        turn["messages"],
+        provider=provider,
+        usage_scope=turn["usage_scope"],
+        fallback=turn.get("fallback"),
+    ):
+        chunks.append(delta)
+        yield delta
+
+    npc_response = "".join(chunks)
+    await save_dialogue_turn(session_id, turn, player_input, npc_response)
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import logging
+import os
+from ..config import LLM_MODELS, resolve_model
+
+try:
+    import tiktoken
+except ImportError:  # 설치되지 않은 환경에서는 추정치 사용
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# 프롬프트(시스템 프롬프트 + 대화 기록 + 플레이어 입력)에 쓸 입력 토큰 예산.
+# CONTEXT_TOKEN_BUDGETS='{"openai": 6000, "gpt-4o": 12000}' 처럼 provider 또는 model 단위로 덮어쓴다 (model 우선)
+DEFAULT_CONTEXT_TOKEN_BUDGETS = {"openai": 6000, "claude": 6000}
+CONTEXT_TOKEN_BUDGETS = {
+    **DEFAULT_CONTEXT_TOKEN_BUDGETS,
+    **json.loads(os.getenv("CONTEXT_TOKEN_BUDGETS", "{}")),
+}
+
+# 메시지마다 붙는 role 구분자 등의 고정 토큰
+MESSAGE_TOKEN_OVERHEAD = 4
+# Claude 토큰 수 추정 계수 (ASCII는 약 3.5자당 1토큰, 한글 등 그 외 문자는 1자당 약 1토큰)
+CLAUDE_ASCII_CHARS_PER_TOKEN = 3.5
+CLAUDE_NON_ASCII_TOKENS_PER_CHAR = 1.0
+
+
+def default_model(provider):
+    # 대화 프롬프트 예산이므로 dialogue 호출 유형의 모델 기준
+    return resolve_model(provider, "dialogue")
+
+
+def get_token_budget(provider, model=None):
+    model = model or default_model(provider)
+    return CONTEXT_TOKEN_BUDGETS.get(model, CONTEXT_TOKEN_BUDGETS.get(provider))
+
+
+# model -> tiktoken 인코딩. 시작 시 preload_encodings가 채우며, 로드 전이거나 실패한 model은 추정치 사용
+_encodings = {}
+
+
+def _load_encoding(model):
+    # 인코딩 파일을 내려받을 수 있으므로 요청 처리 중에는 호출하지 않는다 (preload_encodings 전용)
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken 인코딩 로드 실패, 추정치 사용 ({model}): {e}")
+        return None
+
+
+async def preload_encodings():
+    # 설정된 openai 모델의 인코딩을 스레드에서 미리 로드 (이벤트 루프를 막지 않음)
+    models = {group.get("openai") for group in LLM_MODELS.values()} - {None}
+    for model in sorted(models):
+        encoding = await asyncio.to_thread(_load_encoding, model)
+        if encoding is not None:
+            _encodings[model] = encoding
+    logger.info(f"tiktoken 인코딩 로드 완료: {sorted(_encodings)}")
+
+
+def estimate_tokens(text):
+    ascii_chars = sum(1 for char in text if char.isascii())
+    other_chars = len(text) - ascii_chars
+    return int(
+        ascii_chars / CLAUDE_ASCII_CHARS_PER_TOKEN
+        + other_chars * CLAUDE_NON_ASCII_TOKENS_PER_CHAR
+        + 0.5
+    )
+
+
+def count_tokens(text, provider="openai", model=None):
+    if not text:
+        return 0
+    if provider == "openai":
+        encoding = _encodings.get(model or default_model(provider))
+        if encoding is not None:
+            return len(encoding.encode(text))
+    return estimate_tokens(text)
+
+
+def count_message_tokens(message, provider="openai", model=None):
+    return count_tokens(message["content"], provider, model) + MESSAGE_TOKEN_OVERHEAD
+
+
+def fit_short_memory(
+    short_memory, system_prompt, player_input, provider="openai", model=None
+):
+    # 시스템 프롬프트와 플레이어 입력을 먼저 확보하고, 남은 예산 안에서 최근 메시지부터 채운다.
+    # 예산을 넘는 오래된 메시지는 버린다.
+    budget = get_token_budget(provider, model)
+    remaining = (
+        budget
+        - count_tokens(system_prompt, provider, model)
+        - count_tokens(player_input, provider, model)
+        - 2 * MESSAGE_TOKEN_OVERHEAD
+    )
+
+    kept = []
+    for message in reversed(short_memory):
+        tokens = count_message_tokens(message, provider, model)
+        if tokens > remaining:
+            break
+        remaining -= tokens
+        kept.append(message)
+    kept.reverse()
+
+    if len(kept) < len(short_memory):
+        logger.info(
+            f"토큰 예산({budget})으로 대화 기록 {len(short_memory) - len(kept)}개 제외"
+        )
+    return kept
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from ..config import ai_client_delegate
+from ..repositories.usage_repository import (
+    USAGE_GROUP_COLUMNS,
+    insert_usage_records,
+    fetch_usage_summary,
+)
+
+logger = logging.getLogger(__name__)
+
+# 사용량 원장 배치 저장 설정 (환경변수로 조정)
+LLM_USAGE_BATCH_SIZE = int(os.getenv("LLM_USAGE_BATCH_SIZE", "50"))
+LLM_USAGE_FLUSH_SECONDS = float(os.getenv("LLM_USAGE_FLUSH_SECONDS", "5"))
+# DB 장애로 저장이 밀릴 때 메모리에 들고 있을 최대 기록 수 (넘으면 오래된 것부터 버림)
+LLM_USAGE_MAX_PENDING = int(os.getenv("LLM_USAGE_MAX_PENDING", "10000"))
+
+# 모델별 100만 토큰당 단가(USD). LLM_TOKEN_PRICES(JSON)로 모델 단위 덮어쓰기
+_DEFAULT_TOKEN_PRICES = {
+    "gpt-4-turbo": {"input": 10.0, "cached_input": 10.0, "output": 30.0},
+    "gpt-3.5-turbo": {"input": 0.5, "cached_input": 0.5, "output": 1.5},
+    "claude-3-5-haiku-20241022": {
+        "input": 0.8,
+        "cached_input": 0.08,
+        "cache_creation_input": 1.0,
+        "output": 4.0,
+    },
+    "claude-3-7-sonnet-20250219": {
+        "input": 3.0,
+        "cached_input": 0.3,
+        "cache_creation_input": 3.75,
+        "output": 15.0,
+    },
+}
+LLM_TOKEN_PRICES = {
+    **_DEFAULT_TOKEN_PRICES,
+    **json.loads(os.getenv("LLM_TOKEN_PRICES", "{}")),
+}
+
+
+def usage_scope(session_id=None, universe_id=None, npc_id=None):
+    # 사용량을 어디에 귀속시킬지 (generate_response의 usage_scope 인자)
+    return {"session_id": session_id, "universe_id": universe_id, "npc_id": npc_id}
+
+
+def estimate_cost(model, usage):
+    # 단가를 모르는 모델이면 None
+    prices = LLM_TOKEN_PRICES.get(model)
+    if not prices:
+        return None
+    cached = usage["cached_input_tokens"]
+    created = usage["cache_creation_input_tokens"]
+    uncached = usage["input_tokens"] - cached - created
+    cost = (
+        uncached * prices["input"]
+        + cached * prices.get("cached_input", prices["input"])
+        + created * prices.get("cache_creation_input", prices["input"])
+        + usage["output_tokens"] * prices["output"]
+    )
+    return round(cost / 1_000_000, 6)
+
+
+class UsageLedger:
+    # LLM 호출마다 사용량을 메모리에 모았다가 일정 개수/주기마다 한 번에 저장한다.
+    # 요청 경로에서는 DB에 쓰지 않으며, 종료 시 남은 기록을 저장한다.
+
+    def __init__(self, batch_size, flush_interval, max_pending):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = []
+        self._task = None
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def record(self, provider, model, call_type, continuation_round, usage, scope):
+        scope = scope or {}
+        self._pending.append(
+            {
+                "session_id": scope.get("session_id"),
+                "universe_id": scope.get("universe_id"),
+                "npc_id": scope.get("npc_id"),
+                "call_type": call_type,
+                "provider": provider,
+                "model": model,
+                "round": continuation_round,
+                **usage,
+                "cost_usd": estimate_cost(model, usage),
+                "created_at": datetime.now(timezone.utc),
+            }
+        )
+        overflow = len(self._pending) - self.max_pending
+        if overflow > 0:
+            del self._pending[:overflow]
+            logger.warning(f"사용량 기록 {overflow}건 버림 (저장 지연)")
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self):
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[: self.batch_size]
+                try:
+                    await insert_usage_records(batch)
+                except Exception as e:
+                    # 다음 주기에 다시 시도
+                    logger.error(f"사용량 기록 저장 실패 ({len(batch)}건): {e}")
+                    return
+                del self._pending[: len(batch)]
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+
+usage_ledger = UsageLedger(
+    LLM_USAGE_BATCH_SIZE, LLM_USAGE_FLUSH_SECONDS, LLM_USAGE_MAX_PENDING
+)
+# 대리자가 호출마다 기록할 원장 (job_handler처럼 모듈 로드 시 등록)
+ai_client_delegate.usage_ledger = usage_ledger
+
+
+async def get_usage_summary(
+    group_by,
+    universe_id=None,
+    session_id=None,
+    npc_id=None,
+    call_type=None,
+    since=None,
+    until=None,
+    limit=100,
+):
+    # group_by: "universe,call_type"처럼 쉼표로 구분한 집계 기준
+    keys = [key.strip() for key in group_by.split(",") if key.strip()]
+    unknown = [key for key in keys if key not in USAGE_GROUP_COLUMNS]
+    if not keys or unknown:
+        raise ValueError(
+            f"지원하지 않는 집계 기준: {', '.join(unknown) or group_by!r} "
+            f"(가능: {', '.join(USAGE_GROUP_COLUMNS)})"
+        )
+
+    try:
+        # 아직 저장되지 않은 기록도 집계에 포함
+        await usage_ledger.flush()
+        rows = await fetch_usage_summary(
+            keys, universe_id, session_id, npc_id, call_type, since, until, limit
+        )
+    except Exception as e:
+        raise RuntimeError(f"사용량 집계 조회 실패: {e}")
+    return [dict(row) for row in rows]
@@ -0,0 +1,326 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from collections import defaultdict
+import asyncpg
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+# 동시 세션 부하 테스트: start-session → dialogue × N → end-session 을 동시에 실행하고
+# 엔드포인트별 p50/p95/p99, 서버의 DB 쿼리 시간/풀 대기 시간(/metrics 차이)을 출력한다.
+# 서버는 가짜 LLM으로 따로 띄운다:
+#   LLM_BACKEND=fake DATABASE_URL=... uvicorn app.main:app
+#   DATABASE_URL=... python -m bench.run --sessions 200 --concurrency 20
+
+PERCENTILES = (50, 95, 99)
+
+
+async def discover(database_url):
+    # bench.seed로 만든 데이터에서 세계관/NPC/이벤트/플레이어 목록을 읽는다
+    conn = await asyncpg.connect(database_url)
+    try:
+        npcs = await conn.fetch(
+            'SELECT "universeId", array_agg(id ORDER BY id) AS ids FROM "Npc" GROUP BY 1'
+        )
+        events = await conn.fetch('SELECT "universeId", id FROM "Event" ORDER BY id')
+        players = await conn.fetch(
+            'SELECT DISTINCT "playerId" FROM "SummaryMemory" ORDER BY 1'
+        )
+    finally:
+        await conn.close()
+
+    universes = {row["universeId"]: {"npcs": row["ids"], "events": []} for row in npcs}
+    for row in events:
+        if row["universeId"] in universes:
+            universes[row["universeId"]]["events"].append(row["id"])
+    player_ids = [row["playerId"] for row in players]
+    if not universes or not player_ids:
+        raise SystemExit("데이터가 없습니다. 먼저 python -m bench.seed 를 실행하세요.")
+    return universes, player_ids
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+
+    async def call(self, name, request):
+        started = time.perf_counter()
+        try:
+            response = await request
+            status = response.status_code
+        except httpx.HTTPError as e:
+            response, status = None, type(e).__name__
+        self.latencies[name].append(time.perf_counter() - started)
+        if status != 200:
+            self.errors[name][str(status)] += 1
+            return None
+        return response
+
+
+async def run_session(client, recorder, rng, universes, players, args):
+    universe_id = rng.choice(list(universes))
+    universe = universes[universe_id]
+    npc_count = 1
+    if len(universe["npcs"]) > 1 and rng.random() < args.multi_ratio:
+        npc_count = rng.randint(2, min(3, len(universe["npcs"])))
+    body = {
+        "npcs": rng.sample(universe["npcs"], npc_count),
+        "player_id": rng.choice(players),
+    }
+    if universe["events"] and rng.random() < args.event_ratio:
+        body["event_id"] = rng.choice(universe["events"])
+
+    response = await recorder.call(
+        "start-session", client.post(f"/npc/{universe_id}/start-session", json=body)
+    )
+    if response is None:
+        return
+    session_id = response.json()["session_id"]
+
+    params = {"provider": args.provider}
+    for turn in range(args.turns):
+        player_input = f"{turn + 1}번째 질문: 요즘 이 근처에 무슨 일이 있었지?"
+        if args.stream:
+            # 스트림을 끝까지 읽어야 응답 저장까지 포함된 시간이 된다
+            response = await recorder.call(
+                "dialogue/stream",
+                _read_stream(
+                    client, f"/npc/{session_id}/dialogue/stream", player_input, params
+                ),
+            )
+        else:
+            response = await recorder.call(
+                "dialogue",
+                client.post(
+                    f"/npc/{session_id}/dialogue",
+                    json={"player_input": player_input},
+                    params=params,
+                ),
+            )
+        if response is None:
+            return
+
+    end_params = {"background": "true"} if args.background_end else {}
+    await recorder.call(
+        "end-session",
+        client.post(f"/npc/{session_id}/end-session", params=end_params),
+    )
+
+
+async def _read_stream(client, url, player_input, params):
+    async with client.stream(
+        "POST", url, json={"player_input": player_input}, params=params
+    ) as response:
+        await response.aread()
+        return response
+
+
+async def scrape_metrics(client):
+    # 히스토그램의 _sum/_count/_bucket 샘플을 (이름, 라벨) -> 값으로
+    response = await client.get("/metrics")
+    response.raise_for_status()
+    samples = {}
+    for family in text_string_to_metric_families(response.text):
+        for sample in family.samples:
+            samples[(sample.name, tuple(sorted(sample.labels.items())))] = sample.value
+    return samples
+
+
+def diff_samples(before, after):
+    return {key: value - before.get(key, 0.0) for key, value in after.items()}
+
+
+def _sum_samples(samples, name, **labels):
+    return sum(
+        value
+        for (sample_name, sample_labels), value in samples.items()
+        if sample_name == name
+        and all(dict(sample_labels).get(k) == v for k, v in labels.items())
+    )
+
+
+def histogram_quantile(samples, name, q):
+    # Prometheus histogram_quantile과 같은 방식으로 버킷 사이를 선형 보간
+    buckets = sorted(
+        (float(dict(labels)["le"]), value)
+        for (sample_name, labels), value in samples.items()
+        if sample_name == f"{name}_bucket"
+    )
+    if not buckets or buckets[-1][1] <= 0:
+        return None
+    rank = q * buckets[-1][1]
+    lower_bound, lower_count = 0.0, 0.0
+    for upper_bound, count in buckets:
+        if count >= rank:
+            if upper_bound == float("inf"):
+                return lower_bound
+            if count == lower_count:
+                return upper_bound
+            return lower_bound + (upper_bound - lower_bound) * (
+                (rank - lower_count) / (count - lower_count)
+            )
+        lower_bound, lower_count = upper_bound, count
+    return lower_bound
+
+
+def percentile(values, p):
+    # nearest-rank
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, -(-p * len(ordered) // 100) - 1))
+    return ordered[int(index)]
+
+
+def summarize(recorder, server, elapsed, args):
+    endpoints = {}
+    for name, values in recorder.latencies.items():
+        endpoints[name] = {
+            "count": len(values),
+            "errors": dict(recorder.errors[name]),
+            "mean_ms": 1000 * sum(values) / len(values),
+            **{f"p{p}_ms": 1000 * percentile(values, p) for p in PERCENTILES},
+            "max_ms": 1000 * max(values),
+        }
+
+    queries = {}
+    for (name, labels), value in server.items():
+        if name == "db_query_duration_seconds_sum" and value > 0:
+            query = dict(labels)["query"]
+            count = server.get(("db_query_duration_seconds_count", labels), 0)
+            queries[query] = {
+                "count": int(count),
+                "total_ms": 1000 * value,
+                "mean_ms": 1000 * value / count if count else 0.0,
+            }
+
+    pool_count = _sum_samples(server, "db_pool_acquire_duration_seconds_count")
+    pool_sum = _sum_samples(server, "db_pool_acquire_duration_seconds_sum")
+    llm_count = _sum_samples(server, "llm_request_duration_seconds_count")
+    llm_sum = _sum_samples(server, "llm_request_duration_seconds_sum")
+    requests = sum(endpoint["count"] for endpoint in endpoints.values())
+    return {
+        "config": vars(args),
+        "elapsed_s": elapsed,
+        "requests_per_s": requests / elapsed if elapsed else 0.0,
+        "endpoints": endpoints,
+        "db": {
+            "query_count": int(sum(q["count"] for q in queries.values())),
+            "query_total_ms": sum(q["total_ms"] for q in queries.values()),
+            "queries": dict(
+                sorted(queries.items(), key=lambda item: -item[1]["total_ms"])
+            ),
+            "pool_acquire_count": int(pool_count),
+            "pool_wait_total_ms": 1000 * pool_sum,
+            "pool_wait_mean_ms": 1000 * pool_sum / pool_count if pool_count else 0.0,
+            **{
+                f"pool_wait_p{p}_ms": 1000
+                * (
+                    histogram_quantile(
+                        server, "db_pool_acquire_duration_seconds", p / 100
+                    )
+                    or 0.0
+                )
+                for p in PERCENTILES
+            },
+        },
+        "llm": {
+            "calls": int(llm_count),
+            "mean_ms": 1000 * llm_sum / llm_count if llm_count else 0.0,
+        },
+    }
+
+
+def print_report(report):
+    print(
+        f"\n총 {report['elapsed_s']:.1f}초, {report['requests_per_s']:.1f} req/s "
+        f"(세션 {report['config']['sessions']}개, 동시 {report['config']['concurrency']})"
+    )
+    header = f"{'endpoint':<18}{'count':>7}{'err':>6}{'mean':>9}"
+    header += "".join(f"{'p' + str(p):>9}" for p in PERCENTILES) + f"{'max':>9}"
+    print(header + "  (ms)")
+    for name, stats in report["endpoints"].items():
+        errors = sum(stats["errors"].values())
+        line = f"{name:<18}{stats['count']:>7}{errors:>6}{stats['mean_ms']:>9.1f}"
+        line += "".join(f"{stats[f'p{p}_ms']:>9.1f}" for p in PERCENTILES)
+        print(line + f"{stats['max_ms']:>9.1f}")
+        if errors:
+            print(f"  오류: {stats['errors']}")
+
+    db = report["db"]
+    print(
+        f"\nDB 쿼리 {db['query_count']}회, 총 {db['query_total_ms']:.0f}ms / "
+        f"풀 대기 {db['pool_acquire_count']}회, 평균 {db['pool_wait_mean_ms']:.2f}ms, "
+        + ", ".join(f"p{p} {db[f'pool_wait_p{p}_ms']:.2f}ms" for p in PERCENTILES)
+    )
+    for query, stats in list(db["queries"].items())[:8]:
+        print(
+            f"  {query:<36}{stats['count']:>7}회 "
+            f"총 {stats['total_ms']:>9.1f}ms 평균 {stats['mean_ms']:>7.2f}ms"
+        )
+    llm = report["llm"]
+    print(f"LLM 호출 {llm['calls']}회, 평균 {llm['mean_ms']:.1f}ms")
+
+
+async def main(args):
+    universes, players = await discover(args.database_url)
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=args.base_url, timeout=args.timeout, limits=limits
+    ) as client:
+        before = await scrape_metrics(client)
+        # 세션마다 독립된 난수 시드를 미리 뽑아 동시 실행 순서와 관계없이 같은 시나리오 유지
+        seeds = [rng.getrandbits(32) for _ in range(args.sessions)]
+        queue = asyncio.Queue()
+        for seed in seeds:
+            queue.put_nowait(seed)
+
+        async def worker():
+            while not queue.empty():
+                session_rng = random.Random(queue.get_nowait())
+                await run_session(
+                    client, recorder, session_rng, universes, players, args
+                )
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        after = await scrape_metrics(client)
+
+    report = summarize(recorder, diff_samples(before, after), elapsed, args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n결과 저장: {args.json}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="동시 세션 부하 테스트")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=5, help="세션당 대화 턴 수")
+    parser.add_argument("--multi-ratio", type=float, default=0.3)
+    parser.add_argument("--event-ratio", type=float, default=0.3)
+    parser.add_argument("--provider", default="openai", choices=("openai", "claude"))
+    parser.add_argument("--stream", action="store_true", help="스트리밍 대화 사용")
+    parser.add_argument(
+        "--background-end", action="store_true", help="end-session?background=true"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--json", help="결과를 JSON 파일로 저장")
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("DATABASE_URL 또는 --database-url이 필요합니다.")
+    return args
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
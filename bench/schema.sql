@@ -0,0 +1,116 @@
+-- 벤치마크용 기본 스키마. 운영 스키마는 이 저장소 밖에서 관리되므로
+-- 이 서비스가 읽고 쓰는 테이블/컬럼만 같은 이름으로 만든다 (이후 migrations/*.sql 적용).
+CREATE TABLE IF NOT EXISTS "Universe" (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS "UniverseSetting" (
+    id TEXT PRIMARY KEY,
+    "universeId" TEXT NOT NULL UNIQUE REFERENCES "Universe"(id) ON DELETE CASCADE,
+    description TEXT,
+    lore TEXT,
+    rules TEXT
+);
+
+CREATE TABLE IF NOT EXISTS "Npc" (
+    id TEXT PRIMARY KEY,
+    "universeId" TEXT NOT NULL REFERENCES "Universe"(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    bio TEXT,
+    race TEXT,
+    gender TEXT,
+    species TEXT,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS "Npc_universeId_idx" ON "Npc" ("universeId");
+
+CREATE TABLE IF NOT EXISTS "Event" (
+    id TEXT PRIMARY KEY,
+    "universeId" TEXT NOT NULL REFERENCES "Universe"(id) ON DELETE CASCADE,
+    name TEXT,
+    type TEXT,
+    scope TEXT,
+    "isRepeatable" BOOLEAN DEFAULT FALSE,
+    "isActive" BOOLEAN DEFAULT TRUE,
+    "goalDescription" TEXT,
+    "goalTrigger" TEXT,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS "EventTrigger" (
+    id TEXT PRIMARY KEY,
+    "eventId" TEXT NOT NULL REFERENCES "Event"(id) ON DELETE CASCADE,
+    type TEXT,
+    config JSONB,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS "EventEffect" (
+    id TEXT PRIMARY KEY,
+    "eventId" TEXT NOT NULL REFERENCES "Event"(id) ON DELETE CASCADE,
+    type TEXT,
+    config JSONB,
+    "order" INTEGER,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS "EventStep" (
+    id TEXT PRIMARY KEY,
+    "eventId" TEXT NOT NULL REFERENCES "Event"(id) ON DELETE CASCADE,
+    "order" INTEGER,
+    message TEXT,
+    "speakerType" TEXT, -- NPC | PLAYER | NARRATOR
+    "speakerId" TEXT
+);
+
+CREATE TABLE IF NOT EXISTS "PlayerEventState" (
+    id TEXT PRIMARY KEY,
+    "eventId" TEXT NOT NULL REFERENCES "Event"(id) ON DELETE CASCADE,
+    "playerId" TEXT,
+    status TEXT,
+    "updatedAt" TIMESTAMP(3) NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS "ConversationSession" (
+    id TEXT PRIMARY KEY,
+    "universeId" TEXT NOT NULL,
+    "playerId" TEXT NOT NULL,
+    "npcId" TEXT,
+    "shortMemory" JSONB,
+    "longMemory" TEXT DEFAULT '',
+    status TEXT,
+    "eventId" TEXT,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT NOW(),
+    "endedAt" TIMESTAMP(3)
+);
+
+CREATE TABLE IF NOT EXISTS "ConversationSessionNpc" (
+    id TEXT PRIMARY KEY,
+    "conversationSessionId" TEXT NOT NULL REFERENCES "ConversationSession"(id) ON DELETE CASCADE,
+    "npcId" TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS "ConversationSessionNpc_conversationSessionId_idx"
+    ON "ConversationSessionNpc" ("conversationSessionId");
+
+CREATE TABLE IF NOT EXISTS "ImportantMemory" (
+    id TEXT PRIMARY KEY,
+    "universeId" TEXT,
+    "npcId" TEXT,
+    "playerId" TEXT,
+    content TEXT,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS "ImportantMemory_universeId_npcId_playerId_idx"
+    ON "ImportantMemory" ("universeId", "npcId", "playerId");
+
+CREATE TABLE IF NOT EXISTS "SummaryMemory" (
+    id TEXT PRIMARY KEY,
+    "universeId" TEXT,
+    "npcId" TEXT,
+    "playerId" TEXT,
+    content TEXT,
+    "updatedAt" TIMESTAMP(3),
+    UNIQUE ("universeId", "npcId", "playerId")
+);
@@ -0,0 +1,221 @@
+import argparse
+import asyncio
+import os
+import random
+import uuid
+from pathlib import Path
+import asyncpg
+
+# 벤치마크용 로컬 Postgres 준비: 기본 스키마 + migrations 적용 후 합성 데이터 생성.
+# 같은 --seed면 항상 같은 id/내용이 만들어진다.
+#   DATABASE_URL=postgresql://... python -m bench.seed --reset
+
+ROOT = Path(__file__).resolve().parent.parent
+SCHEMA_FILE = ROOT / "bench" / "schema.sql"
+MIGRATIONS_DIR = ROOT / "migrations"
+
+# --reset 시 비우는 테이블 (참조하는 쪽은 CASCADE로 함께 비워짐)
+DATA_TABLES = (
+    "Universe",
+    "ConversationSession",
+    "ImportantMemory",
+    "SummaryMemory",
+    "BackgroundJob",
+    "LlmUsageLedger",
+)
+
+_SENTENCES = (
+    "오래된 왕국의 북쪽 끝에는 눈이 녹지 않는 산맥이 있다.",
+    "마을 사람들은 밤마다 숲에서 들려오는 노랫소리를 두려워한다.",
+    "상인 길드는 항구의 세금을 두고 영주와 다투고 있다.",
+    "마법은 피를 대가로 하며, 함부로 쓰는 자는 기억을 잃는다.",
+    "강 건너의 폐허에는 아직 아무도 읽지 못한 비문이 남아 있다.",
+    "기사단은 해마다 봄이 오면 국경의 탑을 순찰한다.",
+    "여관 주인은 손님의 이름을 절대 잊지 않는 것으로 유명하다.",
+    "별이 떨어진 자리에는 푸른 꽃이 피어난다고 전해진다.",
+)
+_NAMES = ("아리아", "보르그", "세린", "다온", "에드릭", "피오나", "가람", "하일")
+_RACES = ("human", "elf", "orc", "dwarf")
+_SPEAKERS = ("NPC", "PLAYER", "NARRATOR")
+
+
+def _uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _text(rng, sentences):
+    return " ".join(rng.choice(_SENTENCES) for _ in range(sentences))
+
+
+def build_dataset(args):
+    rng = random.Random(args.seed)
+    data = {
+        "Universe": [],
+        "UniverseSetting": [],
+        "Npc": [],
+        "Event": [],
+        "EventStep": [],
+        "EventTrigger": [],
+        "EventEffect": [],
+        "ImportantMemory": [],
+        "SummaryMemory": [],
+        "ConversationSession": [],
+    }
+    players = [_uuid(rng) for _ in range(args.players)]
+
+    for u in range(args.universes):
+        universe_id = _uuid(rng)
+        data["Universe"].append((universe_id, f"세계관 {u + 1}"))
+        data["UniverseSetting"].append(
+            (
+                _uuid(rng),
+                universe_id,
+                _text(rng, 3),
+                _text(rng, args.lore_sentences),
+                _text(rng, 4),
+            )
+        )
+
+        npc_ids = []
+        for n in range(args.npcs):
+            npc_id = _uuid(rng)
+            npc_ids.append(npc_id)
+            data["Npc"].append(
+                (
+                    npc_id,
+                    universe_id,
+                    f"{rng.choice(_NAMES)}{n + 1}",
+                    _text(rng, 4),
+                    rng.choice(_RACES),
+                    rng.choice(("male", "female")),
+                    rng.choice(_RACES),
+                )
+            )
+
+        for e in range(args.events):
+            event_id = _uuid(rng)
+            data["Event"].append(
+                (
+                    event_id,
+                    universe_id,
+                    f"이벤트 {e + 1}",
+                    _text(rng, 1),
+                    _text(rng, 1),
+                )
+            )
+            for order in range(1, args.event_steps + 1):
+                speaker = rng.choice(_SPEAKERS)
+                data["EventStep"].append(
+                    (
+                        _uuid(rng),
+                        event_id,
+                        order,
+                        _text(rng, 1),
+                        speaker,
+                        rng.choice(npc_ids) if speaker == "NPC" else None,
+                    )
+                )
+            data["EventTrigger"].append((_uuid(rng), event_id, "enter", '{"area": 1}'))
+            data["EventEffect"].append(
+                (_uuid(rng), event_id, "reward", '{"gold": 10}', 1)
+            )
+
+        for npc_id in npc_ids:
+            for player_id in players:
+                data["SummaryMemory"].append(
+                    (_uuid(rng), universe_id, npc_id, player_id, _text(rng, 2))
+                )
+                for _ in range(args.memories):
+                    data["ImportantMemory"].append(
+                        (_uuid(rng), universe_id, npc_id, player_id, _text(rng, 1))
+                    )
+                for _ in range(args.past_sessions):
+                    data["ConversationSession"].append(
+                        (
+                            _uuid(rng),
+                            universe_id,
+                            player_id,
+                            npc_id,
+                            _text(rng, 2),
+                            "ended",
+                        )
+                    )
+    return data
+
+
+# 테이블별 COPY 컬럼 (build_dataset 튜플 순서와 같음)
+COLUMNS = {
+    "Universe": ("id", "name"),
+    "UniverseSetting": ("id", "universeId", "description", "lore", "rules"),
+    "Npc": ("id", "universeId", "name", "bio", "race", "gender", "species"),
+    "Event": ("id", "universeId", "name", "goalDescription", "goalTrigger"),
+    "EventStep": ("id", "eventId", "order", "message", "speakerType", "speakerId"),
+    "EventTrigger": ("id", "eventId", "type", "config"),
+    "EventEffect": ("id", "eventId", "type", "config", "order"),
+    "ImportantMemory": ("id", "universeId", "npcId", "playerId", "content"),
+    "SummaryMemory": ("id", "universeId", "npcId", "playerId", "content"),
+    "ConversationSession": (
+        "id",
+        "universeId",
+        "playerId",
+        "npcId",
+        "longMemory",
+        "status",
+    ),
+}
+
+
+async def apply_schema(conn):
+    await conn.execute(SCHEMA_FILE.read_text())
+    for migration in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        print(f"마이그레이션 적용: {migration.name}")
+        await conn.execute(migration.read_text())
+
+
+async def seed(args):
+    conn = await asyncpg.connect(args.database_url)
+    try:
+        await apply_schema(conn)
+        if args.reset:
+            tables = ", ".join(f'"{table}"' for table in DATA_TABLES)
+            await conn.execute(f"TRUNCATE {tables} CASCADE")
+
+        data = build_dataset(args)
+        async with conn.transaction():
+            for table, records in data.items():
+                await conn.copy_records_to_table(
+                    table, records=records, columns=COLUMNS[table]
+                )
+                print(f"{table}: {len(records)}건")
+        await conn.execute("ANALYZE")
+    finally:
+        await conn.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="벤치마크용 합성 데이터 생성")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--reset", action="store_true", help="기존 데이터 삭제 후 생성")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--universes", type=int, default=3)
+    parser.add_argument("--npcs", type=int, default=10, help="세계관당 NPC 수")
+    parser.add_argument("--events", type=int, default=3, help="세계관당 이벤트 수")
+    parser.add_argument("--event-steps", type=int, default=4)
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument(
+        "--memories", type=int, default=5, help="NPC-플레이어 쌍당 중요 기억 수"
+    )
+    parser.add_argument(
+        "--past-sessions", type=int, default=2, help="NPC-플레이어 쌍당 종료된 세션 수"
+    )
+    parser.add_argument(
+        "--lore-sentences", type=int, default=20, help="세계관 설정 길이 (문장 수)"
+    )
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("DATABASE_URL 또는 --database-url이 필요합니다.")
+    return args
+
+
+if __name__ == "__main__":
+    asyncio.run(seed(parse_args()))
@@ -0,0 +1,20 @@
+-- 세션 종료 후 기억 정리 등 비동기 작업 큐 (SELECT ... FOR UPDATE SKIP LOCKED로 소비)
+CREATE TABLE IF NOT EXISTS "BackgroundJob" (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    "sessionId" TEXT,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'queued', -- queued | running | done | failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    "maxAttempts" INTEGER NOT NULL DEFAULT 3,
+    "lastError" TEXT,
+    "runAfter" TIMESTAMP(3) NOT NULL DEFAULT NOW(),
+    "lockedAt" TIMESTAMP(3),
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT NOW(),
+    "updatedAt" TIMESTAMP(3) NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS "BackgroundJob_status_runAfter_idx"
+    ON "BackgroundJob" (status, "runAfter");
+CREATE INDEX IF NOT EXISTS "BackgroundJob_sessionId_idx"
+    ON "BackgroundJob" ("sessionId");
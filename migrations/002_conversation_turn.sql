@@ -0,0 +1,38 @@
+-- 대화 기록을 메시지 단위로 추가만 하는 테이블 (shortMemory JSON 통째 갱신 대체)
+CREATE TABLE IF NOT EXISTS "ConversationTurn" (
+    id BIGSERIAL PRIMARY KEY,
+    "sessionId" TEXT NOT NULL REFERENCES "ConversationSession"(id) ON DELETE CASCADE,
+    role TEXT NOT NULL, -- user | assistant
+    content TEXT NOT NULL,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT NOW()
+);
+
+-- 세션별 최근 N개 조회 (ORDER BY id DESC LIMIT N)
+CREATE INDEX IF NOT EXISTS "ConversationTurn_sessionId_id_idx"
+    ON "ConversationTurn" ("sessionId", id);
+
+-- shortMemory를 JSON으로 변환하되, JSON이 아닌 값은 마이그레이션을 중단하지 않고 NULL로 (해당 세션은 건너뜀)
+CREATE OR REPLACE FUNCTION pg_temp.try_jsonb(value TEXT) RETURNS JSONB AS $$
+BEGIN
+    RETURN value::jsonb;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- 기존 세션의 shortMemory를 옮겨 담는다 (이미 옮긴 세션, 배열이 아닌 값, role/content가 없는 항목은 건너뜀)
+INSERT INTO "ConversationTurn" ("sessionId", role, content)
+SELECT cs.id, m.message->>'role', m.message->>'content'
+FROM (
+    SELECT id, pg_temp.try_jsonb("shortMemory"::text) AS memory
+    FROM "ConversationSession"
+) cs
+CROSS JOIN LATERAL jsonb_array_elements(
+    CASE WHEN jsonb_typeof(cs.memory) = 'array' THEN cs.memory ELSE '[]'::jsonb END
+) WITH ORDINALITY AS m(message, ord)
+WHERE m.message->>'role' IS NOT NULL
+AND m.message->>'content' IS NOT NULL
+AND NOT EXISTS (
+    SELECT 1 FROM "ConversationTurn" t WHERE t."sessionId" = cs.id
+)
+ORDER BY cs.id, m.ord;
@@ -0,0 +1,8 @@
+-- 다중 NPC 세션의 "지금까지의 장면" 요약 (오래된 대화 기록을 접어 넣은 결과)
+CREATE TABLE IF NOT EXISTS "ConversationSceneSummary" (
+    "sessionId" TEXT PRIMARY KEY REFERENCES "ConversationSession"(id) ON DELETE CASCADE,
+    content TEXT NOT NULL,
+    -- 이 id까지의 ConversationTurn이 요약에 포함됨 (이후 기록만 프롬프트에 그대로 들어감)
+    "coveredTurnId" BIGINT NOT NULL,
+    "updatedAt" TIMESTAMP(3) NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,21 @@
+-- NPC/세계관 설정이 바뀌면 universeId를 알려 API 서버의 캐시를 비운다 (LISTEN cache_invalidate)
+CREATE OR REPLACE FUNCTION notify_cache_invalidate() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('cache_invalidate', COALESCE(OLD."universeId", ''));
+    ELSE
+        PERFORM pg_notify('cache_invalidate', COALESCE(NEW."universeId", ''));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "Npc_cache_invalidate" ON "Npc";
+CREATE TRIGGER "Npc_cache_invalidate"
+    AFTER INSERT OR UPDATE OR DELETE ON "Npc"
+    FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidate();
+
+DROP TRIGGER IF EXISTS "UniverseSetting_cache_invalidate" ON "UniverseSetting";
+CREATE TRIGGER "UniverseSetting_cache_invalidate"
+    AFTER INSERT OR UPDATE OR DELETE ON "UniverseSetting"
+    FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidate();
@@ -0,0 +1,39 @@
+-- 이벤트 정의가 바뀌면 "event:<eventId>"를 알려 API 서버의 이벤트 캐시를 비운다 (LISTEN cache_invalidate)
+CREATE OR REPLACE FUNCTION notify_event_cache_invalidate() RETURNS trigger AS $$
+DECLARE
+    changed RECORD;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        changed := OLD;
+    ELSE
+        changed := NEW;
+    END IF;
+
+    IF TG_TABLE_NAME = 'Event' THEN
+        PERFORM pg_notify('cache_invalidate', 'event:' || changed.id);
+    ELSE
+        PERFORM pg_notify('cache_invalidate', 'event:' || changed."eventId");
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "Event_cache_invalidate" ON "Event";
+CREATE TRIGGER "Event_cache_invalidate"
+    AFTER UPDATE OR DELETE ON "Event"
+    FOR EACH ROW EXECUTE FUNCTION notify_event_cache_invalidate();
+
+DROP TRIGGER IF EXISTS "EventTrigger_cache_invalidate" ON "EventTrigger";
+CREATE TRIGGER "EventTrigger_cache_invalidate"
+    AFTER INSERT OR UPDATE OR DELETE ON "EventTrigger"
+    FOR EACH ROW EXECUTE FUNCTION notify_event_cache_invalidate();
+
+DROP TRIGGER IF EXISTS "EventEffect_cache_invalidate" ON "EventEffect";
+CREATE TRIGGER "EventEffect_cache_invalidate"
+    AFTER INSERT OR UPDATE OR DELETE ON "EventEffect"
+    FOR EACH ROW EXECUTE FUNCTION notify_event_cache_invalidate();
+
+DROP TRIGGER IF EXISTS "EventStep_cache_invalidate" ON "EventStep";
+CREATE TRIGGER "EventStep_cache_invalidate"
+    AFTER INSERT OR UPDATE OR DELETE ON "EventStep"
+    FOR EACH ROW EXECUTE FUNCTION notify_event_cache_invalidate();
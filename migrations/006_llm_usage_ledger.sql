@@ -0,0 +1,28 @@
+-- LLM 호출별 토큰 사용량/비용 원장 (세션/NPC/세계관/호출 유형별 집계용, 추가만 함)
+CREATE TABLE IF NOT EXISTS "LlmUsageLedger" (
+    id BIGSERIAL PRIMARY KEY,
+    "sessionId" TEXT,
+    "universeId" TEXT,
+    -- 다중 NPC 대화처럼 한 호출이 여러 NPC를 다루면 NULL
+    "npcId" TEXT,
+    "callType" TEXT NOT NULL, -- dialogue | long_memory | important_memory | scene_summary | summary_memory
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    -- 1이면 첫 호출, 2 이상이면 잘린 응답 이어쓰기
+    round INTEGER NOT NULL DEFAULT 1,
+    -- 입력 토큰은 캐시 적중/생성분을 포함한 전체
+    "inputTokens" INTEGER NOT NULL DEFAULT 0,
+    "cachedInputTokens" INTEGER NOT NULL DEFAULT 0,
+    "cacheCreationInputTokens" INTEGER NOT NULL DEFAULT 0,
+    "outputTokens" INTEGER NOT NULL DEFAULT 0,
+    -- 기록 시점 단가로 계산한 비용. 단가를 모르는 모델이면 NULL
+    "costUsd" NUMERIC(12, 6),
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS "LlmUsageLedger_createdAt_idx"
+    ON "LlmUsageLedger" ("createdAt");
+CREATE INDEX IF NOT EXISTS "LlmUsageLedger_universeId_createdAt_idx"
+    ON "LlmUsageLedger" ("universeId", "createdAt");
+CREATE INDEX IF NOT EXISTS "LlmUsageLedger_sessionId_idx"
+    ON "LlmUsageLedger" ("sessionId");